@@ -2,205 +2,83 @@ import os
 import json
 import logging
 import secrets
-from threading import Thread
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify
-from apscheduler.schedulers.background import BackgroundScheduler
-
-from movie_processor import process_movies
-from metadata_fetcher import check_tmdb_connection
-from filename_parser import parse_filename
-
-
-CONFIG_FILE = "configs/config.json"
-
-# 创建日志目录
-LOG_DIR = "logs"
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
-
-# 生成日志文件名（包含时间戳）
-current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_filename = os.path.join(LOG_DIR, f"media_tools_{current_time}.log")
+import tempfile
+import time
+from flask import Flask, render_template, request, jsonify, Response, send_file, stream_with_context
+
+import cache_bundle
+import image_cache
+import ingest
+import shared_cache
+
+from artwork import ARTWORK_PRESETS, ARTWORK_TYPES
+from config_store import load_config, save_config
+from file_linker import LINK_MODES
+from fingerprint_index import DUPLICATE_MODES, get_fingerprint_index
+from job_registry import ERROR_BUFFER_SIZE
+from job_store import get_job_store
+from job_runner import build_trigger, check_tmdb_connectivity, schedule_spec, spawn_runner, stop_runner, TMDBError, TMDBConnectionError, TMDBApiKeyMissingError
+from log_setup import init_logging
+from metadata_store import get_store
+from settings import load_settings
+from stats_index import get_stats_index
+import metrics
+import tracing
+
+
+# Web 进程只负责入队与读取进度：定时调度和任务执行都在独立的后台执行进程（job_runner.py）中，
+# 多个 gunicorn 工作进程之间通过 configs/jobs.db 共享任务状态
+init_logging() # Web 进程只输出到控制台，日志文件由后台执行进程写入
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY") or secrets.token_hex(16)
 
-# 日志初始化
-logging.basicConfig(level=logging.DEBUG,
-                   format='%(asctime)s - %(levelname)s - %(message)s',
-                   handlers=[
-                       logging.StreamHandler(),
-                       logging.FileHandler(log_filename, encoding="utf-8")
-                   ])
 logger = logging.getLogger("movie_manager")
 
-# 全局进度状态
-progress = {
-    "total": 0,
-    "processed": 0,
-    "success": 0,
-    "failed": 0,
-    "completed": False,
-    "errors": [],
-    "log_path": log_filename  # 使用新的日志文件路径
-}
-
-# 加载/保存配置
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                configs = json.load(f)
-                if isinstance(configs, list):
-                    return configs
-        except Exception as e:
-            logger.error(f"加载配置出错：{e}")
-    return []
-
-def save_config(configs):
-    try:
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(configs, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"保存配置出错：{e}")
+job_store = get_job_store()
 
-# APScheduler
-scheduler = BackgroundScheduler()
-scheduler.start()
 
-# --- 新增的辅助函数 ---
-# --- 修改后的辅助函数 ---
-def _check_tmdb_connectivity(configs, task_type="任务"):
-    """
-    检查 TMDB 连接性。
-    遍历配置找到第一个 API Key 并检查连接。
-    成功则正常返回，失败则抛出相应的 TMDBError 异常。
-    """
-    first_api_key = None
-    for cfg in configs:
-        if cfg.get("tmdb_api_key"):
-            first_api_key = cfg["tmdb_api_key"]
-            break
-
-    if first_api_key:
-        logger.info(f"{task_type}：检查 TMDB 连接...")
-        if not check_tmdb_connection(first_api_key):
-            error_msg = f"{task_type}：无法连接到 TMDB，任务已终止。你可以配置hosts或代理以解决问题。"
-            logger.error(error_msg)
-            raise TMDBConnectionError(error_msg) # <--- 抛出连接错误异常
-        else:
-            logger.info(f"{task_type}：TMDB 连接检查通过。")
-            # 成功，不返回任何值 (隐式返回 None)
-    else:
-        error_msg = f"{task_type}：未配置 TMDB API Key，任务终止。"
-        logger.error(error_msg)
-        raise TMDBApiKeyMissingError(error_msg) # <--- 抛出 Key 缺失异常
+def _runner_log_path():
+    status = job_store.runner_status()
+    return status["log_path"] if status else None
 
 
-def run_scheduled_task():
-    """后台定时执行的任务，处理所有配置"""
-    logger.info("定时任务开始执行...")
-    configs = [cfg for cfg in load_config() if cfg.get("enabled", True)]
-    if not configs:
-        logger.info("没有找到配置，定时任务跳过。")
-        return
+def _job_view(job, include_errors=True):
+    data = job.to_dict(include_errors=include_errors)
+    data["log_path"] = data["log_path"] or _runner_log_path()
+    return data
 
-    try:
-        # --- 使用辅助函数检查 TMDB 连接 ---
-        _check_tmdb_connectivity(configs, task_type="定时任务")
-        # --- 检查通过，继续执行 ---
-    except TMDBError as e: # 捕获所有 TMDB 相关的错误
-        # 日志已在 _check_tmdb_connectivity 中记录
-        logger.warning(f"定时任务因 TMDB 检查失败而终止: {e}")
-        return # 终止任务
-
-    # --- 检查结束 ---
-
-    # 遍历所有配置并执行处理 (没有进度回调)
-    for config_item in configs:
-        config_name = config_item.get('name', '未命名配置')
-        logger.info(f"开始处理配置: {config_name}")
-        try:
-            # 注意：定时任务目前不传递进度回调
-            process_movies(config_item) # 传递单个配置项
-            logger.info(f"配置 '{config_name}' 处理完成。")
-        except Exception as e:
-            logger.error(f"处理配置 '{config_name}' 时出错: {e}", exc_info=True)
-
-    logger.info("定时任务执行完毕。")
-
-
-def start_scheduler(interval_minutes=0):
-    """启动或更新调度器"""
-    global scheduler
-    # 移除旧任务
-    if scheduler.get_jobs():
-        scheduler.remove_all_jobs()
-        logger.info("旧的定时任务已移除。")
-
-    # 如果设置了有效间隔，则添加新任务
-    # 注意：这里的 interval_minutes 决定了任务运行的频率，
-    # 但任务本身会处理所有配置。通常使用第一个配置的间隔，
-    # 或者提供一个全局的调度间隔设置。
-    if interval_minutes > 0:
-        # Ensure it calls run_scheduled_task
-        scheduler.add_job(run_scheduled_task, 'interval', minutes=interval_minutes, id='movie_scan_job', replace_existing=True)
-        logger.info(f"定时任务已启动，每 {interval_minutes} 分钟执行一次。")
-        # 立即运行一次（可选）
-        # run_scheduled_task()
-    else:
-        logger.info("未设置有效的执行间隔，定时任务未启动。")
-
-# wrapper，将进度回调传给 process_movies
-def run_process_wrapper(cfg):
-    def progress_cb(event, value, success=True, error_info=None):
-        if event == "initialize":
-            progress["total"] = value
-            progress["processed"] = 0
-            progress["success"] = 0
-            progress["failed"] = 0
-            progress["completed"] = False
-            progress["errors"] = []  # 清空错误列表
-        elif event == "update":
-            progress["processed"] += 1
-            if success:
-                progress["success"] += 1
-            else:
-                progress["failed"] += 1
-                if error_info:
-                    progress["errors"].append(error_info)
-        elif event == "complete":
-            progress["completed"] = True
 
-    try:
-        process_movies(cfg, progress_callback=progress_cb)
-    except Exception as e:
-        error_msg = f"处理电影时出错：{str(e)}"
-        logger.error(error_msg)
-        progress["completed"] = True
-        progress["errors"].append({
-            "file": "全局错误",
-            "message": error_msg
-        })
-
-    # try:
-    #     process_movies(cfg, progress_callback=progress_cb)
-    # except Exception as e:
-    #     logger.error(f"处理电影时出错：{e}")
-
-# --- 自定义异常 ---
-class TMDBError(Exception):
-    """Base exception for TMDB related errors."""
-    pass
-
-class TMDBConnectionError(TMDBError):
-    """Raised when connection to TMDB fails."""
-    pass
-
-class TMDBApiKeyMissingError(TMDBError):
-    """Raised when TMDB API Key is missing in config."""
-    pass
+def _run_options():
+    """
+    单次运行的诊断选项：请求体 JSON 或查询参数中的 trace / profile，返回写入任务 payload 的选项字典。
+    """
+    data = request.get_json(silent=True) or {}
+    opts = {}
+    for key in ("trace", "profile"):
+        value = data.get(key, request.args.get(key))
+        if value in (True, 1, "1", "true", "yes"):
+            opts[key] = True
+    return opts
+
+
+def _diagnostic_paths(job_id, opts):
+    paths = {}
+    if opts.get("trace"):
+        paths["trace_path"] = tracing.trace_path(job_id)
+    if opts.get("profile"):
+        paths["profile_path"] = tracing.profile_path(job_id)
+    return paths
+
+
+def _enqueue(name, kind, payload=None):
+    """入队并返回 (job_id, 附加提示)；执行进程没有心跳时提醒用户任务暂时不会执行。"""
+    job_id = job_store.enqueue(name, kind, payload)
+    status = job_store.runner_status()
+    if not status or not status["alive"]:
+        logger.warning("后台执行进程未运行，任务将在其启动后执行")
+        return job_id, "（后台执行进程未运行，任务将在其启动后执行）"
+    return job_id, ""
 
 @app.route("/", methods=["GET"])
 def config_page():
@@ -220,20 +98,42 @@ def save_config_route():
         "paths": data["paths"],
         "rename_rule": data.get("rename_rule", ""), # 允许空规则
         "schedule_interval": data.get("schedule_interval", 0),
+        "schedule_cron": (data.get("schedule_cron") or "").strip(), # 填写后优先于 schedule_interval
+        "schedule_jitter": data.get("schedule_jitter", 60), # 随机启动延迟上限（秒）
         "max_threads": data.get("max_threads", 4), # 可以考虑添加线程数配置
+        "adaptive_threads": data.get("adaptive_threads", False), # 按单文件耗时、TMDB 错误率、磁盘延迟自动调整并发
+        "min_threads": data.get("min_threads", 1), # 自适应并发的下限
+        "adaptive_max_threads": data.get("adaptive_max_threads", 16), # 自适应并发的上限
+        "cpu_workers": data.get("cpu_workers", 0), # NFO 渲染/文件名解析进程数，0 表示不启用进程池
+        "link_mode": data.get("link_mode", "hardlink"), # 媒体文件放置方式：hardlink / reflink / copy，不可用时依次降级
+        "duplicates": data.get("duplicates", "skip"), # 与已处理文件内容相同的源文件：skip 跳过 / report 仅记录 / off 不检查
         "scrape_metadata": data.get('scrape_metadata', True),
-        "rename_file": data.get('rename_file', True)
+        "rename_file": data.get('rename_file', True),
+        "probe_streams": data.get("probe_streams", True), # NFO 中写入 <fileinfo><streamdetails>
+        "artwork_types": data.get("artwork_types", list(ARTWORK_TYPES)), # 下载的图片类型：poster / fanart / clearlogo / thumb
+        "artwork_size": data.get("artwork_size", "default"), # 图片尺寸预设，见 artwork.ARTWORK_PRESETS
+        "artwork_bandwidth": data.get("artwork_bandwidth", 0) # 每次运行图片下载的带宽上限（KB/s），0 表示不限
     }
+    if entry["link_mode"] not in LINK_MODES:
+        return jsonify({"message": f"未知的文件放置方式：{entry['link_mode']}"}), 400
+    if entry["duplicates"] not in DUPLICATE_MODES:
+        return jsonify({"message": f"未知的重复文件处理方式：{entry['duplicates']}"}), 400
+    if entry["artwork_size"] not in ARTWORK_PRESETS:
+        return jsonify({"message": f"未知的图片尺寸预设：{entry['artwork_size']}"}), 400
+    unknown = [t for t in entry["artwork_types"] if t not in ARTWORK_TYPES]
+    if unknown:
+        return jsonify({"message": f"未知的图片类型：{', '.join(unknown)}"}), 400
+    try:
+        spec = schedule_spec(entry)
+        if spec:
+            build_trigger(spec)
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"定时设置无效：{e}"}), 400
     if existing:
         existing.update(entry)
     else:
         configs.append(entry)
-    save_config(configs)
-    # 重新启动定时器 (如果需要基于第一个配置的间隔)
-    if configs:
-        start_scheduler(configs[0].get("schedule_interval", 0))
-    else:
-         scheduler.remove_all_jobs() # 没有配置则停止定时器
+    save_config(configs) # 执行进程检测到 config.json 变化后会自动更新定时任务
     return jsonify({"message": "配置保存成功！"})
 
 @app.route("/delete_config/<name>", methods=["DELETE"])
@@ -243,11 +143,6 @@ def delete_config_route(name):
     if len(new_configs) == len(configs):
         return jsonify({"message": "配置未找到"}), 404
     save_config(new_configs)
-    # 如果删除的是第一个配置，需要重启定时器
-    if new_configs:
-        start_scheduler(new_configs[0].get("schedule_interval", 0))
-    else:
-        scheduler.remove_all_jobs()
     return jsonify({"message": "删除成功"})
 
 @app.route("/get_config/<name>", methods=["GET"])
@@ -258,106 +153,9 @@ def get_config_route(name):
         return jsonify({"message": "配置未找到"}), 404
     return jsonify(cfg)
 
-# wrapper for single config processing with progress (used by the new multi-config wrapper)
-def run_single_config_wrapper(cfg, progress_callback):
-    config_name = cfg.get('name', '未命名配置')
-    logger.info(f"开始处理单个配置: {config_name}")
-    try:
-        process_movies(cfg, progress_callback=progress_callback)
-        logger.info(f"单个配置 '{config_name}' 处理完成。")
-    except Exception as e:
-        error_msg = f"处理配置 '{config_name}' 时出错：{str(e)}"
-        logger.error(error_msg, exc_info=True)
-        # Notify progress callback about the error if possible
-        if progress_callback:
-             try:
-                 # Attempt to report a generic error for this config run
-                 progress_callback("update", None, success=False, error_info={"file": f"配置 {config_name} 出错", "message": error_msg})
-                 progress_callback("complete", None) # Mark as complete even on error
-             except Exception as cb_e:
-                 logger.error(f"调用进度回调时出错: {cb_e}")
-
-
-def estimate_file_count(cfg):
-    """预估某个配置下要处理的文件总数"""
-    count = 0
-    suffixes = [s.strip() for s in cfg.get("file_suffixes", "").split(",") if s.strip()]
-    for path in cfg.get("paths", []):
-        src = path.get("source")
-        if not src or not os.path.exists(src):
-            continue
-        for root, _, files in os.walk(src):
-            for file in files:
-                if any(file.endswith(suffix) for suffix in suffixes):
-                    count += 1
-    return count
-
-# New wrapper to run all configs sequentially with combined progress
-def run_all_configs_sequentially_wrapper():
-    """按顺序处理所有配置，并在全局 progress 对象中报告累积进度"""
-    global progress
-    configs = [cfg for cfg in load_config() if cfg.get("enabled", True)]
-    if not configs:
-        logger.info("没有启用的配置，任务跳过。")
-        progress.update({
-            "total": 0, "processed": 0, "success": 0, "failed": 0,
-            "completed": True, "errors": []
-        })
-        return
-
-
-    # 初始化
-    progress["completed"] = False
-    progress["total"] = 0
-    progress["processed"] = 0
-    progress["success"] = 0
-    progress["failed"] = 0
-    progress["errors"] = []
-
-    # 第一阶段：预估所有配置总任务数
-    for cfg in configs:
-        try:
-            count = estimate_file_count(cfg)
-            progress["total"] += count
-        except Exception as e:
-            logger.warning(f"预估配置 '{cfg.get('name', '未命名')}' 文件数失败：{e}")
-
-    # 第二阶段：正式执行处理
-    def create_progress_callback(config_index):
-        """返回某配置的 progress 回调函数"""
-        def progress_cb(event, value, success=True, error_info=None):
-            if event == "initialize":
-                pass  # 已预估，无需再增加 total
-            elif event == "update":
-                progress["processed"] += 1
-                if success:
-                    progress["success"] += 1
-                else:
-                    progress["failed"] += 1
-                    if error_info:
-                        error_info["config_name"] = configs[config_index].get('name', f'配置 {config_index+1}')
-                        progress["errors"].append(error_info)
-        return progress_cb
-
-    for i, cfg in enumerate(configs):
-        config_name = cfg.get("name", f"配置 {i+1}")
-        logger.info(f"开始顺序处理配置 {i+1}/{len(configs)}: {config_name}")
-        cb = create_progress_callback(i)
-        try:
-            process_movies(cfg, progress_callback=cb)
-            logger.info(f"配置 '{config_name}' 处理完成。")
-        except Exception as e:
-            logger.error(f"配置 '{config_name}' 执行异常: {e}", exc_info=True)
-            cb("update", None, success=False, error_info={"file": "全局错误", "message": str(e)})
-
-    progress["completed"] = True
-    logger.info("所有配置处理完毕。")
-
-
 @app.route("/run_task", methods=["POST"])
 def run_task():
     """手动触发任务，顺序处理所有启用的配置"""
-    global progress
     configs = load_config()
     if not configs:
         return jsonify({"message": "没有可用的配置"}), 400
@@ -375,33 +173,132 @@ def run_task():
 
     if need_tmdb_check:
         try:
-            _check_tmdb_connectivity(enabled_configs, task_type="手动任务")
+            check_tmdb_connectivity(enabled_configs, task_type="手动任务")
         except (TMDBConnectionError, TMDBApiKeyMissingError) as e:
             return jsonify({"message": str(e)}), 503
         except TMDBError as e:
             logger.error(f"TMDB 检查时发生未知错误: {e}", exc_info=True)
             return jsonify({"message": f"TMDB 检查时发生未知错误: {e}"}), 500
 
-    # 初始化进度对象
-    progress.update({
-        "total": 0,
-        "processed": 0,
-        "success": 0,
-        "failed": 0,
-        "completed": False,
-        "errors": []
-    })
-
-    # 启动任务线程
-    thread = Thread(target=run_all_configs_sequentially_wrapper)
-    thread.start()
-    return jsonify({"message": "任务已启动，将按顺序处理所有配置。"}), 202
+    # 交给后台执行进程
+    opts = _run_options()
+    job_id, note = _enqueue("全部配置", "run_all", opts)
+    return jsonify({"message": f"任务已启动，将按顺序处理所有配置。{note}", "job_id": job_id,
+                    **_diagnostic_paths(job_id, opts)}), 202
 
 
 @app.route("/progress", methods=["GET"])
 def get_progress():
-    # 使用全局变量中的日志路径
-    return jsonify(progress)
+    """旧的轮询接口：返回指定任务（?job=）或最近一个任务的完整进度"""
+    job_id = request.args.get("job", "")
+    job = (job_store.load(job_id, include_errors=True) if job_id else None) or job_store.latest(include_errors=True)
+    if not job:
+        return jsonify({"total": 0, "processed": 0, "success": 0, "failed": 0, "completed": False,
+                        "errors": [], "write_stats": {"written": 0, "skipped": 0, "bytes_saved": 0}, "log_path": _runner_log_path()})
+    return jsonify(_job_view(job))
+
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    """列出所有任务（不含错误详情），最新的在前"""
+    return jsonify([_job_view(job, include_errors=False) for job in job_store.list()])
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_store.load(job_id, include_errors=True)
+    if not job:
+        return jsonify({"message": "任务未找到"}), 404
+    view = _job_view(job)
+    result = job_store.result(job_id)
+    if result: # 立即处理（ingest）任务的结果报告
+        view["result"] = result
+    return jsonify(view)
+
+
+@app.route("/jobs/<job_id>/errors", methods=["GET"])
+def get_job_errors(job_id):
+    """
+    分页查询任务的错误明细（新的在前）：?limit=&offset=，可按 category（分类）、config（配置名）筛选，
+    q 在文件路径和错误信息中查找。同时返回错误总数与各分类的条数。
+    """
+    job = job_store.load(job_id)
+    if not job:
+        return jsonify({"message": "任务未找到"}), 404
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"message": "limit / offset 必须是整数"}), 400
+    page = job_store.errors(job_id, limit, offset, category=request.args.get("category") or None,
+                            config_name=request.args.get("config") or None, query=request.args.get("q") or None)
+    return jsonify(dict(page, error_count=job.error_count, categories=job.error_categories,
+                        limit=limit, offset=offset))
+
+
+# SSE 推送参数：合并窗口、心跳间隔、单个连接最长保持时间（到期后浏览器会自动重连）
+SSE_COALESCE_SECONDS = 0.5
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 300
+SSE_MAX_ERRORS_PER_EVENT = 200
+
+
+def _sse(event, data, event_id=None):
+    msg = f"event: {event}\n"
+    if event_id is not None:
+        msg += f"id: {event_id}\n"
+    return msg + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/progress/stream", methods=["GET"])
+def progress_stream():
+    """
+    以 Server-Sent Events 推送任务进度（?job=<id>，缺省为最近一个任务）：
+    只发送变化的字段（progress 事件）和新增的错误（errors 事件）。
+    每个合并窗口内的多次更新合并成一次推送，事件 id 为下一条错误的序号，断线重连时据此续传；
+    积压的错误超过 ERROR_BUFFER_SIZE 条时只推送最近的这些，完整明细见 /jobs/<id>/errors。
+    """
+    job_id = request.args.get("job", "")
+    job = (job_store.load(job_id) if job_id else None) or job_store.latest()
+    if not job:
+        return jsonify({"message": "没有任务"}), 404
+    job_id = job.id
+    try:
+        sent_errors = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        sent_errors = 0
+
+    def generate():
+        nonlocal sent_errors
+        yield "retry: 2000\n\n"
+        last = {}
+        last_version = -1
+        started = last_sent = time.time()
+        while time.time() - started < SSE_MAX_STREAM_SECONDS:
+            job = job_store.load(job_id)
+            if job and job.version != last_version:
+                last_version = job.version
+                snapshot = _job_view(job, include_errors=False)
+                delta = {k: v for k, v in snapshot.items() if last.get(k) != v}
+                if delta:
+                    yield _sse("progress", delta)
+                    last = snapshot
+                    last_sent = time.time()
+                errors = job_store.errors_since(job_id, max(sent_errors, job.error_count - ERROR_BUFFER_SIZE))
+                for i in range(0, len(errors), SSE_MAX_ERRORS_PER_EVENT):
+                    batch = errors[i:i + SSE_MAX_ERRORS_PER_EVENT]
+                    sent_errors = batch[-1]["seq"] + 1
+                    yield _sse("errors", batch, event_id=sent_errors)
+                    last_sent = time.time()
+                if snapshot["completed"]:
+                    return
+            if time.time() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                yield ": ping\n\n"
+                last_sent = time.time()
+            time.sleep(SSE_COALESCE_SECONDS)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/toggle_config/<name>", methods=["POST"])
 def toggle_config_enabled(name):
@@ -418,7 +315,6 @@ def toggle_config_enabled(name):
 @app.route("/run_config/<name>", methods=["POST"])
 def run_single_config(name):
     """执行指定配置"""
-    global progress
     all_configs = load_config()
     cfg = next((c for c in all_configs if c.get("name") == name and c.get("enabled", True)), None)
     if not cfg:
@@ -426,94 +322,219 @@ def run_single_config(name):
 
     if cfg.get("scrape_metadata", True) or cfg.get("rename_file", True):
         try:
-            _check_tmdb_connectivity([cfg], task_type=f"配置 {name}")
+            check_tmdb_connectivity([cfg], task_type=f"配置 {name}")
         except TMDBError as e:
             return jsonify({"message": str(e)}), 503
 
-    # 初始化进度
-    progress.update({
-        "total": 0,
-        "processed": 0,
-        "success": 0,
-        "failed": 0,
-        "completed": False,
-        "errors": []
-    })
-
-    # 定义回调函数
-    def progress_callback(stage, amount, success=None, error=None):
-        if stage == "initialize":
-            progress["total"] = amount
-        elif stage == "update":
-            progress["processed"] += amount
-            if success:
-                progress["success"] += 1
-            else:
-                progress["failed"] += 1
-                if error:
-                    progress["errors"].append(error)
-        elif stage == "complete":
-            progress["completed"] = True
-
-    def run_one():
-        logger.info(f"开始执行配置：{name}")
-        try:
-            process_movies(cfg, progress_callback=progress_callback)
-        except Exception as e:
-            logger.error(f"执行配置 {name} 时发生错误：{e}", exc_info=True)
-            progress["completed"] = True
-        logger.info(f"配置 {name} 执行完成")
+    opts = _run_options()
+    job_id, note = _enqueue(f"配置 {name}", "run_config", dict(opts, config=name))
+    return jsonify({"message": f"配置 {name} 已启动{note}", "job_id": job_id, **_diagnostic_paths(job_id, opts)}), 202
+
+
+# 等待 ingest 任务完成时查询任务状态的间隔（秒）
+INGEST_POLL_SECONDS = 0.2
+
+
+@app.route("/ingest", methods=["POST"])
+def ingest_route():
+    """
+    下载工具完成回调：立即处理请求中的源路径（{"paths": [...]}，可带 "wait" 秒数），不遍历整个源目录。
+    需要请求头 X-Ingest-Token 与全局设置 ingest.token 一致。处理完成后返回生成的文件与各阶段耗时，
+    超过等待时间仍未完成时返回 202 和任务 ID。
+    """
+    settings = load_settings()["ingest"]
+    token = settings.get("token")
+    if not token:
+        return jsonify({"message": "未设置 ingest.token，立即处理接口未启用"}), 403
+    if not secrets.compare_digest(request.headers.get(ingest.TOKEN_HEADER, ""), token):
+        return jsonify({"message": "ingest 令牌无效"}), 401
+
+    data = request.get_json(silent=True) or {}
+    paths = data.get("paths") or ([data["path"]] if data.get("path") else [])
+    if not isinstance(paths, list) or not paths or not all(isinstance(p, str) and p for p in paths):
+        return jsonify({"message": "paths 必须是非空的路径列表"}), 400
+    try:
+        wait = float(data.get("wait", settings.get("wait_seconds", 600)))
+    except (TypeError, ValueError):
+        return jsonify({"message": "wait 必须是数字"}), 400
 
-    Thread(target=run_one).start()
-    return jsonify({"message": f"配置 {name} 已启动"}), 202
+    items, unmatched = ingest.resolve(paths, load_config())
+    if not items:
+        return jsonify({"message": "没有可处理的文件", "unmatched": unmatched}), 404
+
+    job_id, note = _enqueue(f"立即处理 {len(items)} 个文件", "ingest", {"paths": paths})
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        job = job_store.load(job_id)
+        if job and job.completed:
+            report = job_store.result(job_id) or {"files": [], "unmatched": unmatched}
+            return jsonify(dict(report, job_id=job_id, status=job.status))
+        time.sleep(INGEST_POLL_SECONDS)
+    return jsonify({"message": f"处理尚未完成，可在 /jobs/{job_id} 查看进度{note}", "job_id": job_id}), 202
 
 
 @app.route("/stats", methods=["GET"])
 def media_stats():
-    stats = {
-        "movie": 0,
-        "tv_show": 0,
-        "unknown": 0,
-        "size": {
-            "movie": 0,
-            "tv_show": 0,
-            "unknown": 0
-        }
-    }
-
+    """媒体库统计，直接读取处理流程增量维护的统计索引，不再遍历目标路径"""
     try:
-        configs = load_config()
-        for cfg in configs:
-            paths = cfg.get("paths", [])
-            suffixes = [s.strip().lower() for s in cfg.get("file_suffixes", "").split(",") if s.strip()]
-            for mapping in paths:
-                target = mapping.get("target")
-                if not target or not os.path.exists(target):
-                    continue
-                for root, _, files in os.walk(target):
-                    for file in files:
-                        if not any(file.lower().endswith(s) for s in suffixes):
-                            continue
-                        try:
-                            file_path = os.path.join(root, file)
-                            info = parse_filename(file)
-                            media_type = info.get("type", "unknown")
-                            stats[media_type] = stats.get(media_type, 0) + 1
-                            stats["size"][media_type] += os.path.getsize(file_path)
-                        except Exception as e:
-                            print(f"统计目标路径时解析文件 {file} 出错：{e}")
-        return jsonify(stats)
+        return jsonify(get_stats_index().summary())
     except Exception as e:
-        print(f"[ERROR] 统计接口异常: {e}")
+        logger.error(f"统计接口异常: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
-cfgs = load_config()
-if cfgs:
-    initial_interval = cfgs[0].get("schedule_interval", 0)
-    start_scheduler(initial_interval)
+@app.route("/stats/reconcile", methods=["POST"])
+def reconcile_stats():
+    """后台全量扫描目标路径，校对统计索引（处理流程之外增删过文件时使用）"""
+    job_id, note = _enqueue("统计索引校对", "reconcile_stats")
+    return jsonify({"message": f"统计索引校对已启动{note}", "job_id": job_id}), 202
+
+
+@app.route("/duplicates", methods=["GET"])
+def list_duplicates():
+    """按内容指纹发现的重复源文件（?limit=&offset=，新的在前）"""
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"message": "limit / offset 必须是整数"}), 400
+    return jsonify(dict(get_fingerprint_index().duplicates(limit, offset), limit=limit, offset=offset))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    """
+    Prometheus 抓取接口：返回后台执行进程定期写出的指标，
+    并附加执行进程是否存活（心跳）——执行进程停止后其指标文件不再更新。
+    """
+    try:
+        with open(metrics.METRICS_FILE, "r", encoding="utf-8") as f:
+            body = f.read()
+    except FileNotFoundError:
+        body = ""
+    status = job_store.runner_status()
+    alive = 1 if status and status["alive"] else 0
+    age = time.time() - status["heartbeat"] if status and status["heartbeat"] else -1
+    body += (
+        "# HELP mediatool_runner_up 后台执行进程是否在运行（心跳未超时）\n"
+        "# TYPE mediatool_runner_up gauge\n"
+        f"mediatool_runner_up {alive}\n"
+        "# HELP mediatool_runner_heartbeat_age_seconds 距执行进程上次心跳的秒数，从未运行为 -1\n"
+        "# TYPE mediatool_runner_heartbeat_age_seconds gauge\n"
+        f"mediatool_runner_heartbeat_age_seconds {age:.1f}\n"
+    )
+    return Response(body, mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/cache", methods=["GET"])
+def cache_stats():
+    """本地元数据库各表条数与图片缓存占用"""
+    return jsonify({"metadata": get_store().counts(), "images": image_cache.usage()})
+
+
+@app.route("/cache/export", methods=["GET"])
+def cache_export():
+    """下载缓存包（zip），?images=0 时只包含元数据"""
+    include_images = request.args.get("images", "1").lower() not in ("0", "false", "no")
+    fd, path = tempfile.mkstemp(prefix="mediatool-cache-", suffix=".zip")
+    os.close(fd)
+    try:
+        cache_bundle.export_bundle(path, include_images=include_images)
+    except Exception as e:
+        os.remove(path)
+        logger.error(f"导出缓存包失败: {e}", exc_info=True)
+        return jsonify({"message": f"导出失败：{e}"}), 500
+    bundle = open(path, "rb")
+    os.remove(path) # 已打开的文件在发送完、关闭后才真正释放
+    return send_file(bundle, mimetype="application/zip", as_attachment=True,
+                     download_name=f"mediatool-cache-{time.strftime('%Y%m%d')}.zip")
+
+
+@app.route("/cache/import", methods=["POST"])
+def cache_import():
+    """导入缓存包：multipart 表单字段 bundle，或直接以请求体上传 zip；需要共享缓存令牌"""
+    denied = _shared_cache_denied(write=True)
+    if denied:
+        return denied
+    upload = request.files.get("bundle")
+    fd, path = tempfile.mkstemp(prefix="mediatool-cache-", suffix=".zip")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if upload:
+                upload.save(f)
+            else:
+                f.write(request.get_data())
+        result = cache_bundle.import_bundle(path)
+    except cache_bundle.BundleError as e:
+        return jsonify({"message": str(e)}), 400
+    finally:
+        os.remove(path)
+    return jsonify({"message": "缓存包导入成功", **result})
+
+
+# --- 共享缓存：供其他实例查询、回写（见 shared_cache.py） ---
+def _shared_cache_denied(write=False):
+    """
+    校验共享缓存令牌。未设置 cache.shared_token 时只读接口照常开放，
+    写入接口（回写、导入缓存包）一律拒绝，以免网络上任何人都能改写 metadata.db。
+    """
+    token = load_settings()["cache"].get("shared_token")
+    if write and not token:
+        return jsonify({"message": "未设置 cache.shared_token，不接受写入缓存"}), 403
+    if token and not secrets.compare_digest(request.headers.get(shared_cache.TOKEN_HEADER, ""), token):
+        return jsonify({"message": "共享缓存令牌无效"}), 403
+    return None
+
+
+@app.route("/cache/shared/search", methods=["GET"])
+def shared_cache_search():
+    denied = _shared_cache_denied()
+    if denied:
+        return denied
+    metadata = shared_cache.serve_metadata(request.args.get("media_type", "movie"), request.args.get("title", ""),
+                                           request.args.get("year", ""))
+    return jsonify(metadata) if metadata else (jsonify({"message": "未缓存"}), 404)
+
+
+@app.route("/cache/shared/episode/<int:tmdbid>/<season>/<episode>", methods=["GET"])
+def shared_cache_episode(tmdbid, season, episode):
+    denied = _shared_cache_denied()
+    if denied:
+        return denied
+    info = shared_cache.serve_episode(tmdbid, season, episode)
+    return jsonify(info) if info else (jsonify({"message": "未缓存"}), 404)
+
+
+@app.route("/cache/shared/image/<path:key>", methods=["GET"])
+def shared_cache_image(key):
+    denied = _shared_cache_denied()
+    if denied:
+        return denied
+    key = image_cache.safe_relpath(key)
+    path = image_cache.cache_path(key) if key else None
+    if not path or not os.path.isfile(path):
+        return jsonify({"message": "未缓存"}), 404
+    return send_file(os.path.abspath(path))
+
+
+@app.route("/cache/shared", methods=["POST"])
+def shared_cache_publish():
+    denied = _shared_cache_denied(write=True)
+    if denied:
+        return denied
+    try:
+        shared_cache.accept_publish(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return jsonify({"message": "ok"})
+
 
 # --- 以下仅供开发时本地调试 ---
 if __name__ == "__main__":
     print("[调试模式] 使用 Flask 自带服务器启动...")
-    app.run(host="0.0.0.0", port=5002, debug=True)
\ No newline at end of file
+    # 只在重载器的父进程中拉起执行进程，代码热重载时不会重复启动
+    runner_proc = None if os.environ.get("WERKZEUG_RUN_MAIN") == "true" else spawn_runner()
+    try:
+        app.run(host="0.0.0.0", port=5002, debug=True)
+    finally:
+        stop_runner(runner_proc)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+图片策略（配置项 artwork_types / artwork_size / artwork_bandwidth）：下载哪些类型的图片、取 TMDB 的哪种尺寸，
+以及一次运行内图片下载的带宽上限。
+
+TMDB 同一张图片有多种尺寸（w300、w500、w780……original），original 的海报、背景图常有数 MB，
+而 Jellyfin 在电视和手机上显示时并不需要。选择较小的尺寸时，若本地图片缓存中有同一图片的 original，
+按其大小统计节省的字节数（不为统计额外请求 TMDB，缓存中没有的不计入），见指标 mediatool_artwork_bytes_saved_total
+和运行结束时的日志。default 与此前的行为一致（海报、背景图、logo 为 original，单集缩略图、剧集海报为 w500）。
+"""
+from common_imports import *
+import threading
+import time
+
+import image_cache
+from settings import load_settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/"
+
+# 可在配置中开关的图片类型；剧集目录的 poster.jpg（tvshow_poster）跟随 poster
+ARTWORK_TYPES = ("poster", "fanart", "clearlogo", "thumb")
+
+# 尺寸预设：图片类型 -> TMDB 尺寸（TMDB 各类图片支持的尺寸不同，这里只用各类型都有的）
+ARTWORK_PRESETS = {
+    "default": {"poster": "original", "fanart": "original", "clearlogo": "original",
+                "thumb": "w500", "tvshow_poster": "w500"},
+    "original": {"poster": "original", "fanart": "original", "clearlogo": "original",
+                 "thumb": "original", "tvshow_poster": "original"},
+    "large": {"poster": "w780", "fanart": "w1280", "clearlogo": "w500", "thumb": "w300", "tvshow_poster": "w780"},
+    "medium": {"poster": "w500", "fanart": "w780", "clearlogo": "w300", "thumb": "w300", "tvshow_poster": "w500"},
+    "small": {"poster": "w342", "fanart": "w300", "clearlogo": "w185", "thumb": "w185", "tvshow_poster": "w342"},
+}
+
+BYTES_SAVED = metrics.counter("mediatool_artwork_bytes_saved_total",
+                              "按图片策略少下载的字节数（相对 original 尺寸，按图片类型）", ("kind",))
+IMAGES_OMITTED = metrics.counter("mediatool_artwork_omitted_total", "图片策略中未启用、因此没有下载的图片数",
+                                 ("kind",))
+
+
+class TokenBucket:
+    """
+    字节令牌桶：consume(n) 预约 n 字节的发送时间，超出速率时在锁外等待。
+    允许 burst 秒的突发，多个下载线程共用同一个桶时总速率不超过 rate。
+    """
+
+    def __init__(self, rate, burst=1.0):
+        self.rate = float(rate) # 字节 / 秒
+        self.burst = float(burst)
+        self._lock = threading.Lock()
+        self._available_at = time.monotonic()
+
+    def consume(self, n):
+        with self._lock:
+            now = time.monotonic()
+            self._available_at = max(self._available_at, now - self.burst) + n / self.rate
+            wait = self._available_at - now - self.burst
+        if wait > 0:
+            time.sleep(wait)
+
+    def throttle(self, chunks):
+        """逐块限速地转交 chunks（下载流或整块数据）。"""
+        for chunk in chunks:
+            if chunk:
+                self.consume(len(chunk))
+            yield chunk
+
+
+class ArtworkPolicy:
+    """一次运行的图片策略，同一运行内的文件共用（带宽上限与节省统计都按运行计）。"""
+
+    def __init__(self, config_name="未知", types=ARTWORK_TYPES, size="default", bandwidth=0):
+        if size not in ARTWORK_PRESETS:
+            logger.warning(f"[配置:{config_name}] 未知的图片尺寸预设 {size}，改用 default")
+            size = "default"
+        self.config_name = config_name
+        self.types = set(types)
+        self.size = size
+        self.sizes = ARTWORK_PRESETS[size]
+        self.bucket = TokenBucket(float(bandwidth) * 1024) if bandwidth and float(bandwidth) > 0 else None
+        self._lock = threading.Lock()
+        self.bytes_saved = 0
+        self.omitted = 0
+
+    def wants(self, kind):
+        return ("poster" if kind == "tvshow_poster" else kind) in self.types
+
+    def url(self, kind, image_path):
+        return TMDB_IMAGE_BASE + self.sizes.get(kind, "original") + image_path
+
+    def measures(self, kind):
+        """是否需要统计节省量：default 预设保持原有行为，不查 original 的大小。"""
+        return self.size != "default" and self.sizes.get(kind, "original") != "original"
+
+    def note_saved(self, kind, size):
+        if size <= 0:
+            return
+        with self._lock:
+            self.bytes_saved += size
+        BYTES_SAVED.inc(size, kind=kind)
+
+    def note_omitted(self, kind):
+        with self._lock:
+            self.omitted += 1
+        IMAGES_OMITTED.inc(kind=kind)
+
+    def as_dict(self):
+        with self._lock:
+            return {"bytes_saved": self.bytes_saved, "images_omitted": self.omitted}
+
+
+DEFAULT_POLICY = ArtworkPolicy()
+
+
+def create_policy(config):
+    """按配置项创建本次运行的图片策略；未设置时与此前行为一致（全部类型、default 尺寸、不限速）。"""
+    return ArtworkPolicy(config.get("name", "未知"), config.get("artwork_types", ARTWORK_TYPES),
+                         config.get("artwork_size", "default"), config.get("artwork_bandwidth", 0))
+
+
+def original_size(image_path):
+    """
+    TMDB 图片 original 尺寸的字节数，只取本地图片缓存中的文件大小，不发出网络请求。
+    缓存中没有时返回 0（该图片不计入节省量统计）。
+    """
+    cached = image_cache.lookup(TMDB_IMAGE_BASE + "original" + image_path)
+    if not cached:
+        return 0
+    try:
+        return os.path.getsize(cached)
+    except OSError:
+        return 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_download_pool():
+    """同一文件的 poster / fanart / clearlogo 并发下载所用的线程池（进程内共享，按 artwork.download_workers 创建）。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = load_settings()["artwork"].get("download_workers", 8)
+                _pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="artwork")
+    return _pool
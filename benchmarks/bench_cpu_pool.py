@@ -0,0 +1,88 @@
+"""
+CPU 密集环节（文件名解析 + NFO 渲染）的扩展性基准：
+单线程 / 线程池 / 不同进程数的进程池，统计每秒处理条数。
+
+    python benchmarks/bench_cpu_pool.py --items 20000 --threads 8 --workers 1,2,4,8
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from common import make_filename, make_metadata, timed
+
+from cpu_pool import CpuPool
+from filename_parser import parse_filename
+from nfo_generator import render_movie_nfo, render_tv_nfo
+
+
+def _work_inline(i, batch):
+    filename, metadata = batch[i]
+    parse_filename(filename)
+    if metadata["media_type"] == "movie":
+        return render_movie_nfo(metadata, filename)
+    return render_tv_nfo(metadata, filename)
+
+
+def run_serial(batch):
+    return [_work_inline(i, batch) for i in range(len(batch))]
+
+
+def run_threads(batch, threads):
+    with ThreadPoolExecutor(max_workers=threads) as exe:
+        return list(exe.map(lambda i: _work_inline(i, batch), range(len(batch))))
+
+
+def run_pool(batch, threads, workers):
+    with CpuPool(workers) as pool:
+        pool.parse_filenames([f for f, _ in batch])
+
+        def work(item):
+            filename, metadata = item
+            kind = "movie" if metadata["media_type"] == "movie" else "episode"
+            return pool.render(kind, metadata, filename)
+
+        with ThreadPoolExecutor(max_workers=threads) as exe:
+            return list(exe.map(work, batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8, help="模拟 max_threads 的工作线程数")
+    parser.add_argument("--workers", default="", help="逗号分隔的进程数列表，默认 1,2,4...cpu_count")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    else:
+        worker_counts, w = [], 1
+        while w < cpus:
+            worker_counts.append(w)
+            w *= 2
+        worker_counts.append(cpus)
+
+    batch = []
+    for i in range(args.items):
+        filename = make_filename(i)
+        batch.append((filename, make_metadata(i, "tv_show" if i % 2 else "movie")))
+
+    print(f"条目数：{args.items}，工作线程：{args.threads}，CPU 核数：{cpus}")
+    elapsed, expected = timed(run_serial, batch)
+    baseline = args.items / elapsed
+    print(f"{'单线程':<16}{baseline:>10.0f} 条/秒  x1.00")
+
+    elapsed, result = timed(run_threads, batch, args.threads)
+    assert result == expected
+    rate = args.items / elapsed
+    print(f"{'线程池':<16}{rate:>10.0f} 条/秒  x{rate / baseline:.2f}")
+
+    for workers in worker_counts:
+        elapsed, result = timed(run_pool, batch, args.threads, workers)
+        assert result == expected, "进程池渲染结果与单线程不一致"
+        rate = args.items / elapsed
+        print(f"{f'进程池 x{workers}':<16}{rate:>10.0f} 条/秒  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+media_probe 吞吐量：每秒能读取多少个文件的流信息。
+
+    python benchmarks/bench_media_probe.py --corpus /mnt/media/电影     # 真实文件（或只保留了头部的副本）
+    python benchmarks/bench_media_probe.py --items 500                  # 没有语料时生成合成文件
+
+合成文件为 2 GiB 的稀疏文件：MKV 的 Info / Tracks 在开头，MP4 的 moov 放在 mdat 之后（未做 faststart 的情况），
+同时校验解析结果。PATH 中有 ffprobe 时按相同文件给出对比耗时。
+"""
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+
+from common import timed
+
+from media_probe import probe
+
+SPARSE_SIZE = 2 * 1024 ** 3
+MEDIA_EXTS = (".mkv", ".webm", ".mp4", ".m4v", ".mov")
+
+
+# --- 合成 MKV ---
+def _ebml(element_id, payload):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def _ebml_uint(element_id, value):
+    return _ebml(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def write_mkv(path, duration, width, height, audio_langs, subtitle_langs):
+    tracks = _ebml(0xAE, _ebml_uint(0x83, 1) + _ebml(0x86, b"V_MPEGH/ISO/HEVC") + _ebml(0xE0, _ebml_uint(0xB0, width) + _ebml_uint(0xBA, height)))
+    for lang in audio_langs:
+        tracks += _ebml(0xAE, _ebml_uint(0x83, 2) + _ebml(0x86, b"A_EAC3") + _ebml(0x22B59C, lang.encode()) + _ebml(0xE1, _ebml_uint(0x9F, 6)))
+    for lang in subtitle_langs:
+        tracks += _ebml(0xAE, _ebml_uint(0x83, 17) + _ebml(0x86, b"S_TEXT/UTF8") + _ebml(0x22B59C, lang.encode()))
+    info = _ebml_uint(0x2AD7B1, 1000000) + _ebml(0x4489, struct.pack(">d", duration * 1000))
+    segment = _ebml(0x1549A966, info) + _ebml(0x1654AE6B, tracks)
+    with open(path, "wb") as f:
+        f.write(_ebml(0x1A45DFA3, _ebml(0x4282, b"matroska")))
+        f.write(b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff") # Segment，大小未知（直播式封装）
+        f.write(segment)
+        f.write(b"\x1f\x43\xb6\x75\x01\xff\xff\xff\xff\xff\xff\xff") # 第一个 Cluster
+        f.truncate(SPARSE_SIZE)
+
+
+# --- 合成 MP4 ---
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type.encode("latin-1")) + payload
+
+
+def _lang(code):
+    return sum((ord(c) - 0x60) << shift for c, shift in zip(code, (10, 5, 0)))
+
+
+def _trak(handler, entry, lang, timescale, duration, width=0, height=0):
+    tkhd = struct.pack(">I", 0) + b"\0" * 72 + struct.pack(">II", width << 16, height << 16)
+    mdhd = struct.pack(">IIIIIHH", 0, 0, 0, timescale, duration, _lang(lang), 0)
+    hdlr = struct.pack(">I", 0) + b"\0" * 4 + handler.encode() + b"\0" * 12 + b"handler\0"
+    stbl = _box("stbl", _box("stsd", struct.pack(">II", 0, 1) + entry))
+    return _box("trak", _box("tkhd", tkhd) + _box("mdia", _box("mdhd", mdhd) + _box("hdlr", hdlr) + _box("minf", stbl)))
+
+
+def write_mp4(path, duration, width, height, audio_langs, subtitle_langs):
+    video = _box("avc1", b"\0" * 6 + struct.pack(">H", 1) + b"\0" * 16 + struct.pack(">HH", width, height) + b"\0" * 50)
+    traks = _trak("vide", video, "und", 24000, duration * 24000, width, height)
+    for lang in audio_langs:
+        audio = _box("mp4a", b"\0" * 6 + struct.pack(">H", 1) + b"\0" * 8 + struct.pack(">HHHHI", 2, 16, 0, 0, 48000 << 16))
+        traks += _trak("soun", audio, lang, 48000, duration * 48000)
+    for lang in subtitle_langs:
+        traks += _trak("sbtl", _box("tx3g", b"\0" * 38), lang, 1000, duration * 1000)
+    mvhd = struct.pack(">IIIII", 0, 0, 0, 1000, duration * 1000) + b"\0" * 80
+    moov = _box("moov", _box("mvhd", mvhd) + traks)
+    with open(path, "wb") as f:
+        f.write(_box("ftyp", b"isom\0\0\x02\0isomiso2avc1mp41"))
+        mdat_size = SPARSE_SIZE - f.tell() - len(moov)
+        f.write(struct.pack(">I4sQ", 1, b"mdat", mdat_size))
+        f.seek(f.tell() - 16 + mdat_size)
+        f.write(moov)
+
+
+def make_corpus(directory, items):
+    expected = {}
+    for i in range(items):
+        duration, width, height = 1200 + i, 1920, 1080 if i % 2 else 800
+        audio, subtitle = ["jpn", "chi"][:1 + i % 2], ["chi", "eng"][:i % 3]
+        ext = ".mkv" if i % 2 else ".mp4"
+        path = os.path.join(directory, f"sample{i}{ext}")
+        (write_mkv if ext == ".mkv" else write_mp4)(path, duration, width, height, audio, subtitle)
+        expected[path] = (duration, width, height, audio, subtitle)
+    return expected
+
+
+def check(expected):
+    for path, (duration, width, height, audio, subtitle) in expected.items():
+        result = probe(path)
+        assert result, path
+        assert round(result["duration"]) == duration, (path, result["duration"])
+        assert (result["video"][0]["width"], result["video"][0]["height"]) == (width, height), path
+        assert [a.get("language") for a in result["audio"]] == audio, (path, result["audio"])
+        assert [s.get("language") for s in result["subtitle"]] == subtitle, (path, result["subtitle"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="包含真实媒体文件的目录")
+    parser.add_argument("--items", type=int, default=500, help="没有 --corpus 时生成的合成文件数")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    if args.corpus:
+        paths = [os.path.join(root, f) for root, _, files in os.walk(args.corpus)
+                 for f in files if os.path.splitext(f)[1].lower() in MEDIA_EXTS]
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="bench-probe-")
+        expected = make_corpus(tmp_dir, args.items)
+        check(expected)
+        paths = list(expected)
+    try:
+        if not paths:
+            print("没有找到媒体文件")
+            return
+        probed = sum(1 for p in paths if probe(p))
+        best = min(timed(lambda: [probe(p) for p in paths])[0] for _ in range(args.rounds))
+        print(f"文件数：{len(paths)}（可解析 {probed}）")
+        print(f"media_probe：{len(paths) / best:>10.0f} 文件/秒，{best / len(paths) * 1e6:.0f} 微秒/文件")
+        if shutil.which("ffprobe"):
+            sample = paths[:50]
+            elapsed, _ = timed(lambda: [subprocess.run(["ffprobe", "-v", "quiet", "-show_streams", "-show_format", p],
+                                                       capture_output=True) for p in sample])
+            print(f"ffprobe：    {len(sample) / elapsed:>10.0f} 文件/秒（前 {len(sample)} 个文件）")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+元数据内存占用：fetch_metadata 的嵌套字典 vs 只读 MetadataRecord（tracemalloc 统计），
+以及单集覆盖层的开销。同时校验两种形式渲染出的 NFO 逐字节一致。
+
+    python benchmarks/bench_metadata_record.py --items 2000
+"""
+import argparse
+import copy
+import gc
+import tracemalloc
+
+from common import make_metadata, timed
+
+from metadata_fetcher import merge_episode_metadata
+from metadata_record import MetadataRecord, approx_size
+from nfo_generator import render_movie_nfo, render_tv_nfo, render_tvshow_nfo
+
+EPISODE_INFO = {
+    "episode_title": "第一集",
+    "episode_overview": "单集简介。" * 10,
+    "episode_air_date": "2021-06-01",
+    "episode_directors": [{"name": "单集导演", "id": 9}],
+    "guest_stars": [{"id": 77, "name": "客串", "character": "路人", "profile_path": "/g.jpg"}],
+}
+
+
+def _legacy_episode(metadata, info):
+    """改造前的做法：在字典上原地合并单集信息。"""
+    metadata["episode_title"] = info.get("episode_title", "")
+    metadata["overview"] = info.get("episode_overview") or metadata.get("overview")
+    metadata["release_date"] = info.get("episode_air_date") or metadata.get("release_date")
+    metadata["directors"] = info.get("episode_directors") or metadata.get("directors")
+    metadata["guest_stars"] = info.get("guest_stars", [])
+    return metadata
+
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, objects
+
+
+def check_output():
+    for i in range(50):
+        movie = make_metadata(i, "movie")
+        assert render_movie_nfo(movie, "a.mkv") == render_movie_nfo(MetadataRecord.from_dict(movie), "a.mkv")
+        show = make_metadata(i, "tv_show")
+        record = MetadataRecord.from_dict(show)
+        assert render_tvshow_nfo(show) == render_tvshow_nfo(record.show)
+        legacy = _legacy_episode(copy.deepcopy(show), EPISODE_INFO)
+        assert render_tv_nfo(legacy, "e.mkv") == render_tv_nfo(merge_episode_metadata(record, EPISODE_INFO), "e.mkv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000)
+    args = parser.parse_args()
+
+    check_output()
+    raw = [make_metadata(i) for i in range(args.items)]
+    dict_bytes, dicts = _measure(lambda: copy.deepcopy(raw))
+    convert_time, _ = timed(lambda: [MetadataRecord.from_dict(m) for m in raw])
+    record_bytes, records = _measure(lambda: [MetadataRecord.from_dict(m) for m in raw])
+    overlay_bytes, _ = _measure(lambda: [records[0].with_episode("01", f"{n:02d}", EPISODE_INFO)
+                                         for n in range(args.items)])
+
+    print(f"条数：{args.items}")
+    print(f"字典：            {dict_bytes / args.items:>8.0f} 字节/条")
+    print(f"MetadataRecord：  {record_bytes / args.items:>8.0f} 字节/条（{record_bytes / dict_bytes:.0%}）")
+    print(f"单集覆盖层：      {overlay_bytes / args.items:>8.0f} 字节/集（共享剧集记录，不复制）")
+    print(f"approx_size 估计：字典 {approx_size(dicts[0])} / 记录 {approx_size(records[0])} 字节")
+    print(f"转换耗时：        {convert_time / args.items * 1e6:>8.1f} 微秒/条")
+
+
+if __name__ == "__main__":
+    main()
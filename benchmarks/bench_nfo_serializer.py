@@ -0,0 +1,138 @@
+"""
+NFO 序列化微基准：旧的 ET.tostring + minidom 重解析 vs 单遍流式写出器。
+同时校验两者输出逐字节一致。
+
+    python benchmarks/bench_nfo_serializer.py --items 5000
+"""
+import argparse
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+from common import make_metadata, timed
+
+from nfo_generator import render_movie_nfo, render_tv_nfo, render_tvshow_nfo
+
+
+def _legacy_add(parent, tag, text):
+    if text:
+        sub = ET.SubElement(parent, tag)
+        sub.text = str(text)
+
+
+def _legacy_actors(root, cast):
+    for actor in cast:
+        actor_elem = ET.SubElement(root, "actor")
+        _legacy_add(actor_elem, "name", actor.get("name"))
+        _legacy_add(actor_elem, "role", actor.get("character"))
+        _legacy_add(actor_elem, "tmdbid", actor.get("tmdb_id"))
+        _legacy_add(actor_elem, "profile_url", actor.get("profile_url"))
+        _legacy_add(actor_elem, "thumb", actor.get("thumb"))
+
+
+def _legacy_ids(root, metadata):
+    if metadata.get("tmdbid"):
+        ET.SubElement(root, "uniqueid", {"type": "tmdb", "default": "true"}).text = str(metadata["tmdbid"])
+    if metadata.get("imdb_id"):
+        ET.SubElement(root, "uniqueid", {"type": "imdb"}).text = metadata["imdb_id"]
+
+
+def _legacy_pretty(root):
+    return minidom.parseString(ET.tostring(root, "utf-8")).toprettyxml(indent="  ", encoding="utf-8")
+
+
+def legacy_movie_nfo(metadata, original_filename=""):
+    """基线实现：与改造前 generate_nfo 的构建 + 序列化过程相同。"""
+    root = ET.Element("movie")
+    _legacy_add(root, "originalfilename", original_filename)
+    for tag, key in (("title", "title"), ("originaltitle", "original_title"), ("sorttitle", "title"),
+                     ("rating", "vote_average"), ("year", "year"), ("votes", "vote_count"),
+                     ("plot", "overview"), ("tagline", "tagline"), ("runtime", "runtime"),
+                     ("premiered", "release_date"), ("studio", "studio")):
+        _legacy_add(root, tag, metadata.get(key))
+    _legacy_add(root, "country", ", ".join(metadata.get("production_countries", [])))
+    for genre in metadata.get("genres", []):
+        _legacy_add(root, "genre", genre)
+    for lang in metadata.get("spoken_languages", []):
+        _legacy_add(root, "language", lang)
+    _legacy_ids(root, metadata)
+    for director in metadata.get("directors", []):
+        _legacy_add(root, "director", director.get("name"))
+    for writer in metadata.get("writers", []):
+        _legacy_add(root, "credits", writer.get("name"))
+    _legacy_actors(root, metadata.get("cast", []))
+    if metadata.get("collection"):
+        set_elem = ET.SubElement(root, "set")
+        _legacy_add(set_elem, "name", metadata["collection"].get("name"))
+        _legacy_add(set_elem, "tmdbcolid", metadata["collection"].get("id"))
+    return _legacy_pretty(root)
+
+
+def legacy_tv_nfo(metadata, original_filename=""):
+    root = ET.Element("episodedetails")
+    _legacy_add(root, "originalfilename", original_filename)
+    _legacy_add(root, "showtitle", metadata.get("title"))
+    season_str = metadata.get("season", "00")
+    episode_str = metadata.get("episode", "00")
+    _legacy_add(root, "season", season_str)
+    _legacy_add(root, "episode", episode_str)
+    _legacy_add(root, "title", f"{metadata.get('title', 'Unknown Episode')} S{season_str}E{episode_str}")
+    for tag, key in (("plot", "overview"), ("runtime", "runtime"), ("premiered", "release_date"),
+                     ("aired", "release_date"), ("studio", "studio"), ("year", "year")):
+        _legacy_add(root, tag, metadata.get(key))
+    for genre in metadata.get("genres", []):
+        _legacy_add(root, "genre", genre)
+    _legacy_add(root, "rating", metadata.get("vote_average"))
+    _legacy_add(root, "votes", metadata.get("vote_count"))
+    _legacy_ids(root, metadata)
+    for director in metadata.get("directors", []):
+        _legacy_add(root, "director", director.get("name"))
+    for writer in metadata.get("writers", []):
+        _legacy_add(root, "credits", writer.get("name"))
+    _legacy_actors(root, metadata.get("cast", []))
+    return _legacy_pretty(root)
+
+
+def legacy_tvshow_nfo(metadata):
+    root = ET.Element("tvshow")
+    for tag, key in (("title", "title"), ("originaltitle", "original_title"), ("sorttitle", "title"),
+                     ("plot", "overview"), ("studio", "studio"), ("status", "status"),
+                     ("year", "year"), ("premiered", "release_date")):
+        _legacy_add(root, tag, metadata.get(key))
+    for genre in metadata.get("genres", []):
+        _legacy_add(root, "genre", genre)
+    for lang in metadata.get("spoken_languages", []):
+        _legacy_add(root, "language", lang)
+    _legacy_add(root, "rating", metadata.get("vote_average"))
+    _legacy_add(root, "votes", metadata.get("vote_count"))
+    _legacy_ids(root, metadata)
+    for director in metadata.get("directors", []):
+        _legacy_add(root, "director", director.get("name"))
+    _legacy_actors(root, metadata.get("cast", [])[:20])
+    return _legacy_pretty(root)
+
+
+CASES = (
+    ("movie", "movie", legacy_movie_nfo, lambda m: render_movie_nfo(m, "Some.Movie.2021.mkv"), ("Some.Movie.2021.mkv",)),
+    ("episode", "tv_show", legacy_tv_nfo, lambda m: render_tv_nfo(m, "Some.Show.S01E01.mkv"), ("Some.Show.S01E01.mkv",)),
+    ("tvshow", "tv_show", legacy_tvshow_nfo, render_tvshow_nfo, ()),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'类型':<10}{'minidom 往返':>16}{'流式写出':>16}{'加速':>8}")
+    for kind, media_type, legacy, current, legacy_args in CASES:
+        batch = [make_metadata(i, media_type) for i in range(args.items)]
+        legacy_time, legacy_out = timed(lambda: [legacy(m, *legacy_args) for m in batch])
+        current_time, current_out = timed(lambda: [current(m) for m in batch])
+        assert legacy_out == current_out, f"{kind} 输出与 minidom 基线不一致"
+        legacy_rate = args.items / legacy_time
+        current_rate = args.items / current_time
+        print(f"{kind:<10}{legacy_rate:>12.0f} 个/秒{current_rate:>12.0f} 个/秒{current_rate / legacy_rate:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""基准测试共用的合成数据与计时工具。"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_metadata(i, media_type="movie"):
+    """生成结构与 fetch_metadata 返回值一致的合成元数据（20 位演员、导演、编剧等）。"""
+    cast = []
+    for n in range(20):
+        actor_id = 1000 + i * 20 + n
+        cast.append({
+            "name": f"演员 {n} & Co <{i}>",
+            "character": f"角色 \"{n}\"",
+            "profile_path": f"/p{actor_id}.jpg",
+            "tmdb_id": actor_id,
+            "profile_url": f"https://www.themoviedb.org/person/{actor_id}",
+            "thumb": f"https://image.tmdb.org/t/p/w185/p{actor_id}.jpg",
+        })
+    metadata = {
+        "tmdbid": 500000 + i,
+        "media_type": media_type,
+        "title": f"测试影片 {i}",
+        "original_title": f"Test Movie {i}",
+        "overview": "一段足够长的剧情简介，包含标点、引号\"和&符号。" * 6,
+        "tagline": "Tagline > everything",
+        "runtime": 120,
+        "release_date": "2021-05-01",
+        "year": "2021",
+        "genres": ["剧情", "动作", "科幻"],
+        "studio": "Studio A, Studio B",
+        "spoken_languages": ["English", "普通话"],
+        "vote_average": 7.8,
+        "vote_count": 1234,
+        "poster_path": "/poster.jpg",
+        "fanart_path": "/fanart.jpg",
+        "imdb_id": f"tt{1000000 + i}",
+        "collection": {"name": "系列合集", "id": 42} if i % 3 == 0 else None,
+        "cast": cast,
+        "directors": [{"name": "导演甲", "id": 1}],
+        "writers": [{"name": "编剧乙", "id": 2}, {"name": "编剧丙", "id": 3}],
+        "producers": [{"name": "制片丁", "id": 4, "role": "Producer"}],
+        "keywords": [f"kw{k}" for k in range(30)],
+        "status": "Released",
+    }
+    if media_type == "tv_show":
+        metadata["season"] = "01"
+        metadata["episode"] = f"{i % 24 + 1:02d}"
+        metadata["number_of_seasons"] = 3
+    return metadata
+
+
+def make_filename(i):
+    if i % 2:
+        return f"Some.Show.Name.S01E{i % 24 + 1:02d}.1080p.WEB-DL.x264-GRP.mkv"
+    return f"Some.Movie.Title.{1990 + i % 30}.2160p.BluRay.x265.10bit-GRP.mkv"
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
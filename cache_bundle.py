@@ -0,0 +1,184 @@
+"""
+元数据 / 图片缓存包：把本实例的 TMDB 缓存导出成一个 zip 文件，在其他实例上导入后即可直接复用，不必重新请求 TMDB。
+
+    python cache_bundle.py export cache.zip              # 导出元数据和图片缓存
+    python cache_bundle.py export cache.zip --no-images  # 只导出元数据
+    python cache_bundle.py import cache.zip
+
+包内容：
+    manifest.json          格式名、版本、导出时间与各部分条数
+    tables/<表名>.jsonl     metadata / episodes / searches 三张表，每行一条记录
+    images/<相对路径>       图片缓存（路径与 configs/image_cache 下一致）
+导入时已有的记录只在包内的更新时间更晚时覆盖，已有的图片不覆盖。
+各表的记录先逐行校验，再在一个事务中写入：包内有任何一行格式不对时整个导入失败，本地缓存保持不变。
+"""
+from common_imports import *
+import argparse
+import sqlite3
+import sys
+import time
+import zipfile
+
+import image_cache
+from metadata_store import SHARED_TABLES, get_store
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = "mediatool-cache"
+BUNDLE_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+class BundleError(ValueError):
+    """缓存包格式不正确或版本不受支持。"""
+
+
+def export_bundle(path, include_images=True, store=None):
+    """导出缓存包到 path（先写临时文件，完成后原子替换），返回 manifest。"""
+    store = store or get_store()
+    manifest = {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION, "created_at": time.time(),
+                "tables": {}, "images": 0, "image_bytes": 0}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for table in SHARED_TABLES:
+                count = 0
+                with zf.open(f"tables/{table}.jsonl", "w") as f:
+                    for row in store.dump_table(table):
+                        f.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+                        count += 1
+                manifest["tables"][table] = count
+            if include_images:
+                for rel, file_path, size in image_cache.iter_entries():
+                    zf.write(file_path, f"images/{rel}", compress_type=zipfile.ZIP_STORED) # 图片本身已压缩
+                    manifest["images"] += 1
+                    manifest["image_bytes"] += size
+            zf.writestr(MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"缓存包已导出：{path}，{manifest['tables']}，图片 {manifest['images']} 个")
+    return manifest
+
+
+def read_manifest(zf):
+    try:
+        manifest = json.loads(zf.read(MANIFEST).decode("utf-8"))
+    except KeyError:
+        raise BundleError("缺少 manifest.json，不是缓存包")
+    except ValueError as e:
+        raise BundleError(f"manifest.json 格式错误：{e}")
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"不是缓存包（format={manifest.get('format')!r}）")
+    if not isinstance(manifest.get("version"), int) or manifest["version"] > BUNDLE_VERSION:
+        raise BundleError(f"不支持的缓存包版本：{manifest.get('version')}（当前支持 {BUNDLE_VERSION}）")
+    return manifest
+
+
+# SQLite 列类型 -> 导入时允许的 JSON 值类型
+_COLUMN_TYPES = {"INTEGER": (int,), "REAL": (int, float), "TEXT": (str,)}
+
+
+def _iter_rows(zf, name, columns):
+    """逐行读取 tables/<表名>.jsonl 并校验：每行须为对象，NOT NULL 列不能缺失，各列类型与表定义一致。"""
+    with zf.open(name) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise BundleError(f"{name} 第 {lineno} 行不是有效的 JSON：{e}")
+            if not isinstance(row, dict):
+                raise BundleError(f"{name} 第 {lineno} 行不是 JSON 对象")
+            for column, col_type, notnull in columns:
+                value = row.get(column)
+                if value is None:
+                    if notnull:
+                        raise BundleError(f"{name} 第 {lineno} 行缺少 {column}")
+                    continue
+                allowed = _COLUMN_TYPES.get(col_type, (str, int, float))
+                if isinstance(value, bool) or not isinstance(value, allowed):
+                    raise BundleError(f"{name} 第 {lineno} 行的 {column} 类型不正确：{value!r}")
+            yield row
+
+
+def import_bundle(path, store=None):
+    """导入缓存包，返回 {"tables": {表名: 写入行数}, "images": 新增图片数, "manifest": ...}。"""
+    store = store or get_store()
+    result = {"tables": {}, "images": 0}
+    try:
+        zf = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise BundleError(f"不是有效的 zip 文件：{e}")
+    with zf:
+        manifest = read_manifest(zf)
+        names = set(zf.namelist())
+        # 先读出并校验全部记录（不占用数据库），再在一个短事务中写入，执行进程的元数据写入不会因此长时间等待
+        tables = {}
+        try:
+            for table in SHARED_TABLES:
+                name = f"tables/{table}.jsonl"
+                if name in names:
+                    tables[table] = list(_iter_rows(zf, name, store.table_columns(table)))
+        except (zipfile.BadZipFile, EOFError) as e:
+            raise BundleError(f"读取缓存包失败：{e}")
+        try:
+            result["tables"] = store.merge_tables(tables)
+        except sqlite3.Error as e:
+            raise BundleError(f"导入表数据失败，未写入任何记录：{e}")
+
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.startswith("images/"):
+                continue
+            rel = image_cache.safe_relpath(info.filename[len("images/"):])
+            if not rel:
+                logger.warning(f"跳过不安全的图片路径：{info.filename}")
+                continue
+            dest = image_cache.cache_path(rel)
+            if os.path.exists(dest):
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp_path = f"{dest}.import.tmp"
+            with zf.open(info) as src, open(tmp_path, "wb") as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(tmp_path, dest)
+            result["images"] += 1
+    result["manifest"] = manifest
+    logger.info(f"缓存包已导入：{path}，写入 {result['tables']}，新增图片 {result['images']} 个")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="导出缓存包")
+    export_cmd.add_argument("path")
+    export_cmd.add_argument("--no-images", action="store_true", help="不包含图片缓存")
+    import_cmd = sub.add_parser("import", help="导入缓存包")
+    import_cmd.add_argument("path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        if args.command == "export":
+            result = export_bundle(args.path, include_images=not args.no_images)
+        else:
+            result = import_bundle(args.path)
+    except BundleError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
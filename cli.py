@@ -0,0 +1,137 @@
+"""
+命令行批量处理：不启动 Web 服务和调度器，处理完即退出，适合 cron 或下载工具完成后的回调。
+
+    python cli.py                                    # 所有启用的配置
+    python cli.py --config 电影 --threads 16
+    python cli.py --path /downloads/电影/某部电影      # 只处理某个子目录或单个文件，自动匹配所属配置
+    python cli.py --config 剧集 --json report.json    # 输出 JSON 报告（- 表示标准输出）
+
+为了缩短冷启动时间，模块顶层只导入标准库里的轻量模块，解析完参数后才导入处理流程
+（requests、数据库等）；--help 和参数错误不会加载它们。
+退出码：0 全部成功，1 没有匹配的配置或路径，2 有文件处理失败。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _scope_to_path(cfg, path):
+    """
+    把配置限定到 path（某个源目录内的子目录或单个文件），目标路径按相对位置对应。
+    path 不在该配置的任何源目录下时返回 None。
+    """
+    path = os.path.abspath(path)
+    for index, m in enumerate(cfg.get("paths", [])):
+        src, tgt = m.get("source"), m.get("target")
+        if not src or not tgt:
+            continue
+        src = os.path.abspath(src)
+        if path != src and not path.startswith(src + os.sep):
+            continue
+        rel = os.path.relpath(os.path.dirname(path) if os.path.isfile(path) else path, src)
+        # cluster_key：多节点模式下的租约键前缀，与完整运行时同一文件的键一致
+        return dict(cfg, paths=[{"source": path, "target": os.path.normpath(os.path.join(tgt, rel)),
+                                 "cluster_key": f"{index}/{rel.replace(os.sep, '/')}"}])
+    return None
+
+
+def select_configs(configs, names=None, paths=None):
+    """
+    按名称和路径选出要处理的配置，返回 (配置列表, 未匹配的路径)。
+    未指定名称时只考虑启用的配置；指定了路径时每个配置只处理落在其源目录下的路径。
+    """
+    if names:
+        configs = [c for c in configs if c.get("name") in names]
+    else:
+        configs = [c for c in configs if c.get("enabled", True)]
+    if not paths:
+        return configs, []
+
+    selected, unmatched = [], []
+    for path in paths:
+        scoped = None
+        for cfg in configs:
+            scoped = _scope_to_path(cfg, path)
+            if scoped:
+                break
+        if scoped:
+            selected.append(scoped)
+        else:
+            unmatched.append(path)
+    return selected, unmatched
+
+
+def run(configs, threads=None):
+    """依次处理各配置，返回报告 {"configs": [...], "total", "success", "failed", "elapsed"}。"""
+    from job_registry import Job
+    from movie_processor import process_movies
+
+    started = time.perf_counter()
+    reports = []
+    for cfg in configs:
+        if threads:
+            cfg = dict(cfg, max_threads=threads)
+        job = Job(cfg.get("name", ""), "cli")
+        job.start()
+        try:
+            process_movies(cfg, progress_callback=job.progress_callback())
+            job.finish()
+        except Exception as e:
+            logger.error(f"配置 {job.name} 执行失败：{e}", exc_info=True)
+            job.finish(error=e)
+        data = job.to_dict()
+        reports.append({key: data[key] for key in ("name", "status", "total", "processed", "success", "failed",
+                                                   "write_stats", "elapsed", "throughput", "errors")})
+    return {
+        "configs": reports,
+        "total": sum(r["total"] for r in reports),
+        "success": sum(r["success"] for r in reports),
+        "failed": sum(r["failed"] for r in reports),
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", help="只处理指定名称的配置，可重复；默认所有启用的配置")
+    parser.add_argument("--path", action="append", help="只处理该路径（源目录内的子目录或单个文件），可重复")
+    parser.add_argument("--threads", type=int, help="并发线程数，默认取配置中的 max_threads")
+    parser.add_argument("--json", metavar="FILE", help="把报告以 JSON 写入文件，- 表示标准输出")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每个文件的日志")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    from config_store import load_config
+
+    configs, unmatched = select_configs(load_config(), args.config, args.path)
+    for path in unmatched:
+        print(f"路径不在任何配置的源目录下：{path}", file=sys.stderr)
+    if not configs:
+        print("没有匹配的配置", file=sys.stderr)
+        return 1
+
+    report = run(configs, threads=args.threads)
+    if args.json == "-":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        for r in report["configs"]:
+            print(f"{r['name']}：共 {r['total']}，成功 {r['success']}，失败 {r['failed']}，"
+                  f"写入 {r['write_stats']['written']}，未变化 {r['write_stats']['skipped']}，耗时 {r['elapsed']}s")
+    if unmatched:
+        return 1
+    if report["failed"] or any(r["status"] == "failed" for r in report["configs"]):
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+多节点分片处理：几台主机挂载同一份存储时，同一个配置可以在多台主机上同时运行，按文件分担处理。
+
+- 成员：正在处理某个配置的节点在共享库中登记并定期心跳，心跳超时的节点视为已离开
+- 分片：按文件键（配置名 / 路径映射序号 / 源目录内相对路径）做一致性哈希，每个节点只处理归自己的文件，
+  节点加入或离开时只有少量文件换主
+- 租约：处理文件前先在共享库中领取租约，处理期间由心跳续租，完成后标记为 done（大小、修改时间不变时不再处理）；
+  节点崩溃后租约过期，文件由新的归属节点接手。成员变化期间两节点同时认为自己归属某个文件时，也只有一个能领到租约
+
+共享库是共享挂载上的 SQLite 文件（cluster.store），使用回滚日志而不是 WAL。
+各节点的配置名称、路径映射顺序需一致，源目录的挂载点可以不同。
+"""
+from common_imports import *
+import bisect
+import hashlib
+import socket
+import threading
+import time
+
+from db_utils import add_columns, open_db
+from settings import load_settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLAIMS = metrics.counter("mediatool_cluster_claims_total", "多节点模式下领取文件租约的结果", ("result",))
+NODES = metrics.gauge("mediatool_cluster_nodes", "正在处理该配置的节点数", ("config",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    heartbeat REAL NOT NULL,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (node_id, scope)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    item TEXT PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    scope TEXT NOT NULL DEFAULT '', -- 领取租约的配置；同一进程内多个配置共用节点 ID，续租、释放都按配置区分
+    state TEXT NOT NULL, -- leased / done
+    expires_at REAL NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """一致性哈希环，每个节点放 vnodes 个虚拟节点。"""
+
+    def __init__(self, nodes, vnodes=64):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [p[0] for p in points]
+        self._owners = [p[1] for p in points]
+
+    def owner(self, key):
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[index]
+
+
+class LeaseStore:
+    """共享挂载上的节点登记与文件租约（SQLite，回滚日志）。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA, wal=False)
+        add_columns(self._conn, "leases", {"scope": "TEXT NOT NULL DEFAULT ''"}) # 早期版本创建的共享库
+
+    def heartbeat(self, node_id, scope, lease_seconds):
+        """登记 / 刷新节点心跳，并为该节点在 scope 下未完成的租约续期。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO nodes (node_id, scope, heartbeat, started_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (node_id, scope) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (node_id, scope, now, now))
+            self._conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE node_id = ? AND scope = ? AND state = 'leased'",
+                (now + lease_seconds, node_id, scope))
+            self._conn.commit()
+
+    def live_nodes(self, scope, stale_seconds):
+        with self._lock:
+            rows = self._conn.execute("SELECT node_id FROM nodes WHERE scope = ? AND heartbeat >= ?",
+                                      (scope, time.time() - stale_seconds)).fetchall()
+        return [r[0] for r in rows]
+
+    def leave(self, node_id, scope):
+        """
+        节点退出 scope：注销登记，释放该 scope 下未完成的租约（其他节点无需等待过期）。
+        同一进程中其他配置的租约不受影响，它们可能仍在处理中。
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM nodes WHERE node_id = ? AND scope = ?", (node_id, scope))
+            self._conn.execute("DELETE FROM leases WHERE node_id = ? AND scope = ? AND state = 'leased'",
+                               (node_id, scope))
+            self._conn.commit()
+
+    def claim(self, item, node_id, scope, lease_seconds, size=None, mtime=None):
+        """
+        领取文件租约，返回 "claimed" / "taken_over"（接手了过期租约）/ "busy"（其他节点持有）/ "done"（已处理过）。
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute("SELECT node_id, state, expires_at, size, mtime FROM leases WHERE item = ?",
+                                         (item,)).fetchone()
+                result = "claimed"
+                if row:
+                    owner, state, expires_at, old_size, old_mtime = row
+                    if state == "done" and old_size == size and old_mtime == mtime:
+                        result = "done"
+                    elif state == "leased" and owner != node_id:
+                        result = "taken_over" if expires_at < now else "busy"
+                if result in ("claimed", "taken_over"):
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO leases (item, node_id, scope, state, expires_at, size, mtime, updated_at) "
+                        "VALUES (?, ?, ?, 'leased', ?, ?, ?, ?)",
+                        (item, node_id, scope, now + lease_seconds, size, mtime, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def complete(self, item, node_id, success):
+        """处理成功标记为 done；失败则释放租约，下次运行时重试。"""
+        with self._lock:
+            if success:
+                self._conn.execute("UPDATE leases SET state = 'done', updated_at = ? WHERE item = ? AND node_id = ?",
+                                   (time.time(), item, node_id))
+            else:
+                self._conn.execute("DELETE FROM leases WHERE item = ? AND node_id = ? AND state = 'leased'",
+                                   (item, node_id))
+            self._conn.commit()
+
+
+class ClusterNode:
+    """
+    一次 process_movies 运行期间本节点在集群中的身份：后台线程定期心跳、续租并刷新哈希环。
+    用作上下文管理器，退出时注销并释放租约。
+    """
+
+    def __init__(self, store, node_id, scope, lease_seconds=120, heartbeat_seconds=15, vnodes=64):
+        self.store = store
+        self.node_id = node_id
+        self.scope = scope
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.vnodes = vnodes
+        self.ring = HashRing([node_id], vnodes)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        self.store.heartbeat(self.node_id, self.scope, self.lease_seconds)
+        # 心跳间隔的两倍内没有心跳视为离开，且不超过租约时长
+        nodes = self.store.live_nodes(self.scope, min(self.heartbeat_seconds * 2, self.lease_seconds))
+        if self.node_id not in nodes:
+            nodes.append(self.node_id)
+        if sorted(nodes) != self.ring.nodes:
+            logger.info(f"[集群:{self.scope}] 节点变化：{', '.join(sorted(nodes))}")
+            self.ring = HashRing(nodes, self.vnodes)
+        NODES.set(len(nodes), config=self.scope)
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"[集群:{self.scope}] 心跳失败：{e}")
+
+    def __enter__(self):
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name=f"cluster-{self.scope}", daemon=True)
+        self._thread.start()
+        logger.info(f"[集群:{self.scope}] 节点 {self.node_id} 已加入，当前节点：{', '.join(self.ring.nodes)}")
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        try:
+            self.store.leave(self.node_id, self.scope)
+        except Exception as e:
+            logger.warning(f"[集群:{self.scope}] 注销节点失败：{e}")
+        NODES.set(0, config=self.scope)
+        return False
+
+    def owns(self, item):
+        return self.ring.owner(item) == self.node_id
+
+    def claim(self, item, size=None, mtime=None):
+        try:
+            result = self.store.claim(item, self.node_id, self.scope, self.lease_seconds, size, mtime)
+        except Exception as e:
+            logger.warning(f"[集群:{self.scope}] 领取租约失败（{item}）：{e}")
+            result = "error"
+        CLAIMS.inc(result=result)
+        if result == "taken_over":
+            logger.info(f"[集群:{self.scope}] 接手过期租约：{item}")
+        return result in ("claimed", "taken_over")
+
+    def complete(self, item, success):
+        try:
+            self.store.complete(item, self.node_id, success)
+        except Exception as e:
+            logger.warning(f"[集群:{self.scope}] 更新租约失败（{item}）：{e}")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def join_cluster(scope):
+    """
+    按全局设置 cluster.store 创建本节点的 ClusterNode（未启用多节点模式时返回 None）。
+    节点 ID 为 节点名:进程号，同一主机上的多个进程（如执行进程与命令行）也互不冲突。
+    """
+    cfg = load_settings()["cluster"]
+    path = cfg.get("store")
+    if not path:
+        return None
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = LeaseStore(path)
+    node_id = f"{cfg.get('node_id') or socket.gethostname()}:{os.getpid()}"
+    return ClusterNode(store, node_id, scope, lease_seconds=float(cfg.get("lease_seconds", 120)),
+                       heartbeat_seconds=float(cfg.get("heartbeat_seconds", 15)), vnodes=int(cfg.get("vnodes", 64)))
@@ -0,0 +1,150 @@
+"""
+process_movies 线程池的自适应并发（配置项 adaptive_threads）：线程池按上限创建，实际同时处理的文件数
+由 AIMD 控制器调整——每个观察窗口内一切正常就 +1，出现以下情况之一就乘以 decrease_factor：
+- TMDB 错误率（429、5xx、网络异常）超过 tmdb_error_rate，或出现 429
+- 磁盘操作（链接、重命名、写 NFO 等）平均耗时超过 disk_latency 秒
+- 单文件平均耗时超过此前窗口平滑值的 latency_factor 倍
+每次调整都会写日志并更新指标 mediatool_executor_limit。
+
+TMDB 响应与磁盘耗时由 metadata_fetcher / movie_processor 通过 note_tmdb / note_disk 上报（进程内全局，
+同时运行的多个配置共用这些信号，因为它们共用同一个 TMDB 配额和同一块磁盘）。
+"""
+from common_imports import *
+import threading
+import time
+
+from settings import load_settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_LIMIT = metrics.gauge("mediatool_executor_limit", "自适应并发：当前允许同时处理的文件数", ("config",))
+LIMIT_CHANGES = metrics.counter("mediatool_executor_limit_changes_total", "自适应并发的调整次数（按方向）",
+                                ("config", "direction"))
+
+_signals_lock = threading.Lock()
+_tmdb = {"total": 0, "errors": 0, "throttled": 0}
+_disk = {"count": 0, "seconds": 0.0}
+
+
+def note_tmdb(status):
+    """记录一次 TMDB 响应（HTTP 状态码字符串，网络异常为 "error"）。"""
+    with _signals_lock:
+        _tmdb["total"] += 1
+        if status == "429":
+            _tmdb["throttled"] += 1
+            _tmdb["errors"] += 1
+        elif status == "error" or status.startswith("5"):
+            _tmdb["errors"] += 1
+
+
+def note_disk(seconds):
+    """记录一次磁盘操作的耗时。"""
+    with _signals_lock:
+        _disk["count"] += 1
+        _disk["seconds"] += seconds
+
+
+def _snapshot():
+    with _signals_lock:
+        return dict(_tmdb), dict(_disk)
+
+
+class AdaptiveLimiter:
+    """
+    可调上限的信号量 + AIMD 控制器。工作线程处理文件前 acquire()，结束后 release(耗时, 是否计入)。
+    """
+
+    def __init__(self, config_name, min_workers, max_workers, initial=None, settings=None):
+        settings = settings or load_settings()["concurrency"]
+        self.config_name = config_name
+        self.min_workers = max(1, int(min_workers))
+        self.max_workers = max(self.min_workers, int(max_workers))
+        self.limit = min(max(int(initial or self.min_workers), self.min_workers), self.max_workers)
+        self.window_files = int(settings.get("window_files", 16))
+        self.window_seconds = float(settings.get("window_seconds", 30))
+        self.tmdb_error_rate = float(settings.get("tmdb_error_rate", 0.05))
+        self.disk_latency = float(settings.get("disk_latency", 0.5))
+        self.latency_factor = float(settings.get("latency_factor", 2.0))
+        self.decrease_factor = float(settings.get("decrease_factor", 0.7))
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._latencies = []
+        self._window_start = time.monotonic()
+        self._tmdb_base, self._disk_base = _snapshot()
+        self._latency_ref = None # 此前各窗口单文件耗时的指数平滑值
+        self._cooldown = False # 刚减小过并发时，下一个窗口不增加
+        EXECUTOR_LIMIT.set(self.limit, config=config_name)
+        logger.info(f"[配置:{config_name}] 自适应并发：初始 {self.limit}，范围 {self.min_workers}~{self.max_workers}")
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self, seconds=None):
+        """seconds 为该文件的处理耗时；跳过的文件（已处理、重复等）传 None，不计入耗时统计。"""
+        with self._cond:
+            self._active -= 1
+            if seconds is not None:
+                self._latencies.append(seconds)
+            if len(self._latencies) >= self.window_files or (
+                    self._latencies and time.monotonic() - self._window_start >= self.window_seconds):
+                self._adjust()
+            self._cond.notify_all()
+
+    def _adjust(self):
+        latencies, self._latencies = self._latencies, []
+        self._window_start = time.monotonic()
+        tmdb, disk = _snapshot()
+        tmdb_total = tmdb["total"] - self._tmdb_base["total"]
+        tmdb_errors = tmdb["errors"] - self._tmdb_base["errors"]
+        throttled = tmdb["throttled"] - self._tmdb_base["throttled"]
+        disk_count = disk["count"] - self._disk_base["count"]
+        disk_avg = (disk["seconds"] - self._disk_base["seconds"]) / disk_count if disk_count else 0.0
+        self._tmdb_base, self._disk_base = tmdb, disk
+        error_rate = tmdb_errors / tmdb_total if tmdb_total else 0.0
+        latency = sum(latencies) / len(latencies)
+
+        reason = None
+        if throttled:
+            reason = f"TMDB 限流 {throttled} 次"
+        elif error_rate > self.tmdb_error_rate:
+            reason = f"TMDB 错误率 {error_rate:.0%}"
+        elif disk_avg > self.disk_latency:
+            reason = f"磁盘操作平均 {disk_avg * 1000:.0f}ms"
+        elif self._latency_ref and latency > self._latency_ref * self.latency_factor:
+            reason = f"单文件耗时 {latency:.2f}s，超过平滑值 {self._latency_ref:.2f}s 的 {self.latency_factor:g} 倍"
+        self._latency_ref = latency if self._latency_ref is None else 0.7 * self._latency_ref + 0.3 * latency
+
+        old = self.limit
+        if reason:
+            self.limit = max(self.min_workers, int(self.limit * self.decrease_factor))
+            self._cooldown = True
+        elif self._cooldown:
+            self._cooldown = False
+        else:
+            self.limit = min(self.max_workers, self.limit + 1)
+        summary = (f"单文件 {latency:.2f}s，TMDB 请求 {tmdb_total} 次 / 错误率 {error_rate:.0%}，"
+                   f"磁盘 {disk_avg * 1000:.0f}ms")
+        if self.limit != old:
+            direction = "down" if self.limit < old else "up"
+            LIMIT_CHANGES.inc(config=self.config_name, direction=direction)
+            EXECUTOR_LIMIT.set(self.limit, config=self.config_name)
+            cause = f"，原因：{reason}" if reason else ""
+            logger.info(f"[配置:{self.config_name}] 并发 {old} → {self.limit}（{summary}{cause}）")
+        else:
+            logger.debug(f"[配置:{self.config_name}] 并发保持 {self.limit}（{summary}）")
+
+    def close(self):
+        EXECUTOR_LIMIT.set(0, config=self.config_name)
+
+
+def create_limiter(config):
+    """配置启用 adaptive_threads 时返回 AdaptiveLimiter，否则返回 None（线程数固定为 max_threads）。"""
+    if not config.get("adaptive_threads"):
+        return None
+    return AdaptiveLimiter(config.get("name", "未知"), config.get("min_threads", 1),
+                           config.get("adaptive_max_threads", 16), initial=config.get("max_threads", 4))
@@ -0,0 +1,28 @@
+from common_imports import *
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "configs/config.json"
+
+# 加载/保存配置
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                configs = json.load(f)
+                if isinstance(configs, list):
+                    return configs
+        except Exception as e:
+            logger.error(f"加载配置出错：{e}")
+    return []
+
+def save_config(configs):
+    try:
+        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+            json.dump(configs, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"保存配置出错：{e}")
+
+def media_suffixes(cfg):
+    """配置中的媒体文件后缀集合，统一小写，匹配时与 os.path.splitext 得到的小写扩展名比较。"""
+    return {s.strip().lower() for s in cfg.get("file_suffixes", "").split(",") if s.strip()}
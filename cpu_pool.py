@@ -0,0 +1,79 @@
+from common_imports import *
+from concurrent.futures import ProcessPoolExecutor
+
+from filename_parser import parse_filename
+from nfo_generator import render_movie_nfo, render_tv_nfo, render_tvshow_nfo
+
+logger = logging.getLogger(__name__)
+
+# NFO 渲染实际用到的字段，其余（海报路径、关键词、预告片等）不跨进程传递
+_NFO_SCALAR_FIELDS = (
+    "title", "original_title", "overview", "tagline", "runtime", "release_date", "year",
+    "studio", "status", "vote_average", "vote_count", "tmdbid", "imdb_id", "season", "episode",
+)
+_NFO_LIST_FIELDS = ("genres", "spoken_languages", "production_countries")
+_CAST_FIELDS = ("name", "character", "tmdb_id", "profile_url", "thumb")
+
+_RENDERERS = {
+    "movie": render_movie_nfo,
+    "episode": render_tv_nfo,
+    "tvshow": render_tvshow_nfo,
+}
+
+
+def to_nfo_record(metadata):
+    """
+    把完整的元数据字典裁剪成只含 NFO 所需字段的轻量记录（纯 dict/list/str，可 pickle）。
+    """
+    record = {k: metadata.get(k) for k in _NFO_SCALAR_FIELDS if metadata.get(k) is not None}
+    for k in _NFO_LIST_FIELDS:
+        if metadata.get(k):
+            record[k] = list(metadata[k])
+    record["directors"] = [{"name": p.get("name")} for p in metadata.get("directors") or []]
+    record["writers"] = [{"name": p.get("name")} for p in metadata.get("writers") or []]
+    record["cast"] = [{k: a.get(k) for k in _CAST_FIELDS} for a in metadata.get("cast") or []]
+    if metadata.get("collection"):
+        record["collection"] = {"name": metadata["collection"].get("name"), "id": metadata["collection"].get("id")}
+    return record
+
+
+def _render(kind, record, *args):
+    return _RENDERERS[kind](record, *args)
+
+
+class CpuPool:
+    """
+    CPU 密集环节（文件名解析、NFO 渲染）的进程池。
+    工作线程提交任务后阻塞等待结果，等待期间释放 GIL，多核可以真正并行。
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        logger.info(f"CPU 进程池已启动，进程数：{workers}")
+
+    def parse_filenames(self, filenames, chunksize=256):
+        """批量解析文件名，按块分发以摊薄进程间通信开销。"""
+        return list(self._executor.map(parse_filename, filenames, chunksize=chunksize))
+
+    def render(self, kind, metadata, *args):
+        """在子进程中渲染 NFO，kind 为 movie / episode / tvshow，返回 XML 字节串。"""
+        return self._executor.submit(_render, kind, to_nfo_record(metadata), *args).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+def create_cpu_pool(config):
+    """根据配置中的 cpu_workers 创建进程池，未启用时返回 None。"""
+    workers = int(config.get("cpu_workers", 0) or 0)
+    if workers <= 0:
+        return None
+    return CpuPool(min(workers, os.cpu_count() or 1))
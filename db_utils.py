@@ -0,0 +1,32 @@
+from common_imports import *
+import sqlite3
+
+
+def open_db(path, schema="", wal=True):
+    """
+    打开 configs 目录下的 SQLite 数据库：WAL 模式 + busy_timeout，允许多线程共用一个连接（调用方自行加锁）。
+    schema 为建表语句，首次打开时执行。
+    wal=False 用于多台主机共用的网络挂载（WAL 依赖共享内存，只能在同一台主机内使用），改用回滚日志。
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    if wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    else:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("PRAGMA synchronous=FULL")
+    if schema:
+        conn.executescript(schema)
+        conn.commit()
+    return conn
+
+
+def add_columns(conn, table, columns):
+    """为已有的表补上新增的列（columns 为 {列名: 类型与默认值}），用于升级早期版本创建的数据库。"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    missing = [(name, spec) for name, spec in columns.items() if name not in existing]
+    for name, spec in missing:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {spec}")
+    if missing:
+        conn.commit()
@@ -0,0 +1,134 @@
+"""
+把源文件放到目标路径：硬链接 → reflink（FICLONE，btrfs / XFS 等支持写时复制的文件系统）→ 内核内复制
+（copy_file_range，不支持时 sendfile），前一种方式因跨文件系统等原因不可用时自动换下一种。
+
+配置项 link_mode 指定从哪一种开始：
+    hardlink（默认）  依次尝试三种
+    reflink           不建硬链接（目标与源互不影响），reflink 失败时复制
+    copy              直接复制
+复制在内核中完成，不经过用户态缓冲区；复制时先写临时文件，完成后改名，中断不会留下不完整的目标文件。
+"""
+from common_imports import *
+import errno
+import shutil
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LINK_MODES = ("hardlink", "reflink", "copy")
+FICLONE = 0x40049409 # linux/fs.h: _IOW(0x94, 9, int)
+_COPY_CHUNK = 64 * 1024 * 1024
+
+# 这些错误表示当前方式在这对路径上不可用，换下一种方式；其他错误（权限不足、源文件不存在、目标已存在等）直接抛出
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP}
+# 文件系统或内核不支持 FICLONE / copy_file_range 时返回的错误，只在这两处换用下一种实现
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS, errno.ENOTTY}
+
+LINK_TOTAL = metrics.counter("mediatool_link_total", "放置媒体文件的方式（硬链接 / reflink / 复制）", ("method",))
+COPY_BYTES = metrics.counter("mediatool_link_copy_bytes_total", "复制方式写入的字节数")
+COPY_SECONDS = metrics.histogram("mediatool_link_copy_seconds", "复制单个文件的耗时（秒）",
+                                 buckets=(0.5, 1, 5, 15, 60, 300, 900, 3600))
+
+
+def _reflink(src_path, tmp_path):
+    import fcntl # 仅 Unix
+    with open(src_path, "rb") as src, open(tmp_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                raise OSError(errno.EOPNOTSUPP, f"不支持 reflink：{e}") from e
+            raise
+
+
+def _copy_range(src_fd, dst_fd, size):
+    """内核内复制：copy_file_range（同一文件系统上还可能由文件系统直接完成），不可用时 sendfile。"""
+    offset = 0
+    use_copy_file_range = hasattr(os, "copy_file_range")
+    while offset < size:
+        count = min(_COPY_CHUNK, size - offset)
+        if use_copy_file_range:
+            try:
+                sent = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS or offset:
+                    raise
+                use_copy_file_range = False
+                continue
+        else:
+            sent = os.sendfile(dst_fd, src_fd, offset, count)
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+
+def _copy(src_path, tmp_path):
+    with open(src_path, "rb") as src, open(tmp_path, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        try:
+            copied = _copy_range(src.fileno(), dst.fileno(), size)
+        except (OSError, AttributeError) as e:
+            if isinstance(e, OSError) and e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            # 非 Linux 平台等情况：退回普通复制
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+            shutil.copyfileobj(src, dst, _COPY_CHUNK)
+            copied = size
+        if copied != size:
+            raise OSError(errno.EIO, f"复制不完整：{copied}/{size} 字节")
+    return copied
+
+
+def _place(method, src_path, dest_path):
+    if method == "hardlink":
+        os.link(src_path, dest_path)
+        return 0
+    tmp_path = f"{dest_path}.{os.getpid()}.part"
+    try:
+        if method == "reflink":
+            _reflink(src_path, tmp_path)
+            copied = 0
+        else:
+            copied = _copy(src_path, tmp_path)
+        shutil.copystat(src_path, tmp_path)
+        if os.path.exists(dest_path):
+            raise FileExistsError(errno.EEXIST, "目标文件已存在", dest_path)
+        os.replace(tmp_path, dest_path)
+        return copied
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def link_file(src_path, dest_path, mode="hardlink"):
+    """
+    按 mode 及其后的方式依次尝试，返回实际使用的方式（hardlink / reflink / copy）。
+    所有方式都不可用时抛出最后一次的错误。
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"未知的 link_mode：{mode}（可选 {', '.join(LINK_MODES)}）")
+    error = None
+    for method in LINK_MODES[LINK_MODES.index(mode):]:
+        start = time.perf_counter()
+        try:
+            copied = _place(method, src_path, dest_path)
+        except (OSError, ImportError) as e:
+            if isinstance(e, OSError) and e.errno not in _FALLBACK_ERRNOS:
+                raise
+            logger.debug(f"{method} 不可用（{e}），尝试下一种方式：{dest_path}")
+            error = e
+            continue
+        LINK_TOTAL.inc(method=method)
+        if method == "copy":
+            elapsed = time.perf_counter() - start
+            COPY_BYTES.inc(copied)
+            COPY_SECONDS.observe(elapsed)
+            logger.info(f"复制 {copied / 1048576:.1f} MB，{copied / 1048576 / max(elapsed, 1e-6):.1f} MB/s：{dest_path}")
+        return method
+    raise error
@@ -0,0 +1,161 @@
+from common_imports import *
+import hashlib
+import mmap
+import threading
+import time
+
+from db_utils import open_db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_DB = os.path.join("configs", "fingerprints.db")
+FINGERPRINT_CHUNK = 1024 * 1024 # 参与哈希的首、尾字节数
+FINGERPRINT_MIN_SIZE = 1024 * 1024 # 更小的文件（样片、占位文件等）不查重
+DUPLICATE_MODES = ("skip", "report", "off")
+
+DUPLICATES = metrics.counter("mediatool_duplicates_total", "按内容指纹发现的重复源文件（按配置、处理方式）",
+                             ("config", "action"))
+
+_SCHEMA = """
+-- 处理过的源文件的内容指纹；duplicate_of 不为空表示该文件与另一个源文件内容相同
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    config_name TEXT,
+    duplicate_of TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_fp ON fingerprints (fingerprint);
+"""
+
+
+def compute_fingerprint(path, size=None):
+    """
+    文件大小 + 首尾各 FINGERPRINT_CHUNK 字节的 blake2b（mmap 读取，不复制到 Python 缓冲区）。
+    同一资源改名、放在不同目录下时指纹相同；只读首尾，大文件也只需两次随机读。
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    if size:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                if size <= 2 * FINGERPRINT_CHUNK:
+                    digest.update(view)
+                else:
+                    digest.update(view[:FINGERPRINT_CHUNK])
+                    digest.update(view[size - FINGERPRINT_CHUNK:])
+    return f"{size}:{digest.hexdigest()}"
+
+
+class FingerprintIndex:
+    """
+    跨所有配置的源文件内容指纹索引（SQLite）。处理流程在链接、刮削之前调用 check：
+    同一内容已由另一个源文件处理过（或正在处理）时返回那个文件的路径。
+    文件大小、修改时间不变时直接复用已记录的指纹，不再读取文件。
+    """
+
+    def __init__(self, path=FINGERPRINT_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+        self._pending = {} # 指纹 -> 正在处理的源文件路径
+
+    def _known_fingerprint(self, path, st):
+        row = self._conn.execute("SELECT fingerprint, size, mtime FROM fingerprints WHERE path = ?",
+                                 (path,)).fetchone()
+        if row and row[1] == st.st_size and row[2] == st.st_mtime:
+            return row[0]
+        return None
+
+    def _original(self, fingerprint, path):
+        pending = self._pending.get(fingerprint)
+        if pending and pending != path:
+            return pending
+        rows = self._conn.execute(
+            "SELECT path FROM fingerprints WHERE fingerprint = ? AND path != ? AND duplicate_of IS NULL "
+            "ORDER BY updated_at", (fingerprint, path)).fetchall()
+        for (other,) in rows:
+            if os.path.exists(other): # 原文件已被移走时，当前文件不再算重复
+                return other
+        return None
+
+    def _save(self, path, fingerprint, st, config_name, duplicate_of):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO fingerprints (path, fingerprint, size, mtime, config_name, duplicate_of, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, fingerprint, st.st_size, st.st_mtime, config_name, duplicate_of, time.time()))
+        self._conn.commit()
+
+    def check(self, path, config_name):
+        """
+        返回 (指纹, 内容相同的另一个源文件路径或 None)。
+        不重复时登记为正在处理，处理结束后须调用 complete；小于 FINGERPRINT_MIN_SIZE 的文件返回 (None, None)。
+        """
+        st = os.stat(path)
+        if st.st_size < FINGERPRINT_MIN_SIZE:
+            return None, None
+        with self._lock:
+            fingerprint = self._known_fingerprint(path, st)
+        if fingerprint is None:
+            fingerprint = compute_fingerprint(path, st.st_size) # 读文件不占锁，多个线程可同时计算
+        with self._lock:
+            original = self._original(fingerprint, path)
+            if original:
+                self._save(path, fingerprint, st, config_name, original)
+            else:
+                self._pending[fingerprint] = path
+        return fingerprint, original
+
+    def complete(self, path, fingerprint, config_name, success):
+        """处理成功后记录指纹；失败时只撤销登记，之后遇到相同内容的文件仍会处理。"""
+        with self._lock:
+            if self._pending.get(fingerprint) == path:
+                del self._pending[fingerprint]
+            if not success:
+                return
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            self._save(path, fingerprint, st, config_name, None)
+
+    def duplicates(self, limit=100, offset=0):
+        """已发现的重复文件（新的在前）与总数。"""
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM fingerprints WHERE duplicate_of IS NOT NULL").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT path, duplicate_of, config_name, size, updated_at FROM fingerprints "
+                "WHERE duplicate_of IS NOT NULL ORDER BY updated_at DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        items = [{"path": r[0], "duplicate_of": r[1], "config_name": r[2], "size": r[3], "detected_at": r[4]}
+                 for r in rows]
+        return {"total": total, "items": items}
+
+    def prune(self):
+        """删除源文件已不存在的记录，返回删除条数。"""
+        with self._lock:
+            paths = [r[0] for r in self._conn.execute("SELECT path FROM fingerprints")]
+        missing = [(p,) for p in paths if not os.path.exists(p)]
+        if missing:
+            with self._lock:
+                self._conn.executemany("DELETE FROM fingerprints WHERE path = ?", missing)
+                self._conn.commit()
+            logger.info(f"指纹索引：清理 {len(missing)} 条源文件已不存在的记录")
+        return len(missing)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_fingerprint_index():
+    """进程内共享的 FingerprintIndex 实例（首次使用时创建）。"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FingerprintIndex()
+    return _index
@@ -0,0 +1,23 @@
+# gunicorn 配置：工作进程只处理 Web 请求（入队任务、读取进度），
+# 定时调度和任务执行由主进程启动时拉起的唯一一个后台执行进程（job_runner.py）负责。
+import os
+
+bind = "0.0.0.0:5001"
+workers = 4
+# 使用 gthread 工作模式：/progress/stream 的长连接只占用线程，不会占满工作进程
+worker_class = "gthread"
+threads = 8
+
+
+def on_starting(server):
+    # 执行进程单独部署（例如另一个容器）时设置 START_JOB_RUNNER=0
+    if os.environ.get("START_JOB_RUNNER", "1") == "0":
+        return
+    from job_runner import spawn_runner
+    server.job_runner = spawn_runner()
+    server.log.info(f"后台执行进程已启动，PID：{server.job_runner.pid}")
+
+
+def on_exit(server):
+    from job_runner import stop_runner
+    stop_runner(getattr(server, "job_runner", None))
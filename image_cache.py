@@ -0,0 +1,155 @@
+"""
+本地图片缓存：TMDB 图片下载一次后保存在 configs/image_cache，其他媒体文件（同一部剧的各集、重新整理的库）
+和导入了缓存包的其他实例可直接复用，不再请求 image.tmdb.org。
+
+缓存文件按 TMDB 图片 URL 中 /t/p/ 之后的部分存放（如 original/abc.jpg），与具体的目标路径无关。
+保存时复制一份刚写出的文件，而不是硬链接：命中时要更新缓存文件的 mtime（淘汰依据），
+与媒体库中的图片共用 inode 会改动库文件的 mtime，导致 Jellyfin 重新扫描。
+"""
+from common_imports import *
+import shutil
+import stat
+import threading
+
+from settings import load_settings
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.path.join("configs", "image_cache")
+_TMDB_IMAGE_PREFIX = "https://image.tmdb.org/t/p/"
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def _cache_settings():
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_settings()["cache"]
+    return _settings
+
+
+def enabled():
+    return bool(_cache_settings().get("image_cache", True))
+
+
+def cache_key(url):
+    """图片 URL 对应的缓存相对路径；不是 TMDB 图片地址时返回 None（不缓存）。"""
+    if not url or not url.startswith(_TMDB_IMAGE_PREFIX):
+        return None
+    return safe_relpath(url[len(_TMDB_IMAGE_PREFIX):].split("?", 1)[0])
+
+
+def safe_relpath(rel):
+    """规范化缓存内的相对路径，拒绝绝对路径和 ..（导入缓存包时同样使用）。"""
+    rel = os.path.normpath(rel.replace("\\", "/")).replace("\\", "/")
+    if not rel or rel == "." or rel.startswith("/") or rel.split("/")[0] == ".." or os.path.isabs(rel):
+        return None
+    return rel
+
+
+def cache_path(key):
+    return os.path.join(IMAGE_CACHE_DIR, *key.split("/"))
+
+
+def lookup(url):
+    """已缓存时返回缓存文件路径，否则返回 None。"""
+    key = cache_key(url) if enabled() else None
+    if not key:
+        return None
+    path = cache_path(key)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    # 记录最近使用时间，淘汰时按修改时间从旧到新删除；
+    # 早期版本以硬链接存入的文件与媒体库共用 inode，不更新，以免改动库文件的 mtime
+    if st.st_nlink == 1:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return path
+
+
+def iter_file(path, chunk_size=1024 * 1024):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def store(src_path, url):
+    """把刚下载好的 src_path 放进缓存（已缓存时跳过），失败只记日志。"""
+    key = cache_key(url) if enabled() else None
+    if not key:
+        return
+    path = cache_path(key)
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"写入图片缓存失败（{key}）：{e}")
+
+
+def iter_entries():
+    """产出 (缓存相对路径, 文件路径, 大小)。"""
+    if not os.path.isdir(IMAGE_CACHE_DIR):
+        return
+    for root, _, files in os.walk(IMAGE_CACHE_DIR):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            yield os.path.relpath(path, IMAGE_CACHE_DIR).replace(os.sep, "/"), path, size
+
+
+def usage():
+    files = total = 0
+    for _, _, size in iter_entries():
+        files += 1
+        total += size
+    return {"files": files, "bytes": total}
+
+
+def prune(max_bytes=None):
+    """缓存超过容量上限时按最近使用时间从旧到新删除，返回删除的文件数。"""
+    if max_bytes is None:
+        max_bytes = int(_cache_settings().get("image_max_bytes", 0) or 0)
+    if max_bytes <= 0:
+        return 0
+    entries = []
+    total = 0
+    for _, path, size in iter_entries():
+        try:
+            entries.append((os.path.getmtime(path), path, size))
+        except OSError:
+            continue
+        total += size
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        logger.info(f"图片缓存超出容量，已删除 {removed} 个最久未用的文件")
+    return removed
@@ -0,0 +1,234 @@
+"""
+按路径立即处理，供下载工具在文件完成后回调：把给定的源文件（或目录）对应到所属配置的路径映射，
+直接对这些文件调用 process_single_file，不遍历整个源目录，处理完成后返回生成的文件和各阶段耗时。
+
+    python ingest.py /downloads/剧集/某剧/S01E02.mkv                         # 在本进程内处理
+    python ingest.py --server http://localhost:5001 --token xxx PATH ...     # 交给运行中的服务（POST /ingest）
+    python ingest.py --json - PATH                                           # 输出 JSON 报告（- 表示标准输出）
+
+与 cli.py 一样，模块顶层只导入标准库里的轻量模块，处理流程在用到时才导入。
+退出码：0 全部成功，1 有路径不属于任何启用的配置，2 有文件处理失败。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Ingest-Token"
+
+
+class StageTimes:
+    """
+    在内存中按文件累计各阶段耗时：实现 tracing.Tracer 的 write 接口，
+    交给 tracing.trace_file 后，process_single_file 中各 _stage 的 span 都记到这里。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def write(self, record):
+        if record["stage"] == "file":
+            return
+        with self._lock:
+            stages = self._files.setdefault(record["file"], {})
+            stages[record["stage"]] = round(stages.get(record["stage"], 0) + record["duration"], 4)
+
+    def stages(self, file_path):
+        with self._lock:
+            return dict(self._files.get(file_path, {}))
+
+
+def resolve(paths, configs):
+    """
+    把路径对应到启用的配置，返回 (待处理项列表, 未匹配列表)。
+    待处理项为 (源文件, 配置, 相对目录, 目标路径, 租约键)，目录只展开该目录本身；
+    租约键与 process_movies 多节点模式下的一致；未匹配项为 {"path", "message"}。
+    """
+    from config_store import media_suffixes
+    from movie_processor import cluster_key
+
+    configs = [c for c in configs if c.get("enabled", True)]
+    items, unmatched = [], []
+    for path in paths:
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            unmatched.append({"path": path, "message": "路径不存在"})
+            continue
+        found = None
+        for cfg in configs:
+            for index, m in enumerate(cfg.get("paths", [])):
+                src, tgt = m.get("source"), m.get("target")
+                if not src or not tgt:
+                    continue
+                src = os.path.abspath(src)
+                if path == src or path.startswith(src + os.sep):
+                    found = (cfg, src, tgt, index)
+                    break
+            if found:
+                break
+        if not found:
+            unmatched.append({"path": path, "message": "不在任何启用配置的源目录下"})
+            continue
+        cfg, src, tgt, index = found
+        suffixes = media_suffixes(cfg)
+        if os.path.isfile(path):
+            files = [path] if os.path.splitext(path)[1].lower() in suffixes else []
+        else:
+            files = [os.path.join(root, f) for root, _, names in os.walk(path)
+                     for f in sorted(names) if os.path.splitext(f)[1].lower() in suffixes]
+        if not files:
+            unmatched.append({"path": path, "message": "没有匹配配置后缀的媒体文件"})
+            continue
+        for f in files:
+            key = cluster_key(cfg.get("name", "未知"), index, os.path.relpath(f, src))
+            items.append((f, cfg, os.path.relpath(os.path.dirname(f), src), tgt, key))
+    return items, unmatched
+
+
+def ingest(paths, configs, progress_callback=None):
+    """
+    立即处理 paths（文件以手动任务的优先级提交到共享处理队列，各配置并发数不超过 max_threads），
+    返回报告 {"files": [...], "unmatched": [...], "total", "success", "failed", "elapsed"}。
+    progress_callback 的约定与 process_movies 相同。
+    """
+    from artwork import create_policy
+    from cluster import join_cluster
+    from movie_processor import FILES_TOTAL, load_processed_set, process_file
+    from work_queue import INTERACTIVE, get_work_queue
+    from write_guard import WriteStats
+    import tracing
+
+    started = time.perf_counter()
+    items, unmatched = resolve(paths, configs)
+    if progress_callback and items:
+        progress_callback("discovered", len(items))
+    processed_set = load_processed_set()
+    write_stats = WriteStats()
+    timer = StageTimes()
+    results = [None] * len(items)
+    policies = {} # 配置名 -> 图片策略（带宽上限按配置计）
+    for _, cfg, _, _, _ in items:
+        policies.setdefault(cfg.get("name", "未知"), create_policy(cfg))
+
+    nodes = {} # 配置名 -> 多节点模式下本节点的 ClusterNode（未启用时为 None）
+
+    def run_one(index, file_path, cfg, rel_dir, target_dir, key):
+        outputs = []
+        start = time.perf_counter()
+        node = nodes[cfg.get("name", "未知")]
+        try:
+            # 与 process_movies 相同：多节点模式下先领取租约，按内容指纹查重，再处理
+            with tracing.trace_file(timer, file_path):
+                result = process_file(file_path, cfg, rel_dir, target_dir, processed_set, node,
+                                      key if node else None, require_owner=False, write_stats=write_stats,
+                                      outputs=outputs, artwork=policies[cfg.get("name", "未知")])
+            success, msg = result or (True, "其他节点正在处理或已处理该文件")
+        except Exception as e:
+            success, msg = False, str(e)
+        config_name = cfg.get("name", "未知")
+        FILES_TOTAL.inc(config=config_name, result="success" if success else "failed")
+        results[index] = {"path": file_path, "config": config_name, "success": success, "message": msg,
+                          "created": outputs, "elapsed": round(time.perf_counter() - start, 3),
+                          "stages": timer.stages(file_path)}
+        if progress_callback:
+            progress_callback("update", 1, success, None if success else {"file": file_path, "message": msg})
+
+    queue = get_work_queue()
+    by_config = {}
+    for index, item in enumerate(items):
+        by_config.setdefault(item[1].get("name", "未知"), []).append((index, *item))
+    with ExitStack() as stack: # 退出时等待各配置提交的文件处理完，再注销集群节点
+        for config_name, group in by_config.items():
+            node = join_cluster(config_name)
+            nodes[config_name] = stack.enter_context(node) if node else None
+            lane = stack.enter_context(queue.lane(config_name, group[0][2].get("max_threads", 4)))
+            for item in group:
+                lane.submit(INTERACTIVE, run_one, *item)
+
+    if progress_callback:
+        writes = write_stats.as_dict()
+        for policy in policies.values():
+            for key, value in policy.as_dict().items():
+                writes[key] = writes.get(key, 0) + value
+        progress_callback("write_stats", writes)
+        progress_callback("complete", 0)
+    files = [r for r in results if r]
+    success = sum(1 for r in files if r["success"])
+    for r in files:
+        logger.info(f"[配置:{r['config']}] 立即处理{'完成' if r['success'] else '失败'}（{r['elapsed']}s）："
+                    f"{r['path']}{'' if r['success'] else '，' + r['message']}")
+    return {
+        "files": files,
+        "unmatched": unmatched,
+        "total": len(files),
+        "success": success,
+        "failed": len(files) - success,
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+
+
+def post(server, token, paths, timeout=None):
+    """通过运行中的服务处理：POST {server}/ingest，返回 (HTTP 状态码, 响应 JSON)。"""
+    import requests
+
+    data = {"paths": [os.path.abspath(p) for p in paths]}
+    if timeout:
+        data["wait"] = timeout
+    r = requests.post(server.rstrip("/") + "/ingest", json=data, headers={TOKEN_HEADER: token or ""},
+                      timeout=(10, (timeout or 600) + 30))
+    try:
+        return r.status_code, r.json()
+    except ValueError:
+        return r.status_code, {"message": r.text}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="源文件或目录（须在某个启用配置的源目录下）")
+    parser.add_argument("--server", help="交给该地址的服务处理，如 http://localhost:5001；缺省在本进程内处理")
+    parser.add_argument("--token", default=os.environ.get("INGEST_TOKEN"), help="服务的 ingest 令牌（缺省取 INGEST_TOKEN）")
+    parser.add_argument("--wait", type=float, help="--server 时最多等待处理完成的秒数")
+    parser.add_argument("--json", metavar="FILE", help="把报告以 JSON 写入文件，- 表示标准输出")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每个文件的日志")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.server:
+        status, report = post(args.server, args.token, args.paths, args.wait)
+        if status != 200:
+            print(f"服务返回 {status}：{report.get('message', '')}", file=sys.stderr)
+            return 1
+    else:
+        from config_store import load_config
+        report = ingest(args.paths, load_config())
+
+    if args.json == "-":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        for r in report["files"]:
+            state = "成功" if r["success"] else f"失败：{r['message']}"
+            print(f"{r['path']}：{state}，耗时 {r['elapsed']}s")
+            for created in r["created"]:
+                print(f"  -> {created}")
+    for u in report["unmatched"]:
+        print(f"{u['path']}：{u['message']}", file=sys.stderr)
+    if report["unmatched"]:
+        return 1
+    if report["failed"]:
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+from common_imports import *
+import threading
+import time
+import uuid
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 保留的已结束任务数量，超过后丢弃最早的
+MAX_FINISHED_JOBS = 50
+# 每个任务在内存中保留的最近错误明细条数（环形缓冲区），/progress 也只返回这些；更早的错误只计入总数和分类
+ERROR_BUFFER_SIZE = 200
+
+# 错误分类：(分类, 匹配 message 的正则)，按顺序匹配；file 为「全局错误」的归为 job，都不匹配的归为 other
+ERROR_CATEGORIES = (
+    ("parse", re.compile(r"^无法解析文件名")),
+    ("metadata", re.compile(r"^无法获取元数据")),
+    ("tmdb", re.compile(r"TMDB|HTTPError|ConnectionError|Read timed out|Max retries", re.I)),
+    ("filesystem", re.compile(r"\[Errno \d+\]|Permission denied|No such file")),
+    ("path", re.compile(r"^路径不存在|不在任何启用配置的源目录下|没有匹配配置后缀")),
+)
+
+
+def error_category(error_info):
+    """错误信息 {"file", "message"} 所属的分类。"""
+    if error_info.get("file") == "全局错误":
+        return "job"
+    message = str(error_info.get("message", ""))
+    for category, pattern in ERROR_CATEGORIES:
+        if pattern.search(message):
+            return category
+    return "other"
+
+
+class Job:
+    """
+    一次处理任务（手动执行全部、单个配置或定时任务）的进度状态。
+    计数器的所有修改都在锁内完成，可被多个工作线程的回调并发调用。
+    后台执行进程中的 Job 由 JobRegistry 定期写入 JobStore；Web 进程读到的是 Job.from_row 还原的快照。
+    """
+
+    def __init__(self, name, kind, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.name = name
+        self.kind = kind # run_all / run_config / scheduled
+        self.status = "pending" # pending / queued / running / completed / failed
+        self.total = 0
+        self.processed = 0
+        self.success = 0
+        self.failed = 0
+        self.errors = deque(maxlen=ERROR_BUFFER_SIZE) # 最近的错误明细，每条带序号 seq 和分类 category
+        self.error_count = 0 # 错误总数（含已移出缓冲区的）
+        self.error_categories = {} # 分类 -> 错误条数
+        self.write_stats = {"written": 0, "skipped": 0, "bytes_saved": 0} # bytes_saved：图片策略少下载的字节数
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.log_path = None
+        self.version = 0 # 每次变化递增，SSE 据此判断是否需要推送
+        self._persisted_errors = 0 # 序号小于该值的错误已写入存储
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_row(cls, row, errors=None, categories=None):
+        """由 JobStore 中的一行还原任务快照，errors 为已加载的最近错误明细、categories 为分类计数（均可为空）。"""
+        job = cls(row["name"], row["kind"], job_id=row["id"])
+        for key in ("status", "total", "processed", "success", "failed",
+                    "created_at", "started_at", "finished_at", "log_path", "version", "error_count"):
+            setattr(job, key, row[key])
+        job.write_stats = {"written": row["written"], "skipped": row["skipped"], "bytes_saved": row["bytes_saved"]}
+        job.errors.extend(errors or [])
+        job.error_categories = dict(categories or {})
+        job._persisted_errors = row["error_count"]
+        return job
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+            self.version += 1
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+            self.version += 1
+
+    def add_total(self, count):
+        with self._lock:
+            self.total += count
+            self.version += 1
+
+    def record(self, success, error_info=None):
+        with self._lock:
+            self.processed += 1
+            if success:
+                self.success += 1
+            else:
+                self.failed += 1
+                if error_info:
+                    self._append_error(error_info)
+            self.version += 1
+
+    def _append_error(self, error_info):
+        category = error_info.get("category") or error_category(error_info)
+        self.errors.append(dict(error_info, seq=self.error_count, category=category))
+        self.error_count += 1
+        self.error_categories[category] = self.error_categories.get(category, 0) + 1
+
+    def add_error(self, error_info):
+        """记录与具体文件无关的错误（如整个配置执行失败），不计入处理数。"""
+        with self._lock:
+            self._append_error(error_info)
+            self.version += 1
+
+    def add_write_stats(self, stats):
+        with self._lock:
+            for key in ("written", "skipped", "bytes_saved"):
+                self.write_stats[key] += stats.get(key, 0)
+            self.version += 1
+
+    def finish(self, error=None):
+        with self._lock:
+            self.status = "failed" if error else "completed"
+            self.finished_at = time.time()
+            if error:
+                self._append_error({"file": "全局错误", "message": str(error)})
+            self.version += 1
+
+    @property
+    def completed(self):
+        return self.finished_at is not None
+
+    def progress_callback(self, config_name=None):
+        """
+        返回符合 process_movies 回调约定的函数，可在同一任务的多个配置间复用。
+        discovered 事件随扫描进行不断累加总数；config_name 会写入错误信息。
+        """
+        def callback(event, value, success=True, error_info=None):
+            if event == "discovered":
+                self.add_total(value)
+            elif event == "update":
+                if error_info and config_name:
+                    error_info = dict(error_info, config_name=config_name)
+                self.record(success, error_info)
+            elif event == "write_stats":
+                self.add_write_stats(value)
+        return callback
+
+    def to_dict(self, include_errors=True):
+        with self._lock:
+            now = self.finished_at or time.time()
+            elapsed = now - self.started_at if self.started_at else 0
+            throughput = self.processed / elapsed if elapsed > 0 else 0
+            remaining = max(self.total - self.processed, 0)
+            data = {
+                "id": self.id,
+                "name": self.name,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "success": self.success,
+                "failed": self.failed,
+                "completed": self.completed,
+                "error_count": self.error_count,
+                "error_categories": dict(self.error_categories),
+                "write_stats": dict(self.write_stats),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed": round(elapsed, 2),
+                "throughput": round(throughput, 2), # 文件/秒
+                "eta_seconds": round(remaining / throughput) if throughput > 0 and not self.completed else None,
+                "log_path": self.log_path,
+            }
+            if include_errors:
+                data["errors"] = list(self.errors)
+            return data
+
+    def drain(self):
+        """
+        取出当前计数快照、尚未持久化的错误和分类计数，返回 (row, 新错误列表, 分类计数)，供 JobStore 持久化。
+        写入成功后调用 mark_persisted，失败时下次会重新取出这些错误（已移出缓冲区的只保留计数）。
+        """
+        with self._lock:
+            new_errors = [e for e in self.errors if e["seq"] >= self._persisted_errors]
+            row = {
+                "id": self.id,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "success": self.success,
+                "failed": self.failed,
+                "written": self.write_stats["written"],
+                "skipped": self.write_stats["skipped"],
+                "bytes_saved": self.write_stats["bytes_saved"],
+                "error_count": self.error_count,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "log_path": self.log_path,
+                "version": self.version,
+            }
+            categories = dict(self.error_categories)
+        return row, new_errors, categories
+
+    def mark_persisted(self, error_count):
+        with self._lock:
+            self._persisted_errors = max(self._persisted_errors, error_count)
+
+
+class JobRegistry:
+    """
+    后台执行进程内正在运行的任务。进度变化由 flush() 定期批量写入 JobStore，
+    任务结束并写入后即从内存中移除，历史任务只保存在 JobStore 里。
+    """
+
+    def __init__(self, store, log_path=None):
+        self._store = store
+        self._log_path = log_path
+        self._jobs = {}
+        self._flushed = {}
+        self._lock = threading.Lock()
+
+    def create(self, name, kind, payload=None):
+        """创建并登记一个由执行进程自己发起的任务（如定时任务）。"""
+        job = Job(name, kind)
+        job.log_path = self._log_path
+        self._store.insert(job, payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        logger.info(f"创建任务 {job.id}：{name}（{kind}）")
+        return job
+
+    def adopt(self, row):
+        """接管一个从队列中领取的任务。"""
+        job = Job.from_row(row)
+        job.log_path = self._log_path
+        job.version += 1
+        with self._lock:
+            self._jobs[job.id] = job
+        logger.info(f"领取任务 {job.id}：{job.name}（{job.kind}）")
+        return job
+
+    def active(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def flush(self):
+        """把有变化的任务写入 JobStore，已结束的任务写入后移出内存。"""
+        for job in self.active():
+            version = job.version
+            if self._flushed.get(job.id) != version:
+                row, new_errors, categories = job.drain()
+                try:
+                    self._store.save(row, new_errors, categories)
+                    job.mark_persisted(row["error_count"])
+                    self._flushed[job.id] = version
+                except Exception as e:
+                    logger.error(f"写入任务 {job.id} 进度失败：{e}")
+                    continue
+            if job.completed and self._flushed.get(job.id) == job.version:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                self._flushed.pop(job.id, None)
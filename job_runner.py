@@ -0,0 +1,480 @@
+"""
+后台执行进程：唯一负责定时调度和任务执行的进程。
+
+gunicorn 的 Web 工作进程只往 configs/jobs.db 里写入排队任务、读取进度；
+本进程轮询领取排队任务并执行，把进度定期写回同一个数据库，同时按配置运行定时任务。
+通过 configs/runner.lock 文件锁保证同一时间只有一个执行进程。
+
+    python job_runner.py          # 单独启动（gunicorn.conf.py 和 python app.py 会自动拉起）
+"""
+from common_imports import *
+import argparse
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from config_store import CONFIG_FILE, load_config
+from fingerprint_index import get_fingerprint_index
+from ingest import ingest
+from job_registry import JobRegistry
+from job_store import get_job_store
+from log_setup import init_logging
+from metadata_fetcher import check_tmdb_connection
+from movie_processor import process_movies
+import image_cache
+import metrics
+import tracing
+from stats_index import get_stats_index
+from work_queue import get_work_queue
+
+logger = logging.getLogger("job_runner")
+
+LOCK_FILE = os.path.join("configs", "runner.lock")
+POLL_INTERVAL = 0.5 # 领取任务与写回进度的间隔（秒），与 SSE 合并窗口一致
+HEARTBEAT_INTERVAL = 5
+PRUNE_INTERVAL = 3600
+METRICS_INTERVAL = 5 # 指标写入 configs/metrics.prom 的间隔（秒）
+DEFAULT_SCHEDULE_JITTER = 60 # 定时任务的随机启动延迟上限（秒），避免多个配置同时触发
+
+JOBS_TOTAL = metrics.counter("mediatool_jobs_total", "执行完成的任务数（按类型、结果）", ("kind", "status"))
+JOB_SECONDS = metrics.histogram("mediatool_job_seconds", "任务总耗时（秒）", ("kind",),
+                                buckets=(1, 5, 15, 60, 300, 900, 1800, 3600, 7200, 21600))
+
+
+# --- 自定义异常 ---
+class TMDBError(Exception):
+    """Base exception for TMDB related errors."""
+    pass
+
+class TMDBConnectionError(TMDBError):
+    """Raised when connection to TMDB fails."""
+    pass
+
+class TMDBApiKeyMissingError(TMDBError):
+    """Raised when TMDB API Key is missing in config."""
+    pass
+
+
+def check_tmdb_connectivity(configs, task_type="任务"):
+    """
+    检查 TMDB 连接性。
+    遍历配置找到第一个 API Key 并检查连接。
+    成功则正常返回，失败则抛出相应的 TMDBError 异常。
+    """
+    first_api_key = None
+    for cfg in configs:
+        if cfg.get("tmdb_api_key"):
+            first_api_key = cfg["tmdb_api_key"]
+            break
+
+    if first_api_key:
+        logger.info(f"{task_type}：检查 TMDB 连接...")
+        if not check_tmdb_connection(first_api_key):
+            error_msg = f"{task_type}：无法连接到 TMDB，任务已终止。你可以配置hosts或代理以解决问题。"
+            logger.error(error_msg)
+            raise TMDBConnectionError(error_msg) # <--- 抛出连接错误异常
+        else:
+            logger.info(f"{task_type}：TMDB 连接检查通过。")
+            # 成功，不返回任何值 (隐式返回 None)
+    else:
+        error_msg = f"{task_type}：未配置 TMDB API Key，任务终止。"
+        logger.error(error_msg)
+        raise TMDBApiKeyMissingError(error_msg) # <--- 抛出 Key 缺失异常
+
+
+# --- 定时设置与配置互斥 ---
+def schedule_spec(cfg):
+    """配置的定时设置 (cron, 间隔分钟, 抖动秒)；未启用定时时返回 None。schedule_cron 优先于 schedule_interval。"""
+    cron = (cfg.get("schedule_cron") or "").strip()
+    interval = int(cfg.get("schedule_interval") or 0)
+    if not cron and interval <= 0:
+        return None
+    jitter = cfg.get("schedule_jitter")
+    jitter = DEFAULT_SCHEDULE_JITTER if jitter is None or jitter == "" else int(jitter)
+    return cron, interval, max(jitter, 0)
+
+
+_CRON_WEEKDAYS = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+
+def _cron_weekday(token):
+    """crontab 星期字段中的一个值（0-7 或英文缩写）对应的编号，0 / 7 都是周日。"""
+    if token.isdigit() and 0 <= int(token) <= 7:
+        return int(token)
+    if token[:3] in _CRON_WEEKDAYS:
+        return _CRON_WEEKDAYS.index(token[:3])
+    raise ValueError(f"无效的星期：{token}")
+
+
+def cron_day_of_week(field):
+    """
+    把 crontab 的星期字段（列表、范围、步长，按 crontab 编号）展开成 APScheduler 的英文缩写列表：
+    APScheduler 的 0 为周一，直接传数字会错开一天，范围和步长也要按 crontab 的编号展开后再转换。
+    """
+    if field == "*":
+        return field
+    days = set()
+    for part in field.lower().split(","):
+        rng, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step <= 0:
+            raise ValueError(f"无效的步长：{part}")
+        if rng == "*":
+            low, high = 0, 6
+        elif "-" in rng:
+            low, high = (_cron_weekday(t) for t in rng.split("-", 1))
+        else:
+            low = _cron_weekday(rng)
+            high = 7 if "/" in part else low
+        if low > high:
+            raise ValueError(f"无效的星期范围：{part}")
+        days.update(d % 7 for d in range(low, high + 1, step))
+    return ",".join(_CRON_WEEKDAYS[d] for d in sorted(days))
+
+
+def build_trigger(spec):
+    """由 schedule_spec 的结果生成 APScheduler 触发器，cron 表达式无效时抛出 ValueError。"""
+    cron, interval, jitter = spec
+    if cron:
+        fields = cron.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式应为 5 个字段（分 时 日 月 周）：{cron}")
+        minute, hour, day, month, day_of_week = fields
+        return CronTrigger(minute=minute, hour=hour, day=day, month=month, day_of_week=cron_day_of_week(day_of_week),
+                           jitter=jitter or None)
+    return IntervalTrigger(minutes=interval, jitter=jitter or None)
+
+
+_config_locks = {}
+_config_locks_guard = threading.Lock()
+
+
+def config_lock(name):
+    """每个配置一把锁：同一配置同一时间只有一次处理（定时与手动任务共用），避免争抢同一批文件和 TMDB 配额。"""
+    with _config_locks_guard:
+        return _config_locks.setdefault(name, threading.Lock())
+
+
+@contextmanager
+def exclusive_config(name):
+    """手动任务使用：配置正在被其他任务处理时等待其结束，同时把那次运行中排队的文件提升为 interactive。"""
+    lock = config_lock(name)
+    if not lock.acquire(blocking=False):
+        logger.info(f"配置 {name} 正在处理中，等待其结束后再执行")
+        get_work_queue().boost(name)
+        lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# New wrapper to run all configs sequentially with combined progress
+def run_all_configs_sequentially_wrapper(job, **run_opts):
+    """按顺序处理所有配置，并在 job 中报告累积进度；run_opts（tracer / profiler）透传给 process_movies"""
+    job.start()
+    configs = [cfg for cfg in load_config() if cfg.get("enabled", True)]
+    if not configs:
+        logger.info("没有启用的配置，任务跳过。")
+        job.finish()
+        return
+
+    # 各配置只扫描一次源目录，总数随扫描逐步累加
+    for i, cfg in enumerate(configs):
+        config_name = cfg.get("name", f"配置 {i+1}")
+        logger.info(f"开始顺序处理配置 {i+1}/{len(configs)}: {config_name}")
+        cb = job.progress_callback(config_name)
+        try:
+            with exclusive_config(config_name):
+                process_movies(cfg, progress_callback=cb, **run_opts)
+            logger.info(f"配置 '{config_name}' 处理完成。")
+        except Exception as e:
+            logger.error(f"配置 '{config_name}' 执行异常: {e}", exc_info=True)
+            # 配置级错误不是某个文件失败，只记录错误，不计入处理数 / 失败数
+            job.add_error({"file": "全局错误", "message": str(e), "config_name": config_name})
+
+    job.finish()
+    logger.info("所有配置处理完毕。")
+
+
+def run_config_job(job, name, **run_opts):
+    """执行单个配置（按执行时的配置内容，入队后修改的配置同样生效）"""
+    job.start()
+    cfg = next((c for c in load_config() if c.get("name") == name and c.get("enabled", True)), None)
+    if not cfg:
+        job.finish(error=f"未找到启用的配置：{name}")
+        return
+    logger.info(f"开始执行配置：{name}")
+    try:
+        with exclusive_config(name):
+            process_movies(cfg, progress_callback=job.progress_callback(), **run_opts)
+        job.finish()
+    except Exception as e:
+        logger.error(f"执行配置 {name} 时发生错误：{e}", exc_info=True)
+        job.finish(error=e)
+    logger.info(f"配置 {name} 执行完成")
+
+
+def ingest_job(job, paths, store):
+    """立即处理指定路径（POST /ingest），结果报告写入任务存储，供接口返回。"""
+    job.start()
+    report = ingest(paths or [], load_config(), progress_callback=job.progress_callback())
+    store.save_result(job.id, report)
+    for u in report["unmatched"]:
+        job.add_error({"file": u["path"], "message": u["message"]})
+    job.finish()
+
+
+def reconcile_stats_job(job):
+    """全量扫描目标路径，校对统计索引"""
+    job.start()
+    job.set_total(1)
+    get_stats_index().reconcile(load_config())
+    job.record(True)
+    job.finish()
+
+
+class JobRunner:
+    """执行进程主体：领取排队任务、运行定时任务、定期写回进度与心跳。"""
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.store = get_job_store()
+        self.jobs = JobRegistry(self.store, log_path=log_path)
+        self.scheduler = BackgroundScheduler()
+        self._stop = threading.Event()
+        self._config_mtime = None
+        self._schedules = {} # 配置名 -> 已添加的定时设置（schedule_spec）
+
+    # --- 定时任务 ---
+    def run_scheduled_config(self, name):
+        """定时执行单个配置（按执行时的配置内容）。该配置仍在处理时跳过本次，不排队等待。"""
+        cfg = next((c for c in load_config() if c.get("name") == name and c.get("enabled", True)), None)
+        if not cfg:
+            logger.info(f"配置 {name} 不存在或未启用，定时任务跳过。")
+            return
+        lock = config_lock(name)
+        if not lock.acquire(blocking=False):
+            logger.warning(f"配置 {name} 上一次处理尚未结束，本次定时任务跳过。")
+            return
+        try:
+            job = self.jobs.create(f"定时任务：{name}", "scheduled", {"config": name})
+            job.start()
+            try:
+                check_tmdb_connectivity([cfg], task_type="定时任务")
+            except TMDBError as e: # 日志已在 check_tmdb_connectivity 中记录
+                logger.warning(f"定时任务因 TMDB 检查失败而终止: {e}")
+                job.finish(error=e)
+                return
+            logger.info(f"定时任务开始处理配置: {name}")
+            try:
+                process_movies(cfg, progress_callback=job.progress_callback(), scheduled=True)
+                job.finish()
+            except Exception as e:
+                logger.error(f"定时处理配置 '{name}' 时出错: {e}", exc_info=True)
+                job.finish(error=e)
+            logger.info(f"配置 {name} 定时任务执行完毕。")
+        finally:
+            lock.release()
+
+    def apply_schedules(self, configs):
+        """
+        按各配置的定时设置增删定时任务：每个配置一个任务，只替换设置有变化的，未变化的不重置计时。
+        max_instances=1 保证同一配置不会重叠执行，coalesce 把错过的多次触发合并成一次。
+        """
+        wanted = {}
+        for cfg in configs:
+            if cfg.get("enabled", True) and cfg.get("name"):
+                try:
+                    spec = schedule_spec(cfg)
+                except (TypeError, ValueError) as e:
+                    logger.error(f"配置 {cfg['name']} 的定时设置无效：{e}")
+                    continue
+                if spec:
+                    wanted[cfg["name"]] = spec
+
+        for name, spec in list(self._schedules.items()):
+            if wanted.get(name) != spec:
+                self.scheduler.remove_job(f"config:{name}")
+                del self._schedules[name]
+                logger.info(f"配置 {name} 的定时任务已移除。")
+
+        for name, spec in wanted.items():
+            if name in self._schedules:
+                continue
+            try:
+                trigger = build_trigger(spec)
+            except ValueError as e:
+                logger.error(f"配置 {name} 的定时设置无效：{e}")
+                continue
+            self.scheduler.add_job(self.run_scheduled_config, trigger, args=(name,), id=f"config:{name}",
+                                   name=f"定时任务：{name}", max_instances=1, coalesce=True,
+                                   misfire_grace_time=None, replace_existing=True)
+            self._schedules[name] = spec
+            cron, interval, jitter = spec
+            when = f"cron「{cron}」" if cron else f"每 {interval} 分钟"
+            logger.info(f"配置 {name} 的定时任务已启动：{when}，随机延迟最多 {jitter} 秒。")
+
+    def reload_schedule_if_changed(self):
+        """Web 进程保存配置后 config.json 的修改时间会变化，据此重新加载定时任务。"""
+        try:
+            mtime = os.path.getmtime(CONFIG_FILE)
+        except OSError:
+            mtime = None
+        if mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+        self.apply_schedules(load_config())
+
+    # --- 排队任务 ---
+    def _execute(self, job, payload):
+        # 按任务开启的追踪 / 性能采样，结果文件以任务 ID 命名
+        tracer = tracing.Tracer(tracing.trace_path(job.id), run=job.id) if payload.get("trace") else None
+        profiler = tracing.RunProfiler() if payload.get("profile") else None
+        if profiler:
+            profiler.start()
+        try:
+            if job.kind == "run_all":
+                run_all_configs_sequentially_wrapper(job, tracer=tracer, profiler=profiler)
+            elif job.kind == "run_config":
+                run_config_job(job, payload.get("config"), tracer=tracer, profiler=profiler)
+            elif job.kind == "ingest":
+                ingest_job(job, payload.get("paths"), self.store)
+            elif job.kind == "reconcile_stats":
+                reconcile_stats_job(job)
+            else:
+                job.finish(error=f"未知的任务类型：{job.kind}")
+        except Exception as e:
+            logger.error(f"任务 {job.id} 执行异常：{e}", exc_info=True)
+            if not job.completed:
+                job.finish(error=e)
+        finally:
+            if tracer:
+                tracer.close()
+            if profiler:
+                profiler.stop(tracing.profile_path(job.id))
+        JOBS_TOTAL.inc(kind=job.kind, status=job.status)
+        if job.started_at and job.finished_at:
+            JOB_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind)
+
+    def dispatch_queued(self):
+        """领取所有排队任务，各自在独立线程中执行（与之前手动任务各开一个线程的行为一致）。"""
+        while True:
+            row = self.store.claim_next()
+            if not row:
+                return
+            job = self.jobs.adopt(row)
+            threading.Thread(target=self._execute, args=(job, row["payload"]),
+                             name=f"job-{job.id}", daemon=True).start()
+
+    # --- 主循环 ---
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self, parent_pid=None):
+        self.store.fail_interrupted("后台执行进程重启，任务被中断")
+        self.store.prune()
+        if get_stats_index().summary()["reconciled_at"] is None:
+            # 首次启动（或从旧版本升级）时统计索引为空，先全量扫描一次
+            self.store.enqueue("统计索引校对", "reconcile_stats")
+        self.scheduler.start()
+        last_heartbeat = last_prune = last_metrics = 0
+        logger.info(f"后台执行进程已启动，PID：{os.getpid()}")
+
+        while not self._stop.is_set():
+            now = time.time()
+            try:
+                if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    self.store.heartbeat(os.getpid(), self.log_path)
+                    last_heartbeat = now
+                if now - last_metrics >= METRICS_INTERVAL:
+                    metrics.dump()
+                    last_metrics = now
+                if now - last_prune >= PRUNE_INTERVAL:
+                    self.store.prune()
+                    image_cache.prune()
+                    get_fingerprint_index().prune()
+                    last_prune = now
+                self.reload_schedule_if_changed()
+                self.dispatch_queued()
+                self.jobs.flush()
+            except Exception as e:
+                logger.error(f"执行进程主循环出错：{e}", exc_info=True)
+            # 由 gunicorn / app.py 拉起时，父进程退出后随之退出，避免遗留孤儿进程
+            if parent_pid and os.getppid() != parent_pid:
+                logger.warning("父进程已退出，后台执行进程随之退出")
+                break
+            self._stop.wait(POLL_INTERVAL)
+
+        self.scheduler.shutdown(wait=False)
+        for job in self.jobs.active():
+            if not job.completed:
+                job.finish(error="后台执行进程已退出，任务被中断")
+        self.jobs.flush()
+        metrics.dump()
+        logger.info("后台执行进程已退出")
+
+
+def _acquire_lock():
+    """获取单实例文件锁，已有执行进程持有时返回 None。锁随进程退出自动释放。"""
+    os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+    lock_file = open(LOCK_FILE, "a+")
+    try:
+        import fcntl
+    except ImportError: # Windows 下不做单实例检查
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+def spawn_runner():
+    """以子进程方式启动执行进程（已有执行进程在运行时，新进程拿不到锁会自行退出）。"""
+    script = os.path.abspath(__file__)
+    return subprocess.Popen([sys.executable, script, "--parent-pid", str(os.getpid())])
+
+
+def stop_runner(proc, timeout=30):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parent-pid", type=int, help="父进程 PID，父进程退出后执行进程随之退出")
+    args = parser.parse_args(argv)
+
+    lock = _acquire_lock()
+    if lock is None:
+        print("已有后台执行进程在运行，退出。")
+        return 0
+
+    log_path = init_logging("job_runner")
+    runner = JobRunner(log_path)
+    signal.signal(signal.SIGTERM, runner.stop)
+    signal.signal(signal.SIGINT, runner.stop)
+    runner.run(parent_pid=args.parent_pid)
+    lock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
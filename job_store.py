@@ -0,0 +1,303 @@
+from common_imports import *
+import threading
+import time
+import uuid
+
+from db_utils import add_columns, open_db
+from job_registry import ERROR_BUFFER_SIZE, Job, MAX_FINISHED_JOBS, error_category
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.path.join("configs", "jobs.db")
+
+# 执行进程心跳超过该秒数未更新，即认为执行进程不在运行
+RUNNER_STALE_SECONDS = 15
+# 每个任务最多保存的错误明细条数，超过后删除最早的（分类计数不受影响）
+MAX_STORED_ERRORS = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    success INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    written INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    bytes_saved INTEGER NOT NULL DEFAULT 0,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    log_path TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_errors (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+-- 各任务按分类统计的错误条数（含明细已被删除的错误）
+CREATE TABLE IF NOT EXISTS job_error_categories (
+    job_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (job_id, category)
+);
+-- 任务的结果报告（目前只有立即处理 ingest 任务写入：生成的文件与耗时）
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+-- 后台执行进程的心跳，只有一行
+CREATE TABLE IF NOT EXISTS runner (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER,
+    heartbeat REAL,
+    log_path TEXT
+);
+"""
+
+_COLUMNS = ("id", "name", "kind", "payload", "status", "total", "processed", "success", "failed",
+            "written", "skipped", "bytes_saved", "error_count", "created_at", "started_at", "finished_at", "log_path", "version")
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+
+
+class JobStore:
+    """
+    Web 进程与后台执行进程共享的任务状态（SQLite，configs/jobs.db）。
+    - Web 进程：enqueue 入队，load / list / errors_since / errors 读取进度与错误明细
+    - 执行进程：claim_next 领取队列中的任务，save 写回进度，heartbeat 上报存活
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+        add_columns(self._conn, "jobs", {"bytes_saved": "INTEGER NOT NULL DEFAULT 0"}) # 早期版本创建的 jobs.db
+
+    @staticmethod
+    def _to_row(values):
+        row = dict(zip(_COLUMNS, values))
+        row["payload"] = json.loads(row["payload"]) if row["payload"] else {}
+        return row
+
+    def enqueue(self, name, kind, payload=None):
+        """新建一个排队中的任务，返回任务 ID。"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, name, kind, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, name, kind, json.dumps(payload or {}, ensure_ascii=False), time.time()))
+            self._conn.commit()
+        logger.info(f"任务已入队 {job_id}：{name}（{kind}）")
+        return job_id
+
+    def insert(self, job, payload=None):
+        """写入一个由执行进程直接创建的任务（不经过队列）。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, name, kind, payload, status, created_at, log_path) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.name, job.kind, json.dumps(payload or {}, ensure_ascii=False),
+                 job.status, job.created_at, job.log_path))
+            self._conn.commit()
+
+    def claim_next(self):
+        """领取最早入队的任务并标记为 running，没有排队任务时返回 None。"""
+        with self._lock:
+            values = self._conn.execute(
+                f"{_SELECT} WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if not values:
+                return None
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, version = version + 1 "
+                "WHERE id = ? AND status = 'queued'", (time.time(), values[0]))
+            self._conn.commit()
+            if cur.rowcount != 1:
+                return None
+            values = self._conn.execute(f"{_SELECT} WHERE id = ?", (values[0],)).fetchone()
+        return self._to_row(values)
+
+    def save(self, row, new_errors, categories):
+        """写回 Job.drain() 取出的进度快照、新增错误与分类计数，每个任务只保留最近 MAX_STORED_ERRORS 条明细。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = :status, total = :total, processed = :processed, success = :success, "
+                "failed = :failed, written = :written, skipped = :skipped, bytes_saved = :bytes_saved, error_count = :error_count, "
+                "started_at = :started_at, finished_at = :finished_at, log_path = :log_path, version = :version "
+                "WHERE id = :id", row)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_errors (job_id, seq, data) VALUES (?, ?, ?)",
+                [(row["id"], e["seq"], json.dumps(e, ensure_ascii=False)) for e in new_errors])
+            if row["error_count"] > MAX_STORED_ERRORS:
+                self._conn.execute("DELETE FROM job_errors WHERE job_id = ? AND seq < ?",
+                                   (row["id"], row["error_count"] - MAX_STORED_ERRORS))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_error_categories (job_id, category, count) VALUES (?, ?, ?)",
+                [(row["id"], category, count) for category, count in categories.items()])
+            self._conn.commit()
+
+    def load(self, job_id, include_errors=False):
+        """读取任务快照（Job 对象），不存在时返回 None。"""
+        with self._lock:
+            values = self._conn.execute(f"{_SELECT} WHERE id = ?", (job_id,)).fetchone()
+        if not values:
+            return None
+        return self._snapshot(self._to_row(values), include_errors)
+
+    def latest(self, include_errors=False):
+        with self._lock:
+            values = self._conn.execute(f"{_SELECT} ORDER BY created_at DESC LIMIT 1").fetchone()
+        if not values:
+            return None
+        return self._snapshot(self._to_row(values), include_errors)
+
+    def _snapshot(self, row, include_errors):
+        """还原任务快照：include_errors 时带上最近 ERROR_BUFFER_SIZE 条错误明细。"""
+        errors = None
+        if include_errors:
+            errors = self.errors_since(row["id"], max(row["error_count"] - ERROR_BUFFER_SIZE, 0))
+        return Job.from_row(row, errors, self.error_categories([row["id"]]).get(row["id"]))
+
+    def list(self, limit=MAX_FINISHED_JOBS):
+        """最近的任务快照（不含错误明细），最新的在前。"""
+        with self._lock:
+            rows = [self._to_row(values) for values in
+                    self._conn.execute(f"{_SELECT} ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()]
+        categories = self.error_categories([row["id"] for row in rows])
+        return [Job.from_row(row, categories=categories.get(row["id"])) for row in rows]
+
+    def error_categories(self, job_ids):
+        """{任务 ID: {分类: 条数}}"""
+        result = {}
+        if not job_ids:
+            return result
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id, category, count FROM job_error_categories "
+                f"WHERE job_id IN ({', '.join('?' * len(job_ids))})", list(job_ids)).fetchall()
+        for job_id, category, count in rows:
+            result.setdefault(job_id, {})[category] = count
+        return result
+
+    @staticmethod
+    def _to_error(seq, data):
+        error = json.loads(data)
+        error["seq"] = seq
+        if "category" not in error: # 旧版本写入的错误没有分类
+            error["category"] = error_category(error)
+        return error
+
+    def errors_since(self, job_id, start):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_errors WHERE job_id = ? AND seq >= ? ORDER BY seq",
+                (job_id, start)).fetchall()
+        return [self._to_error(*r) for r in rows]
+
+    def errors(self, job_id, limit=100, offset=0, category=None, config_name=None, query=None):
+        """
+        分页查询任务保存的错误明细（新的在前），可按分类、配置名筛选，query 在文件路径和错误信息中查找。
+        返回 {"total": 符合条件的条数, "items": [...]}。
+        """
+        where, params = ["job_id = ?"], [job_id]
+        if category:
+            where.append("json_extract(data, '$.category') = ?")
+            params.append(category)
+        if config_name:
+            where.append("json_extract(data, '$.config_name') = ?")
+            params.append(config_name)
+        if query:
+            where.append("(instr(json_extract(data, '$.file'), ?) > 0 OR instr(json_extract(data, '$.message'), ?) > 0)")
+            params += [query, query]
+        clause = " AND ".join(where)
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM job_errors WHERE {clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT seq, data FROM job_errors WHERE {clause} ORDER BY seq DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return {"total": total, "items": [self._to_error(*r) for r in rows]}
+
+    def save_result(self, job_id, result):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO job_results (job_id, data) VALUES (?, ?)",
+                               (job_id, json.dumps(result, ensure_ascii=False)))
+            self._conn.commit()
+
+    def result(self, job_id):
+        """任务的结果报告，没有时返回 None。"""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM job_results WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def fail_interrupted(self, message):
+        """执行进程启动时调用：上次异常退出时仍处于 running 的任务标记为失败。"""
+        now = time.time()
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute("SELECT id FROM jobs WHERE status = 'running'").fetchall()]
+            for job_id in ids:
+                seq = self._conn.execute("SELECT error_count FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+                error = {"file": "全局错误", "message": message, "seq": seq, "category": "job"}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO job_errors (job_id, seq, data) VALUES (?, ?, ?)",
+                    (job_id, seq, json.dumps(error, ensure_ascii=False)))
+                self._conn.execute(
+                    "INSERT INTO job_error_categories (job_id, category, count) VALUES (?, 'job', 1) "
+                    "ON CONFLICT (job_id, category) DO UPDATE SET count = count + 1", (job_id,))
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, error_count = error_count + 1, "
+                    "version = version + 1 WHERE id = ?", (now, job_id))
+            self._conn.commit()
+        if ids:
+            logger.warning(f"{len(ids)} 个任务在上次执行进程退出时中断，已标记为失败")
+        return len(ids)
+
+    def prune(self, keep=MAX_FINISHED_JOBS):
+        """只保留最近 keep 个已结束的任务及其错误明细。"""
+        with self._lock:
+            old = [r[0] for r in self._conn.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                (keep,)).fetchall()]
+            for job_id in old:
+                self._conn.execute("DELETE FROM job_errors WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM job_error_categories WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def heartbeat(self, pid, log_path):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runner (id, pid, heartbeat, log_path) VALUES (1, ?, ?, ?)",
+                (pid, time.time(), log_path))
+            self._conn.commit()
+
+    def runner_status(self):
+        """返回执行进程状态 {"pid", "heartbeat", "log_path", "alive"}，从未运行过时返回 None。"""
+        with self._lock:
+            values = self._conn.execute("SELECT pid, heartbeat, log_path FROM runner WHERE id = 1").fetchone()
+        if not values:
+            return None
+        pid, heartbeat, log_path = values
+        return {"pid": pid, "heartbeat": heartbeat, "log_path": log_path,
+                "alive": time.time() - (heartbeat or 0) < RUNNER_STALE_SECONDS}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """进程内共享的 JobStore 实例（首次使用时创建）。"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore()
+    return _store
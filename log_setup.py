@@ -0,0 +1,121 @@
+from common_imports import *
+import atexit
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from settings import load_settings
+
+LOG_DIR = "logs"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class PerFileLogFilter(logging.Filter):
+    """
+    批量处理时对逐文件日志限流：只作用于 per_file_loggers 中的模块、且级别低于 WARNING 的记录。
+    - rate：令牌桶，每秒最多 per_file_rate 条
+    - sample：每 sample_every 条保留 1 条
+    被丢弃的条数会附在下一条放行的日志末尾，警告和错误始终输出。
+    """
+
+    def __init__(self, loggers, mode="rate", rate=20, sample_every=10):
+        super().__init__()
+        self.prefixes = tuple(loggers)
+        self.mode = mode
+        self.rate = max(float(rate), 0.1)
+        self.sample_every = max(int(sample_every), 1)
+        self._tokens = self.rate
+        self._last = time.monotonic()
+        self._seen = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def _applies(self, record):
+        return record.levelno < logging.WARNING and any(
+            record.name == p or record.name.startswith(p + ".") for p in self.prefixes)
+
+    def _allow(self):
+        if self.mode == "sample":
+            self._seen += 1
+            return self._seen % self.sample_every == 1 or self.sample_every == 1
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def filter(self, record):
+        if self.mode == "all" or not self._applies(record):
+            return True
+        with self._lock:
+            if not self._allow():
+                self._dropped += 1
+                return False
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            record.msg = f"{record.getMessage()}（此前省略 {dropped} 条逐文件日志）"
+            record.args = None
+        return True
+
+
+def _file_handler(path, cfg):
+    if cfg.get("rotation") == "time":
+        return TimedRotatingFileHandler(path, when=cfg.get("when", "midnight"),
+                                        backupCount=int(cfg.get("backup_count", 7)), encoding="utf-8")
+    return RotatingFileHandler(path, maxBytes=int(cfg.get("max_bytes", 10 * 1024 * 1024)),
+                               backupCount=int(cfg.get("backup_count", 7)), encoding="utf-8")
+
+
+def init_logging(prefix=None):
+    """
+    初始化根日志。prefix 不为空时同时写入 logs/<prefix>.log（按大小或时间轮转），返回该路径，否则只输出到控制台并返回 None。
+    业务线程只把日志记录放进队列，控制台和文件的写入由后台 QueueListener 线程完成；
+    级别、轮转、逐文件日志限流读取全局设置（configs/settings.json 的 logging 段）。
+    轮转只在单个进程内安全，所以日志文件由唯一的后台执行进程写入，多个 gunicorn 工作进程只输出到控制台。
+    """
+    global _listener
+    cfg = load_settings()["logging"]
+    handlers = [logging.StreamHandler()]
+    log_filename = None
+    if prefix:
+        if not os.path.exists(LOG_DIR):
+            os.makedirs(LOG_DIR)
+        log_filename = os.path.join(LOG_DIR, f"{prefix}.log")
+        handlers.append(_file_handler(log_filename, cfg))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(PerFileLogFilter(cfg.get("per_file_loggers", []), cfg.get("per_file_mode", "rate"),
+                                             cfg.get("per_file_rate", 20), cfg.get("sample_every", 10)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(str(cfg.get("level", "INFO")).upper())
+    for name, level in (cfg.get("levels") or {}).items():
+        logging.getLogger(name).setLevel(str(level).upper())
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return log_filename
+
+
+def shutdown_logging():
+    """停止后台写日志线程，确保队列中剩余的日志写完。"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
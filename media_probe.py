@@ -0,0 +1,322 @@
+"""
+读取媒体文件的容器头（Matroska/WebM 的 EBML、MP4/MOV 的 box），得到时长、分辨率、编码、音轨与字幕语言，
+写入 NFO 的 <fileinfo><streamdetails>，Jellyfin / Kodi 不必再对每个新条目运行 ffprobe。
+
+纯 Python，不启动子进程：文件以 mmap 方式打开，只按需访问头部元素所在的页
+（MKV 的 Info / Tracks 通常在前几 KB；MP4 的 moov 在文件末尾时按 box 大小直接跳过 mdat）。
+不认识的格式或头部损坏时返回 None，不影响处理。
+"""
+from common_imports import *
+import mmap
+import struct
+
+logger = logging.getLogger(__name__)
+
+# --- Matroska / EBML ---
+_EBML, _DOC_TYPE = 0x1A45DFA3, 0x4282
+_SEGMENT = 0x18538067
+_SEEK_HEAD, _SEEK, _SEEK_ID, _SEEK_POSITION = 0x114D9B74, 0x4DBB, 0x53AB, 0x53AC
+_INFO, _TIMECODE_SCALE, _DURATION = 0x1549A966, 0x2AD7B1, 0x4489
+_TRACKS, _TRACK_ENTRY, _TRACK_TYPE, _CODEC_ID = 0x1654AE6B, 0xAE, 0x83, 0x86
+_LANGUAGE, _LANGUAGE_BCP47 = 0x22B59C, 0x22B59D
+_VIDEO, _PIXEL_WIDTH, _PIXEL_HEIGHT, _DISPLAY_WIDTH, _DISPLAY_HEIGHT = 0xE0, 0xB0, 0xBA, 0x54B0, 0x54BA
+_AUDIO, _CHANNELS = 0xE1, 0x9F
+_CLUSTER = 0x1F43B675
+_UNKNOWN_SIZE = -1
+
+_MKV_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_AV1": "av1", "V_VP9": "vp9", "V_VP8": "vp8",
+    "V_MPEG2": "mpeg2video", "V_MPEG4/ISO/ASP": "mpeg4", "V_MS/VFW/FOURCC": "vfw",
+    "A_AAC": "aac", "A_AC3": "ac3", "A_EAC3": "eac3", "A_DTS": "dts", "A_TRUEHD": "truehd", "A_FLAC": "flac",
+    "A_OPUS": "opus", "A_VORBIS": "vorbis", "A_MPEG/L3": "mp3", "A_MPEG/L2": "mp2", "A_PCM/INT/LIT": "pcm",
+    "S_TEXT/UTF8": "srt", "S_TEXT/ASS": "ass", "S_TEXT/SSA": "ssa", "S_HDMV/PGS": "pgssub",
+    "S_VOBSUB": "dvdsub", "S_TEXT/WEBVTT": "webvtt", "S_DVBSUB": "dvbsub",
+}
+_MKV_TRACK_KINDS = {1: "video", 2: "audio", 17: "subtitle"}
+
+# --- MP4 / MOV ---
+_MP4_CODECS = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1", "vp09": "vp9",
+    "mp4v": "mpeg4", "dvh1": "hevc", "dvhe": "hevc",
+    "mp4a": "aac", "ac-3": "ac3", "ec-3": "eac3", "dtsc": "dts", "dtsh": "dts", "dtsl": "dts", "Opus": "opus",
+    "fLaC": "flac", "alac": "alac", ".mp3": "mp3", "mlpa": "truehd",
+    "tx3g": "mov_text", "wvtt": "webvtt", "stpp": "ttml", "c608": "eia_608",
+}
+_MP4_HANDLERS = {"vide": "video", "soun": "audio", "sbtl": "subtitle", "subt": "subtitle", "text": "subtitle",
+                 "clcp": "subtitle"}
+_MP4_CONTAINERS = {"moov", "trak", "mdia", "minf", "stbl"}
+
+
+class _ProbeError(Exception):
+    pass
+
+
+# ---------- EBML ----------
+def _vint(buf, pos, keep_marker):
+    """读取 EBML 变长整数，返回 (值, 新位置)；keep_marker=True 用于元素 ID。"""
+    if pos >= len(buf):
+        raise _ProbeError("EBML 越界")
+    first = buf[pos]
+    if first == 0:
+        raise _ProbeError("EBML 变长整数无效")
+    length = 8 - first.bit_length() + 1
+    if pos + length > len(buf):
+        raise _ProbeError("EBML 越界")
+    value = first if keep_marker else first & (0xFF >> length)
+    all_ones = value == (0xFF >> length)
+    for i in range(1, length):
+        b = buf[pos + i]
+        value = (value << 8) | b
+        all_ones = all_ones and b == 0xFF
+    if not keep_marker and all_ones:
+        return _UNKNOWN_SIZE, pos + length
+    return value, pos + length
+
+
+def _ebml_elements(buf, start, end):
+    """遍历 [start, end) 中的同级元素，产出 (ID, 数据起点, 数据终点)；大小未知的元素延伸到 end。"""
+    pos = start
+    while pos < end:
+        element_id, pos = _vint(buf, pos, True)
+        size, pos = _vint(buf, pos, False)
+        data_end = end if size == _UNKNOWN_SIZE else min(pos + size, end)
+        yield element_id, pos, data_end
+        if size == _UNKNOWN_SIZE:
+            return
+        pos = data_end
+
+
+def _uint(buf, start, end):
+    return int.from_bytes(buf[start:end], "big") if end > start else 0
+
+
+def _float(buf, start, end):
+    if end - start == 4:
+        return struct.unpack(">f", buf[start:end])[0]
+    if end - start == 8:
+        return struct.unpack(">d", buf[start:end])[0]
+    return 0.0
+
+
+def _string(buf, start, end):
+    return bytes(buf[start:end]).split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+def _mkv_track(buf, start, end):
+    track = {}
+    kind = codec = None
+    language, bcp47 = "eng", None # Matroska 规定 Language 缺省为 eng
+    for eid, s, e in _ebml_elements(buf, start, end):
+        if eid == _TRACK_TYPE:
+            kind = _MKV_TRACK_KINDS.get(_uint(buf, s, e))
+        elif eid == _CODEC_ID:
+            codec = _string(buf, s, e)
+        elif eid == _LANGUAGE:
+            language = _string(buf, s, e)
+        elif eid == _LANGUAGE_BCP47:
+            bcp47 = _string(buf, s, e)
+        elif eid == _VIDEO:
+            display = {}
+            for vid, vs, ve in _ebml_elements(buf, s, e):
+                if vid == _PIXEL_WIDTH:
+                    track["width"] = _uint(buf, vs, ve)
+                elif vid == _PIXEL_HEIGHT:
+                    track["height"] = _uint(buf, vs, ve)
+                elif vid == _DISPLAY_WIDTH:
+                    display["width"] = _uint(buf, vs, ve)
+                elif vid == _DISPLAY_HEIGHT:
+                    display["height"] = _uint(buf, vs, ve)
+            if display.get("width") and display.get("height"):
+                track["aspect"] = display["width"] / display["height"]
+        elif eid == _AUDIO:
+            for aid, as_, ae in _ebml_elements(buf, s, e):
+                if aid == _CHANNELS:
+                    track["channels"] = _uint(buf, as_, ae)
+    if not kind:
+        return None, None
+    track["codec"] = _MKV_CODECS.get(codec, (codec or "").split("/")[0].lower()[2:] or None)
+    language = (bcp47 or language or "").split("-")[0]
+    if language and language != "und":
+        track["language"] = language
+    return kind, track
+
+
+def _probe_matroska(buf):
+    element_id, pos = _vint(buf, 0, True)
+    if element_id != _EBML:
+        return None
+    size, pos = _vint(buf, pos, False)
+    doc_type = "matroska"
+    for eid, s, e in _ebml_elements(buf, pos, pos + size):
+        if eid == _DOC_TYPE:
+            doc_type = _string(buf, s, e)
+    pos += size
+    segment_id, pos = _vint(buf, pos, True)
+    if segment_id != _SEGMENT:
+        return None
+    seg_size, seg_start = _vint(buf, pos, False)
+    seg_end = len(buf) if seg_size == _UNKNOWN_SIZE else min(seg_start + seg_size, len(buf))
+
+    result = {"container": doc_type, "duration": None, "video": [], "audio": [], "subtitle": []}
+    found = set()
+    seek_targets = []
+
+    def read_level1(eid, s, e):
+        if eid == _INFO:
+            scale, duration = 1000000, None
+            for iid, is_, ie in _ebml_elements(buf, s, e):
+                if iid == _TIMECODE_SCALE:
+                    scale = _uint(buf, is_, ie) or scale
+                elif iid == _DURATION:
+                    duration = _float(buf, is_, ie)
+            if duration:
+                result["duration"] = duration * scale / 1e9
+            found.add(_INFO)
+        elif eid == _TRACKS:
+            for tid, ts, te in _ebml_elements(buf, s, e):
+                if tid == _TRACK_ENTRY:
+                    kind, track = _mkv_track(buf, ts, te)
+                    if kind:
+                        result[kind].append(track)
+            found.add(_TRACKS)
+        elif eid == _SEEK_HEAD:
+            for sid, ss, se in _ebml_elements(buf, s, e):
+                if sid != _SEEK:
+                    continue
+                target = position = None
+                for kid, ks, ke in _ebml_elements(buf, ss, se):
+                    if kid == _SEEK_ID:
+                        target = _uint(buf, ks, ke)
+                    elif kid == _SEEK_POSITION:
+                        position = _uint(buf, ks, ke)
+                if target in (_INFO, _TRACKS) and position is not None:
+                    seek_targets.append((target, seg_start + position))
+
+    # 顺序读取 Segment 的一级元素，直到遇到第一个 Cluster（媒体数据开始）
+    for eid, s, e in _ebml_elements(buf, seg_start, seg_end):
+        if eid == _CLUSTER:
+            break
+        read_level1(eid, s, e)
+        if {_INFO, _TRACKS} <= found:
+            break
+    # Info / Tracks 不在 Cluster 之前时（少数封装器放在文件末尾），按 SeekHead 跳转
+    for target, offset in seek_targets:
+        if target in found or offset >= seg_end:
+            continue
+        for eid, s, e in _ebml_elements(buf, offset, seg_end):
+            if eid == target:
+                read_level1(eid, s, e)
+            break
+    return result if _TRACKS in found else None
+
+
+# ---------- MP4 ----------
+def _mp4_boxes(buf, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise _ProbeError("MP4 box 大小无效")
+        yield box_type.decode("latin-1"), pos + header, min(pos + size, end)
+        pos += size
+
+
+def _mp4_language(code):
+    if not code or code == 0x7FFF:
+        return None
+    chars = "".join(chr(((code >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+    return chars if chars.isalpha() and chars != "und" else None
+
+
+def _mp4_track(buf, start, end):
+    track = {}
+    handler = language = None
+    stack = [(start, end)]
+    while stack:
+        s0, e0 = stack.pop()
+        for box, s, e in _mp4_boxes(buf, s0, e0):
+            if box in _MP4_CONTAINERS:
+                stack.append((s, e))
+            elif box == "tkhd" and e - s >= 84:
+                offset = 88 if buf[s] == 1 else 76
+                if e - s >= offset + 8:
+                    width, height = struct.unpack_from(">II", buf, s + offset)
+                    if width >> 16 and height >> 16: # 16.16 定点数，显示尺寸
+                        track["aspect"] = width / height
+            elif box == "mdhd":
+                offset = 32 if buf[s] == 1 else 20
+                if e - s >= offset + 2:
+                    language = _mp4_language(struct.unpack_from(">H", buf, s + offset)[0])
+            elif box == "hdlr" and e - s >= 12:
+                handler = bytes(buf[s + 8:s + 12]).decode("latin-1")
+            elif box == "stsd" and e - s >= 16:
+                entry_size, fourcc = struct.unpack_from(">I4s", buf, s + 8)
+                fourcc = fourcc.decode("latin-1")
+                track["codec"] = _MP4_CODECS.get(fourcc, fourcc.strip().lower())
+                entry = s + 8
+                if handler == "vide" and entry + 36 <= e:
+                    track["width"], track["height"] = struct.unpack_from(">HH", buf, entry + 32)
+                elif handler == "soun" and entry + 26 <= e:
+                    track["channels"] = struct.unpack_from(">H", buf, entry + 24)[0]
+    kind = _MP4_HANDLERS.get(handler)
+    if not kind:
+        return None, None
+    if language:
+        track["language"] = language
+    if kind != "video":
+        track.pop("aspect", None)
+    return kind, track
+
+
+def _probe_mp4(buf):
+    if len(buf) < 12 or bytes(buf[4:8]) not in (b"ftyp", b"moov", b"free", b"wide", b"mdat", b"skip"):
+        return None
+    for box, s, e in _mp4_boxes(buf, 0, len(buf)):
+        if box != "moov":
+            continue # mdat 等按 box 大小直接跳过，不读取内容
+        result = {"container": "mp4", "duration": None, "video": [], "audio": [], "subtitle": []}
+        for child, cs, ce in _mp4_boxes(buf, s, e):
+            if child == "mvhd" and ce - cs >= 20:
+                if buf[cs] == 1:
+                    timescale, duration = struct.unpack_from(">IQ", buf, cs + 20)
+                else:
+                    timescale, duration = struct.unpack_from(">II", buf, cs + 12)
+                if timescale and duration not in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                    result["duration"] = duration / timescale
+            elif child == "trak":
+                kind, track = _mp4_track(buf, cs, ce)
+                if kind:
+                    result[kind].append(track)
+        return result
+    return None
+
+
+def probe(path):
+    """
+    读取媒体文件的流信息，返回
+    {"container", "duration"(秒), "video": [{codec, width, height, aspect}], "audio": [{codec, language, channels}],
+     "subtitle": [{codec, language}]}；不支持的格式或解析失败时返回 None。
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < 16:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as buf:
+                    result = _probe_matroska(buf) if buf[:4] == b"\x1a\x45\xdf\xa3" else _probe_mp4(buf)
+    except (OSError, ValueError, struct.error, _ProbeError) as e:
+        logger.debug(f"读取媒体流信息失败（{path}）：{e}")
+        return None
+    if result:
+        for video in result["video"]:
+            if "aspect" not in video and video.get("width") and video.get("height"):
+                video["aspect"] = video["width"] / video["height"]
+    return result
@@ -0,0 +1,88 @@
+from common_imports import *
+import threading
+from collections import OrderedDict
+
+from metadata_record import approx_size
+from settings import load_settings
+
+logger = logging.getLogger(__name__)
+
+MISSING = object() # get() 未命中时的默认返回值（缓存里可能存放 None，表示 TMDB 上查不到）
+
+
+class MetadataCache:
+    """
+    按近似字节数（approx_size）限制容量的 LRU 缓存，取代按条数限制的 lru_cache：
+    一部带 20 位演员的剧和一条空结果占用相差很大，按条数无法控制内存。
+    单条超过上限的不缓存；命中、未命中、淘汰次数见 stats()。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict() # key -> (value, size)，最近使用的在末尾
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._misses += 1
+                return default
+            self._items.move_to_end(key)
+            self._hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = approx_size(key) + approx_size(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                self._rejected += 1
+                return False
+            while self._items and self._bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+            self._items[key] = (value, size)
+            self._bytes += size
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "rejected": self._rejected, # 单条超过上限而未缓存的次数
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    """进程内共享的元数据缓存，容量取全局设置 cache.metadata_max_bytes。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_bytes = int(load_settings()["cache"]["metadata_max_bytes"])
+                _cache = MetadataCache(max_bytes)
+                logger.info(f"元数据缓存容量：{max_bytes / 1024 / 1024:.1f} MiB")
+    return _cache
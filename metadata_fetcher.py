@@ -1,13 +1,123 @@
 from common_imports import *
 
 import requests  # 确保导入 requests
-from functools import lru_cache
+import threading
+import time
+from write_guard import atomic_write_chunks
+from metadata_cache import MISSING, get_metadata_cache
+from metadata_record import MetadataRecord
+from metadata_store import get_store
+from settings import load_settings
+from shared_cache import get_shared_cache
+from artwork import DEFAULT_POLICY, get_download_pool, original_size as artwork_original_size
+import concurrency
+import image_cache
+import metrics
+import tracing
 
 logger = logging.getLogger(__name__)
 
-@lru_cache(maxsize=512)
+TMDB_REQUESTS = metrics.counter("mediatool_tmdb_requests_total", "TMDB 请求数（按接口、HTTP 状态码）", ("endpoint", "status"))
+TMDB_LATENCY = metrics.histogram("mediatool_tmdb_request_seconds", "TMDB 请求耗时（秒，图片为收到响应头的时间）", ("endpoint",))
+DOWNLOAD_BYTES = metrics.counter("mediatool_download_bytes_total", "下载并写入的图片字节数", ("kind",))
+METADATA_SOURCE = metrics.counter("mediatool_metadata_lookups_total", "内存缓存未命中后元数据的来源（本地库 / 共享缓存 / TMDB）",
+                                  ("kind", "source"))
+IMAGE_SOURCE = metrics.counter("mediatool_image_lookups_total", "图片的来源（本地图片缓存 / 共享缓存 / TMDB）", ("source",))
+
+
+def _tmdb_get(endpoint, url, **kwargs):
+    """requests.get 的包装，按接口记录耗时与状态码（网络异常记为 error）。"""
+    start = time.perf_counter()
+    status = "error"
+    tracing.add_http_call()
+    try:
+        resp = requests.get(url, **kwargs)
+        status = str(resp.status_code)
+        return resp
+    finally:
+        TMDB_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        TMDB_REQUESTS.inc(endpoint=endpoint, status=status)
+        concurrency.note_tmdb(status)
+
+
+_max_age = None
+_max_age_lock = threading.Lock()
+
+
+def _metadata_max_age():
+    """本地库中元数据的有效期（秒），0 表示不过期；首次调用时读取全局设置，之后直接返回。"""
+    global _max_age
+    if _max_age is None:
+        with _max_age_lock:
+            if _max_age is None:
+                _max_age = float(load_settings()["cache"].get("metadata_ttl_days", 0) or 0) * 86400
+    return _max_age
+
+
+def _persist(save, *args):
+    """写入本地元数据库（供离线重建 NFO），失败只记日志，不影响主流程。"""
+    try:
+        save(*args)
+    except Exception as e:
+        logger.warning(f"保存元数据到本地数据库失败：{e}")
+
 def fetch_metadata_cached(title, year, api_key, media_type):
-    return fetch_metadata(title, year, api_key, media_type)
+    """
+    带内存缓存的 fetch_metadata，返回只读的 MetadataRecord（查不到时为 None，同样缓存）。
+    同一部剧的各集共享一条记录，单集信息用 with_episode / merge_episode_metadata 叠加，不修改缓存内容。
+    """
+    cache = get_metadata_cache()
+    key = (title, year, api_key, media_type)
+    record = cache.get(key)
+    if record is not MISSING:
+        return record
+    metadata = _lookup_metadata(title, year, api_key, media_type)
+    record = MetadataRecord.from_dict(metadata).show if metadata else None
+    cache.put(key, record)
+    return record
+
+
+def _lookup_metadata(title, year, api_key, media_type):
+    """依次查找本地元数据库（有效期内）、共享缓存、TMDB，后两者的结果保存到本地库。"""
+    store = get_store()
+    try:
+        metadata = store.find_metadata(media_type, title, year, max_age=_metadata_max_age())
+    except Exception as e:
+        logger.warning(f"读取本地元数据库失败：{e}")
+        metadata = None
+    if metadata:
+        METADATA_SOURCE.inc(kind="metadata", source="local")
+        return metadata
+
+    shared = get_shared_cache()
+    metadata = shared.find_metadata(media_type, title, year) if shared else None
+    if metadata:
+        METADATA_SOURCE.inc(kind="metadata", source="shared")
+    else:
+        metadata = fetch_metadata(title, year, api_key, media_type)
+        if not metadata:
+            return None
+        METADATA_SOURCE.inc(kind="metadata", source="tmdb")
+        if shared:
+            shared.publish("metadata", media_type=media_type, title=title, year=year, metadata=metadata)
+    _persist(store.save_metadata, metadata)
+    _persist(store.save_search, media_type, title, year, metadata["tmdbid"])
+    return metadata
+
+def _collect_cache_metrics():
+    stats = get_metadata_cache().stats()
+    return [
+        ("mediatool_metadata_cache_requests_total", "counter", "fetch_metadata_cached 缓存命中 / 未命中次数",
+         [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]),
+        ("mediatool_metadata_cache_evictions_total", "counter", "元数据缓存因超出容量淘汰的条数",
+         [({}, stats["evictions"])]),
+        ("mediatool_metadata_cache_entries", "gauge", "元数据缓存当前条数", [({}, stats["entries"])]),
+        ("mediatool_metadata_cache_bytes", "gauge", "元数据缓存当前近似占用（字节）", [({}, stats["bytes"])]),
+        ("mediatool_metadata_cache_max_bytes", "gauge", "元数据缓存容量上限（字节）", [({}, stats["max_bytes"])]),
+    ]
+
+metrics.register_collector(_collect_cache_metrics)
+
 def check_tmdb_connection(api_key):
     """
     检查与 TMDB 的连接以及 API Key 是否有效。
@@ -20,7 +130,7 @@ def check_tmdb_connection(api_key):
     check_url = "https://api.themoviedb.org/3/configuration"
     params = {"api_key": api_key}
     try:
-        response = requests.get(check_url, params=params, timeout=5) # 设置较短超时
+        response = _tmdb_get("configuration", check_url, params=params, timeout=5) # 设置较短超时
         response.raise_for_status() # 检查 HTTP 错误 (如 401 Unauthorized)
         logger.info("TMDB 连接成功且 API Key 有效。")
         return True
@@ -63,7 +173,7 @@ def fetch_metadata(media_name, year, tmdb_api_key, media_type='movie'):
         # elif year and tmdb_media_type == 'tv':
         #      params["first_air_date_year"] = year
 
-        resp = requests.get(search_url, params=params, timeout=10)
+        resp = _tmdb_get("search", search_url, params=params, timeout=10)
         resp.raise_for_status()
         media_results = resp.json().get("results", [])
         if not media_results:
@@ -92,7 +202,7 @@ def fetch_metadata(media_name, year, tmdb_api_key, media_type='movie'):
     try:
         # 根据 media_type 选择详情 API 端点
         detail_url = f"https://api.themoviedb.org/3/{tmdb_media_type}/{media_id}"
-        detail_resp = requests.get(detail_url, params={"api_key": tmdb_api_key, "language": "zh-CN", "append_to_response": "credits,keywords,videos,translations"}, timeout=10)
+        detail_resp = _tmdb_get("details", detail_url, params={"api_key": tmdb_api_key, "language": "zh-CN", "append_to_response": "credits,keywords,videos,translations"}, timeout=10)
         detail_resp.raise_for_status()
         data = detail_resp.json()
 
@@ -147,7 +257,7 @@ def fetch_metadata(media_name, year, tmdb_api_key, media_type='movie'):
         result["clearlogo_path"] = None
         try:
             images_url = f"https://api.themoviedb.org/3/{tmdb_media_type}/{media_id}/images"
-            images_resp = requests.get(images_url, params={"api_key": tmdb_api_key}, timeout=10)
+            images_resp = _tmdb_get("images", images_url, params={"api_key": tmdb_api_key}, timeout=10)
             images_resp.raise_for_status()
             logos = images_resp.json().get("logos", [])
             for logo in logos:
@@ -203,26 +313,28 @@ def fetch_metadata(media_name, year, tmdb_api_key, media_type='movie'):
 
 # download_poster 函数基本不用改，因为它只依赖 metadata['poster_path']
 # 但可以考虑让 movie_name 参数更通用，比如叫 media_file_stem
-def download_poster(metadata, target_dir, media_file_stem):
+def download_poster(metadata, target_dir, media_file_stem, write_stats=None, artwork=None):
     """
-    下载媒体海报。
+    下载媒体海报（剧集目录的 poster.jpg，尺寸取图片策略中的 tvshow_poster）。
     """
+    artwork = artwork or DEFAULT_POLICY
     poster_path = ""
+    full_url = ""
     try:
         poster_url = metadata.get('poster_path')
-        if poster_url:
-            base_url = "https://image.tmdb.org/t/p/w500" # 可以考虑提供更高分辨率选项 w780, w1280, original
-            full_url = base_url + poster_url
-            response = requests.get(full_url, stream=True, timeout=20) # 增加超时
-            response.raise_for_status() # 检查请求是否成功
+        if poster_url and artwork.wants("tvshow_poster"):
+            full_url = artwork.url("tvshow_poster", poster_url)
 
             # 使用传入的文件名主干来命名海报
             poster_filename = f"{media_file_stem}-poster.jpg"
             poster_path = os.path.join(target_dir, poster_filename)
-            with open(poster_path, 'wb') as poster_file:
-                for chunk in response.iter_content(8192): # 增大 chunk size
-                    poster_file.write(chunk)
+            size = _write_image(full_url, poster_path, "poster", timeout=20, bucket=artwork.bucket) # 增加超时
+            if write_stats:
+                write_stats.record(True, size)
+            _note_saved(artwork, "tvshow_poster", poster_url, size)
             logger.info(f"下载并保存海报：{poster_path}")
+        elif poster_url:
+            artwork.note_omitted("tvshow_poster")
 
     except requests.exceptions.RequestException as e:
          logger.error(f"下载海报网络请求出错 ({full_url}): {e}")
@@ -232,63 +344,128 @@ def download_poster(metadata, target_dir, media_file_stem):
         logger.error(f"下载海报时发生未知错误：{e}")
     return poster_path
 
-def download_images(metadata, dest_dir, base_name_no_ext):
-    media_type = metadata.get("media_type", "movie")
+def _write_image(url, dest_path, kind, timeout=10, bucket=None):
+    """
+    把图片写到 dest_path（临时文件 + 原子替换），依次取自本地图片缓存、共享缓存、TMDB，
+    后两者下载的图片放进本地图片缓存。bucket 为图片策略的带宽限制（只作用于网络下载）。返回写入的字节数。
+    """
+    cached = image_cache.lookup(url)
+    if cached:
+        IMAGE_SOURCE.inc(source="local")
+        size = atomic_write_chunks(dest_path, image_cache.iter_file(cached))
+    else:
+        shared = get_shared_cache()
+        data = shared.image(url) if shared else None
+        if data is not None:
+            IMAGE_SOURCE.inc(source="shared")
+            chunks = (data[i:i + 65536] for i in range(0, len(data), 65536)) if bucket else (data,)
+        else:
+            IMAGE_SOURCE.inc(source="tmdb")
+            r = _tmdb_get("image", url, stream=True, timeout=timeout)
+            r.raise_for_status()
+            chunks = r.iter_content(8192)
+        size = atomic_write_chunks(dest_path, bucket.throttle(chunks) if bucket else chunks)
+        image_cache.store(dest_path, url)
+    DOWNLOAD_BYTES.inc(size, kind=kind)
+    tracing.add_bytes(size)
+    return size
+
+def _note_saved(artwork, kind, image_path, size):
+    """较小尺寸的图片写入后，按 original 的大小统计节省的字节数；original 的大小未知（不在图片缓存中）时不统计。"""
+    if not artwork.measures(kind):
+        return
+    original = artwork_original_size(image_path)
+    if original:
+        artwork.note_saved(kind, original - size)
+
+def download_image(url, dest_path, write_stats=None, timeout=10, bucket=None):
+    """
+    下载图片到 dest_path。目标已存在则跳过（不重复下载也不改动 mtime），
+    否则流式写入临时文件后原子替换。返回是否实际写入。
+    """
+    if os.path.exists(dest_path):
+        if write_stats:
+            write_stats.record(False)
+        return False
+    size = _write_image(url, dest_path, "image", timeout=timeout, bucket=bucket)
+    if write_stats:
+        write_stats.record(True, size)
+    return True
 
-    # 下载 poster（适用于电影和剧集）
-    poster_path = metadata.get("poster_path")
-    if poster_path:
+def download_artwork(kind, image_path, dest_path, artwork=None, write_stats=None, timeout=10):
+    """
+    按图片策略下载一张 TMDB 图片（image_path 为 TMDB 返回的 /xxx.jpg）：该类型未启用时不下载，
+    否则取策略中的尺寸，受带宽上限限制。返回是否实际写入。
+    """
+    artwork = artwork or DEFAULT_POLICY
+    if not artwork.wants(kind):
+        if not os.path.exists(dest_path):
+            artwork.note_omitted(kind)
+        return False
+    if os.path.exists(dest_path):
+        if write_stats:
+            write_stats.record(False)
+        return False
+    size = _write_image(artwork.url(kind, image_path), dest_path, kind, timeout=timeout, bucket=artwork.bucket)
+    if write_stats:
+        write_stats.record(True, size)
+    _note_saved(artwork, kind, image_path, size)
+    return True
+
+# download_images 下载的图片：(类型, metadata 中的字段, 文件名后缀, 是否只用于电影)
+_ARTWORK_FILES = (
+    ("poster", "poster_path", "-poster.jpg", False),
+    ("fanart", "fanart_path", "-fanart.jpg", True),
+    ("clearlogo", "clearlogo_path", "-clearlogo.png", True),
+)
+
+def download_images(metadata, dest_dir, base_name_no_ext, write_stats=None, artwork=None):
+    """
+    下载 poster（电影另有 fanart、clearlogo），各图片在图片下载线程池中并发下载，返回实际写入的图片路径。
+    下载哪些类型、取哪种尺寸见图片策略 artwork（缺省与此前行为一致）。
+    """
+    media_type = metadata.get("media_type", "movie")
+    pending = []
+    for kind, field, suffix, movie_only in _ARTWORK_FILES:
+        image_path = metadata.get(field)
+        if not image_path or (movie_only and media_type != "movie"):
+            continue
+        dest = os.path.join(dest_dir, base_name_no_ext + suffix)
+        job = tracing.bind(download_artwork)
+        pending.append((kind, dest, get_download_pool().submit(job, kind, image_path, dest, artwork, write_stats)))
+
+    written = []
+    for kind, dest, fut in pending:
         try:
-            poster_url = "https://image.tmdb.org/t/p/original" + poster_path
-            poster_dest = os.path.join(dest_dir, base_name_no_ext + "-poster.jpg")
-            if not os.path.exists(poster_dest):
-                r = requests.get(poster_url, stream=True, timeout=10)
-                r.raise_for_status()
-                with open(poster_dest, "wb") as f:
-                    for chunk in r.iter_content(8192):
-                        f.write(chunk)
-                logger.info(f"成功下载 poster：{poster_dest}, media_type:{media_type}")
+            if fut.result():
+                written.append(dest)
+                logger.info(f"成功下载 {kind}：{dest}, media_type:{media_type}")
         except Exception as e:
-            logger.warning(f"下载 poster 失败：{e}")
-
-    # 若是电影才下载 fanart 和 clearlogo
-    if media_type == "movie":
-        fanart_path = metadata.get("fanart_path")
-        if fanart_path:
-            try:
-                fanart_url = "https://image.tmdb.org/t/p/original" + fanart_path
-                fanart_dest = os.path.join(dest_dir, base_name_no_ext + "-fanart.jpg")
-                if not os.path.exists(fanart_dest):
-                    r = requests.get(fanart_url, stream=True, timeout=10)
-                    r.raise_for_status()
-                    with open(fanart_dest, "wb") as f:
-                        for chunk in r.iter_content(8192):
-                            f.write(chunk)
-                    logger.info(f"成功下载 fanart：{fanart_dest}")
-            except Exception as e:
-                logger.warning(f"下载 fanart 失败：{e}")
-
-        clearlogo_path = metadata.get("clearlogo_path")
-        if clearlogo_path:
-            try:
-                logo_url = "https://image.tmdb.org/t/p/original" + clearlogo_path
-                logo_dest = os.path.join(dest_dir, base_name_no_ext + "-clearlogo.png")
-                if not os.path.exists(logo_dest):
-                    r = requests.get(logo_url, stream=True, timeout=10)
-                    r.raise_for_status()
-                    with open(logo_dest, "wb") as f:
-                        for chunk in r.iter_content(8192):
-                            f.write(chunk)
-                    logger.info(f"成功下载 clearlogo：{logo_dest}")
-            except Exception as e:
-                logger.warning(f"下载 clearlogo 失败：{e}")
+            logger.warning(f"下载 {kind} 失败：{e}")
+    return written
 
 
 def fetch_episode_metadata(tv_id, season, episode, api_key):
     """
-    从 TMDB 获取单集元数据（标题、简介、首播日期等）。
+    获取单集元数据（标题、简介、首播日期等）：依次查找本地元数据库（有效期内）、共享缓存、TMDB。
     """
     logger.debug(f"调用 fetch_episode_metadata: season={season}, episode={episode}")
+    store = get_store()
+    try:
+        episode_info = store.load_episode(tv_id, season, episode, max_age=_metadata_max_age())
+    except Exception as e:
+        logger.warning(f"读取本地元数据库失败：{e}")
+        episode_info = None
+    if episode_info:
+        METADATA_SOURCE.inc(kind="episode", source="local")
+        return episode_info
+    shared = get_shared_cache()
+    episode_info = shared.load_episode(tv_id, season, episode) if shared else None
+    if episode_info:
+        METADATA_SOURCE.inc(kind="episode", source="shared")
+        _persist(store.save_episode, tv_id, season, episode, episode_info)
+        return episode_info
+
     url = f"https://api.themoviedb.org/3/tv/{tv_id}/season/{season}/episode/{episode}"
     params = {
         "api_key": api_key,
@@ -297,10 +474,10 @@ def fetch_episode_metadata(tv_id, season, episode, api_key):
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = _tmdb_get("episode", url, params=params, timeout=10)
         resp.raise_for_status()
         data = resp.json()
-        return {
+        episode_info = {
             "episode_title": data.get("name"),
             "episode_overview": data.get("overview"),
             "episode_air_date": data.get("air_date"),
@@ -312,6 +489,18 @@ def fetch_episode_metadata(tv_id, season, episode, api_key):
                 if c.get("job") == "Director"
             ],
         }
+        METADATA_SOURCE.inc(kind="episode", source="tmdb")
+        _persist(store.save_episode, tv_id, season, episode, episode_info)
+        if shared:
+            shared.publish("episode", tmdbid=tv_id, season=season, episode=episode, info=episode_info)
+        return episode_info
     except Exception as e:
         logger.warning(f"获取单集元数据失败（S{season}E{episode}）: {e}")
-        return {}
\ No newline at end of file
+        return {}
+
+def merge_episode_metadata(metadata, episode_info):
+    """
+    返回叠加了单集信息的新记录（EpisodeRecord），不修改 metadata；单集字段缺失时保留剧集级别的值。
+    metadata 为 MetadataRecord / EpisodeRecord（季、集号沿用后者已有的值）。
+    """
+    return metadata.with_episode(metadata.get("season"), metadata.get("episode"), episode_info)
@@ -0,0 +1,224 @@
+"""
+不可变的元数据记录。
+
+fetch_metadata 的结果是一个嵌套字典，同一部剧的各集共用缓存中的同一份数据，
+以前每个工作线程直接往里写 season / episode / 单集简介，会互相覆盖。这里把它换成：
+- MetadataRecord：剧集 / 电影级别的记录，使用 __slots__，列表转成元组，演员的 profile_url / thumb 按需拼出而不单独保存
+- EpisodeRecord：单集覆盖层，只保存季、集号和单集信息，其余字段读自所属的 MetadataRecord
+
+两者都提供 get / [] / in，与原来的字典用法一致（nfo_generator、cpu_pool、下载图片等无需改动），
+任何写入都会抛出异常。需要字典时（写入数据库、导出）用 to_dict()。
+"""
+from common_imports import *
+import sys
+
+_MISSING = object()
+
+
+def _rebuild(cls, values):
+    return cls(**values)
+
+
+class _Record:
+    """带 __slots__ 的只读记录基类。值为 None 的字段视为不存在（get 返回默认值）。"""
+    __slots__ = ()
+    _keys = () # get / [] 可读取的键：各个槽位，以及按需计算的属性
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} 不可修改")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} 不可修改")
+
+    def __reduce__(self):
+        return _rebuild, (type(self), {name: getattr(self, name) for name in self.__slots__})
+
+    def get(self, key, default=None):
+        if key not in self._keys:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [key for key in self._keys if self.get(key) is not None]
+
+    def items(self):
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def to_dict(self):
+        return {key: _plain(value) for key, value in self.items()}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.items())
+        return f"{type(self).__name__}({fields})"
+
+
+def _plain(value):
+    """记录 / 元组还原成 dict / list，用于 JSON。"""
+    if isinstance(value, _Record):
+        return value.to_dict()
+    if isinstance(value, tuple):
+        return [_plain(v) for v in value]
+    return value
+
+
+class Credit(_Record):
+    """导演、编剧、制片人。"""
+    __slots__ = ("name", "id", "role")
+    _keys = __slots__
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(name=data.get("name"), id=data.get("id"), role=data.get("role"))
+
+
+class CastMember(_Record):
+    """演员（含单集客串演员）。头像地址由 profile_path 拼出，不单独保存。"""
+    __slots__ = ("name", "character", "tmdb_id", "profile_path")
+    _keys = __slots__ + ("profile_url", "thumb")
+
+    @classmethod
+    def from_dict(cls, data):
+        # fetch_metadata 的演员用 tmdb_id，TMDB 原始数据（如 guest_stars）用 id
+        return cls(name=data.get("name"), character=data.get("character", ""),
+                   tmdb_id=data.get("tmdb_id", data.get("id")), profile_path=data.get("profile_path"))
+
+    @property
+    def profile_url(self):
+        return f"https://www.themoviedb.org/person/{self.tmdb_id}" if self.tmdb_id is not None else None
+
+    @property
+    def thumb(self):
+        return f"https://image.tmdb.org/t/p/w185{self.profile_path}" if self.profile_path else ""
+
+
+class Collection(_Record):
+    __slots__ = ("name", "id")
+    _keys = __slots__
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(name=data.get("name"), id=data.get("id"))
+
+
+def _records(cls, items):
+    return tuple(item if isinstance(item, cls) else cls.from_dict(item) for item in items or ())
+
+
+_SCALAR_FIELDS = (
+    "tmdbid", "media_type", "title", "original_title", "overview", "tagline", "runtime", "release_date", "year",
+    "studio", "vote_average", "vote_count", "poster_path", "fanart_path", "clearlogo_path", "imdb_id",
+    "number_of_seasons", "number_of_episodes", "status", "trailer",
+)
+_SEQUENCE_FIELDS = ("genres", "spoken_languages", "production_countries", "keywords")
+_CREDIT_FIELDS = ("directors", "writers", "producers")
+
+
+class MetadataRecord(_Record):
+    """电影 / 剧集级别的元数据（fetch_metadata 结果的紧凑只读形式）。"""
+    __slots__ = _SCALAR_FIELDS + _SEQUENCE_FIELDS + _CREDIT_FIELDS + ("cast", "collection")
+    _keys = __slots__
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 fetch_metadata 的结果或数据库中保存的字典构建；已是记录时原样返回。"""
+        if isinstance(data, (MetadataRecord, EpisodeRecord)):
+            return data
+        values = {k: data.get(k) for k in _SCALAR_FIELDS}
+        for k in _SEQUENCE_FIELDS:
+            values[k] = tuple(data.get(k) or ())
+        for k in _CREDIT_FIELDS:
+            values[k] = _records(Credit, data.get(k))
+        values["cast"] = _records(CastMember, data.get("cast"))
+        if data.get("collection"):
+            values["collection"] = Collection.from_dict(data["collection"])
+        record = cls(**values)
+        if data.get("season") is not None or data.get("episode") is not None: # 旧格式里混入的单集字段
+            return record.with_episode(data.get("season"), data.get("episode"))
+        return record
+
+    @property
+    def show(self):
+        return self
+
+    def with_episode(self, season, episode, episode_info=None):
+        """
+        返回某一集的覆盖层，episode_info 为 fetch_episode_metadata 的结果（可为空）。
+        单集字段缺失时保留剧集级别的值（简介、首播日期、导演）。
+        """
+        info = episode_info or {}
+        return EpisodeRecord(
+            show=self, season=season, episode=episode,
+            episode_title=info.get("episode_title", "") if episode_info else None,
+            overview=info.get("episode_overview") or None,
+            release_date=info.get("episode_air_date") or None,
+            directors=_records(Credit, info.get("episode_directors")) or None,
+            guest_stars=_records(CastMember, info.get("guest_stars")) or None,
+        )
+
+
+_EPISODE_FIELDS = ("season", "episode", "episode_title", "overview", "release_date", "directors", "guest_stars")
+
+
+class EpisodeRecord(_Record):
+    """单集覆盖层：单集字段优先，其余字段读自 show（所属剧集的 MetadataRecord，多集共享）。"""
+    __slots__ = ("show",) + _EPISODE_FIELDS
+    _keys = _EPISODE_FIELDS
+
+    def get(self, key, default=None):
+        if key in _EPISODE_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        return self.show.get(key, default)
+
+    def keys(self):
+        own = [key for key in _EPISODE_FIELDS if getattr(self, key) is not None]
+        return self.show.keys() + [key for key in own if key not in self.show._keys]
+
+    def with_episode(self, season, episode, episode_info=None):
+        return self.show.with_episode(season, episode, episode_info)
+
+
+def approx_size(value, _seen=None):
+    """
+    对象的近似内存占用（字节）：sys.getsizeof 递归累加，多处共用的对象只计一次。
+    用于缓存按字节数限制容量，不追求精确。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, _Record):
+        for name in value.__slots__:
+            size += approx_size(getattr(value, name), _seen)
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        for item in value:
+            size += approx_size(item, _seen)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k, _seen) + approx_size(v, _seen)
+    return size
@@ -0,0 +1,224 @@
+from common_imports import *
+import threading
+import time
+
+from db_utils import open_db
+
+logger = logging.getLogger(__name__)
+
+METADATA_DB = os.path.join("configs", "metadata.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    media_type TEXT NOT NULL,
+    tmdbid INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (media_type, tmdbid)
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    tmdbid INTEGER NOT NULL,
+    season TEXT NOT NULL,
+    episode TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (tmdbid, season, episode)
+);
+-- 按标题搜索到的 TMDB ID，新进程（或导入缓存包后）可不再调用搜索接口
+CREATE TABLE IF NOT EXISTS searches (
+    media_type TEXT NOT NULL,
+    query TEXT NOT NULL,
+    year TEXT NOT NULL,
+    tmdbid INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (media_type, query, year)
+);
+-- 目标库中每个 NFO 对应的元数据，用于离线重新生成
+CREATE TABLE IF NOT EXISTS library (
+    nfo_path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    tmdbid INTEGER NOT NULL,
+    season TEXT,
+    episode TEXT,
+    original_filename TEXT,
+    config_name TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+# 可在实例之间共享（导出 / 导入缓存包）的表及其主键；library 记录的是本机路径，不共享
+SHARED_TABLES = {
+    "metadata": ("media_type", "tmdbid"),
+    "episodes": ("tmdbid", "season", "episode"),
+    "searches": ("media_type", "query", "year"),
+}
+
+
+def _normalize_query(title, year):
+    return (title or "").strip().lower(), str(year or "")
+
+
+def _normalize_ep(value):
+    """季/集号统一成不带前导零的字符串作为键（文件名里的 "01" 与 TMDB 的 1 视为同一集）。"""
+    try:
+        return str(int(value))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class MetadataStore:
+    """
+    TMDB 元数据的本地持久化存储（SQLite）。
+    - metadata / episodes：按 TMDB ID 保存 fetch_metadata / fetch_episode_metadata 的原始结果
+    - searches：标题（+ 年份）到 TMDB ID 的映射，与 metadata 一起构成跨进程、跨实例的元数据缓存
+    - library：记录目标库里每个 NFO 由哪条元数据生成，供 refresh_nfo 离线重建
+    """
+
+    def __init__(self, path=METADATA_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+
+    def save_metadata(self, metadata):
+        if not metadata or not metadata.get("tmdbid"):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (media_type, tmdbid, data, updated_at) VALUES (?, ?, ?, ?)",
+                (metadata.get("media_type", "movie"), int(metadata["tmdbid"]),
+                 json.dumps(metadata, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def load_metadata(self, media_type, tmdbid):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM metadata WHERE media_type = ? AND tmdbid = ?",
+                (media_type, int(tmdbid))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_search(self, media_type, title, year, tmdbid):
+        if not tmdbid:
+            return
+        query, year = _normalize_query(title, year)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (media_type, query, year, tmdbid, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (media_type, query, year, int(tmdbid), time.time()))
+            self._conn.commit()
+
+    def find_metadata(self, media_type, title, year, max_age=None):
+        """按标题（+ 年份）查找已保存的元数据，搜索记录或元数据早于 max_age 秒时视为过期，返回 None。"""
+        query, year = _normalize_query(title, year)
+        oldest = time.time() - max_age if max_age else 0
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT m.data FROM searches s JOIN metadata m ON m.media_type = s.media_type AND m.tmdbid = s.tmdbid "
+                "WHERE s.media_type = ? AND s.query = ? AND s.year = ? AND s.updated_at >= ? AND m.updated_at >= ?",
+                (media_type, query, year, oldest, oldest)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_episode(self, tmdbid, season, episode, info):
+        if not info or not tmdbid:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO episodes (tmdbid, season, episode, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (int(tmdbid), _normalize_ep(season), _normalize_ep(episode),
+                 json.dumps(info, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def load_episode(self, tmdbid, season, episode, max_age=None):
+        oldest = time.time() - max_age if max_age else 0
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM episodes WHERE tmdbid = ? AND season = ? AND episode = ? AND updated_at >= ?",
+                (int(tmdbid), _normalize_ep(season), _normalize_ep(episode), oldest)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_nfo(self, nfo_path, kind, metadata, original_filename="", config_name=""):
+        """记录 NFO 与元数据的对应关系，kind 为 movie / episode / tvshow。"""
+        if not metadata or not metadata.get("tmdbid"):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO library (nfo_path, kind, media_type, tmdbid, season, episode, "
+                "original_filename, config_name, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(nfo_path), kind, metadata.get("media_type", "movie"), int(metadata["tmdbid"]),
+                 metadata.get("season") if kind == "episode" else None,
+                 metadata.get("episode") if kind == "episode" else None,
+                 original_filename, config_name, time.time()))
+            self._conn.commit()
+
+    def counts(self):
+        with self._lock:
+            return {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in SHARED_TABLES}
+
+    def dump_table(self, table):
+        """逐行产出共享表的内容（字典），用于导出缓存包。"""
+        if table not in SHARED_TABLES:
+            raise ValueError(f"不可导出的表：{table}")
+        with self._lock:
+            cur = self._conn.execute(f"SELECT * FROM {table}")
+            columns = [c[0] for c in cur.description]
+            rows = cur.fetchall()
+        for row in rows:
+            yield dict(zip(columns, row))
+
+    def table_columns(self, table):
+        """共享表的列：[(列名, 类型, 是否 NOT NULL)]，导入缓存包前据此校验每一行。"""
+        if table not in SHARED_TABLES:
+            raise ValueError(f"不可导入的表：{table}")
+        with self._lock:
+            return [(c[1], c[2].upper(), bool(c[3])) for c in self._conn.execute(f"PRAGMA table_info({table})")]
+
+    def merge_tables(self, tables):
+        """
+        导入共享表的行：本地没有的直接插入，已有的只在导入的 updated_at 更新时覆盖。
+        tables 为 {表名: 已校验的行列表}，全部在一个事务中写入，出错时整体回滚。返回 {表名: 写入行数}。
+        """
+        written = {}
+        with self._lock:
+            try:
+                for table, rows in tables.items():
+                    keys = SHARED_TABLES.get(table)
+                    if not keys:
+                        raise ValueError(f"不可导入的表：{table}")
+                    columns = [c[1] for c in self._conn.execute(f"PRAGMA table_info({table})")]
+                    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in keys)
+                    sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                           f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates} "
+                           f"WHERE excluded.updated_at > {table}.updated_at")
+                    before = self._conn.total_changes
+                    self._conn.executemany(sql, ([row.get(c) for c in columns] for row in rows))
+                    written[table] = written.get(table, 0) + self._conn.total_changes - before
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return written
+
+    def library_under(self, root):
+        """一次性取出 root 目录下所有 NFO 记录，返回 {nfo_path: row_dict}。"""
+        prefix = os.path.join(os.path.abspath(root), "")
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT nfo_path, kind, media_type, tmdbid, season, episode, original_filename, config_name "
+                "FROM library WHERE substr(nfo_path, 1, ?) = ?", (len(prefix), prefix))
+            columns = [c[0] for c in cur.description]
+            return {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """进程内共享的 MetadataStore 实例（首次使用时创建）。"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MetadataStore()
+    return _store
@@ -1,21 +1,102 @@
 from common_imports import *
-from metadata_fetcher import fetch_metadata_cached, fetch_episode_metadata, download_poster, download_images
+from metadata_fetcher import (fetch_metadata_cached, fetch_episode_metadata, download_poster, download_images,
+                              download_artwork, merge_episode_metadata)
+from metadata_store import get_store
 from nfo_generator import generate_nfo, generate_tv_nfo, generate_tvshow_nfo
 from filename_parser import parse_filename
+from config_store import media_suffixes
+from stats_index import get_stats_index
+from write_guard import WriteStats
 
+import posixpath
 import subprocess
+import time
+from contextlib import contextmanager, nullcontext
+from cluster import join_cluster
+from artwork import create_policy
+import concurrency
+from file_linker import link_file
+from fingerprint_index import DUPLICATES, get_fingerprint_index
+from media_probe import probe as probe_media
+import metrics
+import tracing
+from work_queue import file_priority, get_work_queue
 
 logger = logging.getLogger(__name__)
+
+FILES_TOTAL = metrics.counter("mediatool_files_total", "处理的媒体文件数（按配置、结果）", ("config", "result"))
+STAGE_SECONDS = metrics.histogram("mediatool_stage_seconds", "process_single_file 各阶段耗时（秒）", ("stage",))
+EXECUTOR_QUEUED = metrics.gauge("mediatool_executor_queue_depth", "已提交到线程池、尚未开始处理的文件数", ("config",))
+EXECUTOR_ACTIVE = metrics.gauge("mediatool_executor_active", "线程池中正在处理的文件数", ("config",))
+
+
+# 以本地 / 挂载磁盘 I/O 为主的阶段，耗时作为自适应并发的磁盘延迟信号
+_DISK_STAGES = {"chmod", "dedup", "link", "rename", "probe", "nfo"}
+
+
+@contextmanager
+def _stage(name):
+    """记录 process_single_file 中一个阶段的耗时（指标 + 开启追踪时的 span）：with _stage("link"): ..."""
+    start = time.perf_counter()
+    with STAGE_SECONDS.time(stage=name), tracing.span(name):
+        yield
+    if name in _DISK_STAGES:
+        concurrency.note_disk(time.perf_counter() - start)
+
 def load_processed_set():
     path = os.path.join("configs", "processed.txt")
     if not os.path.exists(path):
         return set()
     with open(path, "r", encoding="utf-8") as f:
         return set(line.strip() for line in f if line.strip())
-def process_single_file(file_path, config, rel_dir, target_dir, processed_set=None):
+def _record_nfo(nfo_path, kind, metadata, original_filename, config_name):
+    """记录 NFO 对应的元数据，供 refresh_nfo 离线重建；失败不影响处理结果。"""
+    try:
+        get_store().record_nfo(nfo_path, kind, metadata, original_filename, config_name)
+    except Exception as e:
+        logger.warning(f"[配置:{config_name}] 记录 NFO 元数据映射失败：{e}")
+
+def _index_file(dest_path, config_name, old_path=None):
+    """更新统计索引（新链接的文件，或 old_path -> dest_path 的重命名）；失败不影响处理结果。"""
+    try:
+        if old_path:
+            get_stats_index().move_file(old_path, dest_path, config_name)
+        else:
+            get_stats_index().add_file(dest_path, config_name)
+    except Exception as e:
+        logger.warning(f"[配置:{config_name}] 更新统计索引失败：{e}")
+
+def _check_duplicate(file_path, config_name, mode):
+    """
+    按内容指纹查重（所有配置共用一个索引），返回 (指纹, 跳过时的处理结果或 None)。
+    指纹不为空时处理结束后需调用 complete；查重失败不影响处理。
+    """
+    try:
+        fingerprint, original = get_fingerprint_index().check(file_path, config_name)
+    except Exception as e:
+        logger.warning(f"[配置:{config_name}] 计算内容指纹失败：{e}")
+        return None, None
+    if not original:
+        return fingerprint, None
+    DUPLICATES.inc(config=config_name, action=mode)
+    if mode == "skip":
+        logger.info(f"[配置:{config_name}] 与已处理的文件内容相同，跳过：{file_path}（{original}）")
+        return None, (True, f"重复内容，与 {original} 相同")
+    logger.warning(f"[配置:{config_name}] 与 {original} 内容相同，仍然处理：{file_path}")
+    return None, None
+
+def process_single_file(file_path, config, rel_dir, target_dir, processed_set=None, file_info=None, cpu_pool=None,
+                        write_stats=None, outputs=None, artwork=None):
+    """
+    处理单个源文件，返回 (是否成功, 消息)；outputs 不为 None 时追加本次生成的文件路径（媒体文件、NFO、图片）。
+    artwork 为本次运行的图片策略（artwork.ArtworkPolicy），缺省与此前行为一致。
+    """
+    if outputs is None:
+        outputs = []
     try:
         logger.info(f"[设置目录权限:{target_dir}]")
-        subprocess.run(['chmod', '-R', '777', target_dir], check=True)
+        with _stage("chmod"):
+            subprocess.run(['chmod', '-R', '777', target_dir], check=True)
         logger.info(f"[设置目录权限成功]")
     except subprocess.CalledProcessError as e:
             logger.error(f"[设置目录权限失败]：{e}")
@@ -29,10 +110,14 @@ def process_single_file(file_path, config, rel_dir, target_dir, processed_set=No
             return True, "重复文件跳过"
         # === 只做硬链接（不抓元数据也不重命名） ===
         if not config.get("scrape_metadata", True) and not config.get("rename_file", True):
-            dest_path = create_hardlink_if_needed(file_path, dest_dir, config_name)
-            if not dest_path:
-                return None  # 跳过记录，跳过计数
-            
+            with _stage("link"):
+                dest_path, link_msg = create_hardlink_if_needed(file_path, dest_dir, config_name,
+                                                               config.get("link_mode", "hardlink"))
+            if link_msg:
+                return True, link_msg  # 目标已存在，跳过
+            _index_file(dest_path, config_name)
+            outputs.append(dest_path)
+
             record_path = os.path.join("configs", "processed.txt")
             os.makedirs(os.path.dirname(record_path), exist_ok=True)
             with open(record_path, "a", encoding="utf-8") as f:
@@ -41,9 +126,20 @@ def process_single_file(file_path, config, rel_dir, target_dir, processed_set=No
             return True, ""
 
         # === 正常流程 ===
-        dest_path = create_hardlink_if_needed(file_path, dest_dir, config_name)
+        with _stage("link"):
+            dest_path, link_msg = create_hardlink_if_needed(file_path, dest_dir, config_name,
+                                                               config.get("link_mode", "hardlink"))
+        if link_msg:
+            # 目标已存在（硬链接、已放置的副本或同名文件）：沿用已有文件继续刮削，
+            # 内容未变化的 NFO / 图片不会重写；已有文件不计入本次生成的文件
+            logger.info(f"[配置:{config_name}] 使用已存在的目标文件继续处理：{dest_path}")
+        else:
+            _index_file(dest_path, config_name)
+            outputs.append(dest_path)
 
-        file_info = parse_filename(filename)
+        if file_info is None:
+            with _stage("parse"):
+                file_info = parse_filename(filename)
         if not file_info:
             return False, f"无法解析文件名：{filename}"
 
@@ -51,16 +147,16 @@ def process_single_file(file_path, config, rel_dir, target_dir, processed_set=No
         config_media_type = config.get("file_type", "movie")
 
         metadata = None
-        if config.get("scrape_metadata", True):
-            if media_type == "movie" or (media_type == "unknown" and config_media_type == "movie"):
-                metadata = fetch_metadata_cached(file_info["title"], file_info.get("year"), config.get("tmdb_api_key", ""), media_type="movie")
-            elif media_type == "tv_show" or (media_type == "unknown" and config_media_type == "tv_show"):
-                metadata = fetch_metadata_cached(file_info["title"], None, config.get("tmdb_api_key", ""), media_type="tv_show")
-                if metadata:
-                    metadata["season"] = file_info.get("season")
-                    metadata["episode"] = file_info.get("episode")
-            if not metadata:
-                return False, f"无法获取元数据：{filename}"
+        with _stage("fetch"):
+            if config.get("scrape_metadata", True):
+                if media_type == "movie" or (media_type == "unknown" and config_media_type == "movie"):
+                    metadata = fetch_metadata_cached(file_info["title"], file_info.get("year"), config.get("tmdb_api_key", ""), media_type="movie")
+                elif media_type == "tv_show" or (media_type == "unknown" and config_media_type == "tv_show"):
+                    metadata = fetch_metadata_cached(file_info["title"], None, config.get("tmdb_api_key", ""), media_type="tv_show")
+                    if metadata: # 缓存中的记录多集共享，季、集号叠加在副本上
+                        metadata = metadata.with_episode(file_info.get("season"), file_info.get("episode"))
+                if not metadata:
+                    return False, f"无法获取元数据：{filename}"
 
         rename_placeholders = {
             "title": metadata.get("title", file_info.get("title")),
@@ -76,21 +172,18 @@ def process_single_file(file_path, config, rel_dir, target_dir, processed_set=No
 
         episode_info = None
         if metadata and metadata.get("media_type") == "tv_show":
-            episode_info = fetch_episode_metadata(
-                metadata.get("tmdbid"),
-                metadata.get("season") or file_info.get("season", "1"),
-                metadata.get("episode") or file_info.get("episode", "1"),
-                config.get("tmdb_api_key", "")
-            )
+            with _stage("fetch"):
+                episode_info = fetch_episode_metadata(
+                    metadata.get("tmdbid"),
+                    metadata.get("season") or file_info.get("season", "1"),
+                    metadata.get("episode") or file_info.get("episode", "1"),
+                    config.get("tmdb_api_key", "")
+                )
             if episode_info:
-                metadata["episode_title"] = episode_info.get("episode_title", "")
+                metadata = merge_episode_metadata(metadata, episode_info)
                 rename_placeholders["episode_title"] = episode_info.get("episode_title", "").replace(" ", "_")[:50]
-                metadata["overview"] = episode_info.get("episode_overview") or metadata.get("overview")
-                metadata["release_date"] = episode_info.get("episode_air_date") or metadata.get("release_date")
-                metadata["directors"] = episode_info.get("episode_directors") or metadata.get("directors")
-                metadata["guest_stars"] = episode_info.get("guest_stars", [])
 
-        new_filename = filename
+        new_filename = os.path.basename(dest_path) # 沿用已有目标文件时可能已是重命名后的文件名
         if config.get("rename_file", True):
             default_rule = "{title}.{year}" if config_media_type == "movie" else "{title}.{season_episode}"
             rename_rule = config.get("rename_rule", default_rule)
@@ -102,45 +195,63 @@ def process_single_file(file_path, config, rel_dir, target_dir, processed_set=No
             new_filename = base + os.path.splitext(filename)[1]
             new_path = os.path.join(dest_dir, new_filename)
 
-            if new_filename != filename and not os.path.exists(new_path):
-                os.rename(dest_path, new_path)
+            if new_filename != os.path.basename(dest_path) and not os.path.exists(new_path):
+                with _stage("rename"):
+                    os.rename(dest_path, new_path)
                 logger.info(f"[配置:{config_name}] 重命名媒体文件：{dest_path} -> {new_path}")
+                _index_file(new_path, config_name, old_path=dest_path)
+                outputs[:] = [new_path if p == dest_path else p for p in outputs]
                 dest_path = new_path
 
         base_name_no_ext = os.path.splitext(new_filename)[0]
         if config.get("scrape_metadata", True) and metadata:
             nfo_path = os.path.join(dest_dir, base_name_no_ext + ".nfo")
+            streamdetails = None
+            if config.get("probe_streams", True):
+                with _stage("probe"):
+                    streamdetails = probe_media(dest_path)
             if metadata.get("media_type") == "movie":
-                generate_nfo(metadata, nfo_path, original_filename=filename)
+                with _stage("nfo"):
+                    generate_nfo(metadata, nfo_path, original_filename=filename, cpu_pool=cpu_pool,
+                                 write_stats=write_stats, streamdetails=streamdetails)
+                _record_nfo(nfo_path, "movie", metadata, filename, config_name)
+                outputs.append(nfo_path)
             else:
-                generate_tv_nfo(metadata, nfo_path, original_filename=filename)
+                with _stage("nfo"):
+                    generate_tv_nfo(metadata, nfo_path, original_filename=filename, cpu_pool=cpu_pool,
+                                    write_stats=write_stats, streamdetails=streamdetails)
+                _record_nfo(nfo_path, "episode", metadata, filename, config_name)
+                outputs.append(nfo_path)
                 still_path = episode_info.get("still_path") if episode_info else None
                 if still_path:
                     try:
-                        thumb_url = "https://image.tmdb.org/t/p/w500" + still_path
                         thumb_path = os.path.join(dest_dir, base_name_no_ext + "-thumb.jpg")
-                        if not os.path.exists(thumb_path):
-                            r = requests.get(thumb_url, stream=True, timeout=10)
-                            r.raise_for_status()
-                            with open(thumb_path, "wb") as f:
-                                for chunk in r.iter_content(8192):
-                                    f.write(chunk)
-                        logger.info(f"[配置:{config_name}] 下载单集缩略图：{thumb_path}")
+                        with _stage("images"):
+                            if download_artwork("thumb", still_path, thumb_path, artwork, write_stats):
+                                outputs.append(thumb_path)
+                                logger.info(f"[配置:{config_name}] 下载单集缩略图：{thumb_path}")
                     except Exception as e:
                         logger.warning(f"[配置:{config_name}] 下载缩略图失败：{e}")
 
-            download_images(metadata, dest_dir, base_name_no_ext)
+            with _stage("images"):
+                outputs.extend(download_images(metadata, dest_dir, base_name_no_ext, write_stats=write_stats,
+                                               artwork=artwork))
 
             if metadata.get("media_type") == "tv_show":
                 tvshow_nfo_path = os.path.join(dest_dir, "tvshow.nfo")
                 tvshow_poster_path = os.path.join(dest_dir, "poster.jpg")
                 if not os.path.exists(tvshow_nfo_path):
-                    generate_tvshow_nfo(metadata, tvshow_nfo_path)
+                    with _stage("nfo"):
+                        generate_tvshow_nfo(metadata.show, tvshow_nfo_path, cpu_pool=cpu_pool, write_stats=write_stats)
+                    outputs.append(tvshow_nfo_path)
+                _record_nfo(tvshow_nfo_path, "tvshow", metadata.show, "", config_name)
                 if not os.path.exists(tvshow_poster_path):
-                    temp_path = download_poster(metadata, dest_dir, "tvshow")
+                    with _stage("images"):
+                        temp_path = download_poster(metadata, dest_dir, "tvshow", write_stats=write_stats, artwork=artwork)
                     if temp_path and os.path.exists(temp_path):
                         try:
                             os.rename(temp_path, tvshow_poster_path)
+                            outputs.append(tvshow_poster_path)
                         except Exception as e:
                             logger.warning(f"[配置:{config_name}] 重命名 poster.jpg 失败：{e}")
 
@@ -155,7 +266,113 @@ def process_single_file(file_path, config, rel_dir, target_dir, processed_set=No
         return False, str(e)
 
 
-def process_movies(config_or_download_dir, target_dir=None, tmdb_api_key=None, progress_callback=None):
+# 扫描时每发现这么多个文件提交一批（同时上报一次总数增长）
+SCAN_BATCH_SIZE = 64
+
+
+def iter_media_files(paths, suffixes):
+    """
+    单次遍历各源目录，逐个产出 (文件路径, 相对目录, 目标路径)。
+    后缀按小写扩展名匹配（suffixes 由 media_suffixes 得到）。
+    """
+    for m in paths:
+        src, tgt = m.get("source"), m.get("target")
+        if not src or not tgt:
+            continue
+        if os.path.isfile(src): # 单个文件（如下载完成回调传入的文件路径）
+            if os.path.splitext(src)[1].lower() in suffixes:
+                yield src, ".", tgt
+            continue
+        for root, _, files in os.walk(src):
+            rel = os.path.relpath(root, src)
+            for f in files:
+                if os.path.splitext(f)[1].lower() in suffixes:
+                    yield os.path.join(root, f), rel, tgt
+
+
+def cluster_key(config_name, prefix, relpath):
+    """多节点模式下文件的租约键：配置名/路径映射序号（或 cluster_key 前缀）/源目录内相对路径。"""
+    return posixpath.normpath(f"{config_name}/{prefix}/{relpath.replace(os.sep, '/')}")
+
+
+def iter_cluster_files(paths, suffixes, config_name):
+    """
+    多节点模式：产出 (文件路径, 相对目录, 目标路径, 租约键)。
+    租约键为 配置名/路径映射序号/源目录内相对路径，各节点挂载点不同也能对上；
+    只处理子目录或单个文件时（cli.py --path）映射中的 cluster_key 给出该子目录对应的前缀。
+    """
+    for index, m in enumerate(paths):
+        src = m.get("source")
+        prefix = m.get("cluster_key", str(index))
+        for f, rel, tgt in iter_media_files([m], suffixes):
+            relpath = os.path.basename(f) if rel == "." and os.path.isfile(src) else os.path.relpath(f, src)
+            yield f, rel, tgt, cluster_key(config_name, prefix, relpath)
+
+
+def claim_file(node, key, path, require_owner=True):
+    """
+    文件归本节点且领到租约时返回 True；大小、修改时间未变且已由某个节点处理过的文件不再领取。
+    require_owner 为 False 时不看哈希环归属（立即处理指定的文件），只要领到租约即可。
+    """
+    if require_owner and not node.owns(key):
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return node.claim(key, st.st_size, st.st_mtime)
+
+
+def process_file(file_path, config, rel_dir, target_dir, processed_set=None, cluster_node=None, key=None,
+                 require_owner=True, **kwargs):
+    """
+    process_single_file 加上前后的共用步骤（process_movies 与 ingest 共用）：
+    多节点模式下（cluster_node、租约键 key 不为空）先领取租约，不归本节点（require_owner 为 True 时）、
+    其他节点正在处理或已处理过时返回 None；
+    按配置项 duplicates 查重；处理结束后登记内容指纹、更新租约。kwargs 透传给 process_single_file。
+    """
+    config_name = config.get("name", "未知")
+    if key is not None and not claim_file(cluster_node, key, file_path, require_owner):
+        return None
+    result = None
+    try:
+        fingerprint = None
+        dedup_mode = config.get("duplicates", "skip")
+        if dedup_mode != "off" and not (processed_set and file_path.strip() in processed_set):
+            with _stage("dedup"):
+                fingerprint, result = _check_duplicate(file_path, config_name, dedup_mode)
+            if result:
+                return result
+        try:
+            result = process_single_file(file_path, config, rel_dir, target_dir, processed_set, **kwargs)
+            return result
+        finally:
+            if fingerprint:
+                get_fingerprint_index().complete(file_path, fingerprint, config_name, bool(result and result[0]))
+    finally:
+        if key is not None:
+            cluster_node.complete(key, bool(result and result[0]))
+
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def process_movies(config_or_download_dir, target_dir=None, tmdb_api_key=None, progress_callback=None,
+                   tracer=None, profiler=None, scheduled=False):
+    """
+    处理一个配置下的所有媒体文件。文件提交到执行进程共用的处理队列（work_queue），
+    scheduled 为 True（定时任务）时文件按新发现 / 已处理排在手动任务之后。
+    tracer（tracing.Tracer）不为空时按文件记录各阶段 span；
+    profiler（tracing.RunProfiler）不为空时线程池中的任务也纳入 cProfile 采样。
+    """
     if isinstance(config_or_download_dir, dict):
         config = config_or_download_dir
     else:
@@ -169,45 +386,132 @@ def process_movies(config_or_download_dir, target_dir=None, tmdb_api_key=None, p
         }
 
     paths = config.get("paths", [{"source": config.get("download_dir"), "target": config.get("target_dir")}])
-    suffixes = [s.strip().lower() for s in config.get("file_suffixes", "").split(",") if s.strip()]
-    tasks, failed = [], []
+    suffixes = media_suffixes(config)
+    failed = []
+    total = 0
+    processed_set = load_processed_set()
+    write_stats = WriteStats()
+    artwork = create_policy(config) # 图片类型、尺寸与本次运行的下载带宽上限
 
-    for m in paths:
-        src, tgt = m["source"], m["target"]
-        for root, _, files in os.walk(src):
-            rel = os.path.relpath(root, src)
-            for f in files:
-                if os.path.splitext(f)[1].lower() in suffixes:
-                    tasks.append((os.path.join(root, f), rel, tgt))
+    config_name = config.get("name", "未知")
 
-    total = len(tasks)
-    if progress_callback: progress_callback("initialize", total)
-    processed_set = load_processed_set()
+    limiter = concurrency.create_limiter(config) # 启用 adaptive_threads 时按观测到的延迟和错误调整并发
+    capacity = (lambda: limiter.limit) if limiter else config.get("max_threads", 4)
+    queue = get_work_queue()
+    cluster_node = join_cluster(config_name)
+    deferred = [] # 多节点模式下轮到处理时不归本节点（或其他节点正在处理）的文件
 
-    with ThreadPoolExecutor(max_workers=config.get("max_threads", 4)) as exe:
-        
-        futures = {exe.submit(process_single_file, f, config, rel, tgt, processed_set): f for f, rel, tgt in tasks}
-        for fut in as_completed(futures):
-            f = futures[fut]
-            try:
-                success, msg = fut.result()
-                if not success:
-                    failed.append((f, msg))
-                    if progress_callback:
-                        progress_callback("update", 1, False, {"file": f, "message": msg})
-                elif progress_callback:
-                    progress_callback("update", 1, True)
-            except Exception as e:
-                failed.append((f, str(e)))
+    def run_one(key, f, rel, tgt, info):
+        EXECUTOR_QUEUED.dec(config=config_name)
+        if limiter:
+            limiter.acquire()
+        EXECUTOR_ACTIVE.inc(config=config_name)
+        start = time.perf_counter()
+        result = None
+        try:
+            # 租约在开始处理时才领取：扫描之后才加入的节点也能分到排队中的文件
+            with tracing.trace_file(tracer, f):
+                result = process_file(f, config, rel, tgt, processed_set, cluster_node, key, file_info=info,
+                                      cpu_pool=cpu_pool, write_stats=write_stats, artwork=artwork)
+            if result is None:
+                deferred.append((f, rel, tgt, key))
+            return result
+        finally:
+            EXECUTOR_ACTIVE.dec(config=config_name)
+            if limiter:
+                # 未领到租约的文件、成功但带消息的跳过文件（已处理、已存在、重复）不计入单文件耗时
+                skipped = result is None or (result[0] and result[1])
+                limiter.release(None if skipped else time.perf_counter() - start)
+
+    if profiler:
+        run_one = profiler.wrap(run_one)
+
+    def on_done(fut, f, key):
+        if key is not None and fut.exception() is None and fut.result() is None:
+            if progress_callback: progress_callback("discovered", -1) # 交给其他节点，不计入本节点总数
+            return
+        try:
+            success, msg = fut.result()
+            FILES_TOTAL.inc(config=config_name, result="success" if success else "failed")
+            if not success:
+                failed.append((f, msg))
                 if progress_callback:
-                    progress_callback("update", 1, False, {"file": f, "message": str(e)})
+                    progress_callback("update", 1, False, {"file": f, "message": msg})
+            elif progress_callback:
+                progress_callback("update", 1, True)
+        except Exception as e:
+            FILES_TOTAL.inc(config=config_name, result="failed")
+            failed.append((f, str(e)))
+            if progress_callback:
+                progress_callback("update", 1, False, {"file": f, "message": str(e)})
+
+    def submit(lane, batch):
+        if progress_callback: progress_callback("discovered", len(batch))
+        parsed = [None] * len(batch)
+        if parse_in_pool:
+            parsed = cpu_pool.parse_filenames([os.path.basename(item[0]) for item in batch], chunksize=16)
+        for (f, rel, tgt, key), info in zip(batch, parsed):
+            EXECUTOR_QUEUED.inc(config=config_name)
+            priority = file_priority(scheduled, f.strip() in processed_set)
+            fut = lane.submit(priority, run_one, key, f, rel, tgt, info)
+            fut.add_done_callback(lambda fut, f=f, key=key: on_done(fut, f, key))
 
+    # 可选：CPU 密集环节放到进程池，文件名按批解析后再提交（未启用时不导入 multiprocessing）
+    cpu_pool = None
+    if int(config.get("cpu_workers", 0) or 0) > 0:
+        from cpu_pool import create_cpu_pool
+        cpu_pool = create_cpu_pool(config)
+    parse_in_pool = cpu_pool and (config.get("scrape_metadata", True) or config.get("rename_file", True))
+    try:
+        # 多节点模式下只处理归本节点且领到租约的文件，退出时注销节点并释放未完成的租约
+        with cluster_node or nullcontext():
+            # 边扫描边提交：每发现一批文件就累加总数并交给处理队列，扫描与处理同时进行，源目录只遍历一次
+            with queue.lane(config_name, capacity) as lane:
+                if cluster_node:
+                    files = iter_cluster_files(paths, suffixes, config_name)
+                else:
+                    files = ((f, rel, tgt, None) for f, rel, tgt in iter_media_files(paths, suffixes))
+                for batch in iter_batches(files, SCAN_BATCH_SIZE):
+                    total += len(batch)
+                    submit(lane, batch)
+            if lane.waits:
+                logger.info(f"[配置:{config_name}] 排队等待：{lane.wait_summary()}")
+            if cluster_node and deferred:
+                # 期间有节点离开时，它名下还没处理的文件改归本节点，再处理一轮
+                total -= len(deferred)
+                cluster_node.refresh()
+                retry = [item for item in deferred if cluster_node.owns(item[3])]
+                deferred.clear()
+                if retry:
+                    total += len(retry)
+                    with queue.lane(config_name, capacity) as retry_lane:
+                        submit(retry_lane, retry)
+                    total -= len(deferred)
+                    if len(retry) > len(deferred):
+                        logger.info(f"[配置:{config_name}] 接手其他节点留下的文件：{len(retry) - len(deferred)} 个")
+    finally:
+        if cpu_pool:
+            cpu_pool.shutdown()
+        if limiter:
+            limiter.close()
+
+    writes = dict(write_stats.as_dict(), **artwork.as_dict())
+    if progress_callback: progress_callback("write_stats", writes)
     if progress_callback: progress_callback("complete", 0)
     logger.info(f"[配置:{config.get('name', '未知')}] 总共处理：{total}，失败：{len(failed)}")
+    logger.info(f"[配置:{config.get('name', '未知')}] NFO/图片写入：{writes['written']}，内容未变化跳过：{writes['skipped']}")
+    if writes["bytes_saved"] or writes["images_omitted"]:
+        logger.info(f"[配置:{config_name}] 图片策略（{artwork.size}）：少下载 {writes['bytes_saved'] / 1048576:.1f} MB，"
+                    f"未启用类型的图片 {writes['images_omitted']} 张")
+
+_LINK_LABELS = {"hardlink": "创建硬链接", "reflink": "创建 reflink", "copy": "复制文件"}
+
 
-def create_hardlink_if_needed(src_path, dest_dir, config_name):
+def create_hardlink_if_needed(src_path, dest_dir, config_name, link_mode="hardlink"):
     """
-    创建硬链接（如目标已存在则跳过），返回 (最终路径或 None, 消息)。
+    把源文件放到目标目录，返回 (目标路径, 消息)：新放置时消息为空；
+    目标已存在（同一 inode、大小与修改时间相同的副本，或同名文件）时不再放置，返回已有文件的路径和原因。
+    link_mode 为配置中的放置方式，硬链接不可用（如跨文件系统）时自动改用 reflink / 复制，见 file_linker。
     """
     try:
         os.makedirs(dest_dir, exist_ok=True)
@@ -216,28 +520,36 @@ def create_hardlink_if_needed(src_path, dest_dir, config_name):
 
         # 源 inode
         try:
-            source_inode = os.stat(src_path).st_ino
+            source_stat = os.stat(src_path)
         except Exception as e:
             logger.warning(f"[配置:{config_name}] 获取源 inode 失败：{e}")
-            source_inode = None
+            source_stat = None
 
-        # 目录内查找相同 inode
-        if source_inode:
+        # 目录内查找已放置的同一文件（可能已被重命名）：硬链接按 inode 判断；
+        # 复制 / reflink（或硬链接降级后）inode 不同，copystat 保留了修改时间，按大小 + 修改时间判断
+        if source_stat:
             for fname in os.listdir(dest_dir):
                 fpath = os.path.join(dest_dir, fname)
                 try:
-                    if os.path.isfile(fpath) and os.stat(fpath).st_ino == source_inode:
+                    st = os.stat(fpath)
+                    if not os.path.isfile(fpath):
+                        continue
+                    if (st.st_ino, st.st_dev) == (source_stat.st_ino, source_stat.st_dev):
                         logger.info(f"[配置:{config_name}] 已存在硬链接目标文件，跳过：{src_path}")
-                        return None, "硬链接已存在"
+                        return fpath, "硬链接已存在"
+                    # 修改时间允许 1 秒误差：部分网络 / FAT 类文件系统的时间戳精度较低
+                    if st.st_size == source_stat.st_size and abs(st.st_mtime - source_stat.st_mtime) < 1:
+                        logger.info(f"[配置:{config_name}] 已存在大小、修改时间相同的目标文件 {fpath}，跳过：{src_path}")
+                        return fpath, "目标文件已存在"
                 except Exception:
                     continue
 
         if os.path.exists(dest_path):
             logger.info(f"[配置:{config_name}] 目标路径已存在但 inode 不同，跳过：{dest_path}")
-            return None, "同名文件已存在"
+            return dest_path, "同名文件已存在"
 
-        os.link(src_path, dest_path)
-        logger.info(f"[配置:{config_name}] 创建硬链接：{dest_path}")
+        method = link_file(src_path, dest_path, link_mode)
+        logger.info(f"[配置:{config_name}] {_LINK_LABELS[method]}：{dest_path}")
         return dest_path, ""
     except Exception as e:
         logger.error(f"[配置:{config_name}] 创建硬链接失败：{e}")
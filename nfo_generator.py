@@ -1,214 +1,322 @@
 from common_imports import *
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from write_guard import write_if_changed
 
 logger = logging.getLogger(__name__)
 
-def _add_sub_element(parent, tag, text):
-    """Helper to add a sub-element only if text is not empty."""
-    if text:
-        sub = ET.SubElement(parent, tag)
-        sub.text = str(text) # Ensure text is string
+# XML 1.0 不允许出现的字符（原先由 minidom 重解析时报错，这里保持同样的失败行为）
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
 
-def _pretty_print_xml(elem):
-    """Return a pretty-printed XML string for the Element."""
-    rough_string = ET.tostring(elem, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ", encoding='utf-8')
+def _escape(text):
+    """按 minidom 写出时的方式转义文本（先做 XML 解析器的换行规范化：\r\n、\r 变为 \n）。"""
+    if _INVALID_XML_CHARS.search(text):
+        raise ValueError(f"NFO 内容包含 XML 非法字符：{text!r}")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;").replace(">", "&gt;")
 
-def generate_nfo(metadata, nfo_path, original_filename=""):
+def _format_attrs(attrs):
+    if not attrs:
+        return ""
+    return "".join(f' {k}="{_escape(str(v))}"' for k, v in attrs.items())
+
+class _NfoWriter:
+    """
+    单遍流式写出 NFO，不构建也不重新解析 DOM；
+    输出与 ET.tostring + minidom.toprettyxml(indent="  ") 的结果逐字节一致。
+    """
+
+    def __init__(self, root_tag):
+        self._parts = ['<?xml version="1.0" encoding="utf-8"?>\n']
+        self._stack = []
+        self._pending = False # 当前打开的元素还没写出 '>'（没有子元素时要输出 '/>'）
+        self.open(root_tag)
+
+    def _start_child(self):
+        if self._pending:
+            self._parts.append(">\n")
+            self._pending = False
+
+    def open(self, tag, attrs=None):
+        self._start_child()
+        self._parts.append(f"{'  ' * len(self._stack)}<{tag}{_format_attrs(attrs)}")
+        self._stack.append(tag)
+        self._pending = True
+
+    def close(self):
+        tag = self._stack.pop()
+        if self._pending:
+            self._parts.append("/>\n")
+            self._pending = False
+        else:
+            self._parts.append(f"{'  ' * len(self._stack)}</{tag}>\n")
+
+    def add(self, tag, text, attrs=None):
+        """Add <tag>text</tag> only if text is not empty."""
+        if not text:
+            return
+        self._start_child()
+        self._parts.append(f"{'  ' * len(self._stack)}<{tag}{_format_attrs(attrs)}>{_escape(str(text))}</{tag}>\n")
+
+    def getvalue(self):
+        """Close any open elements and return the utf-8 encoded document."""
+        while self._stack:
+            self.close()
+        return "".join(self._parts).encode("utf-8")
+
+def _add_streamdetails(nfo, streamdetails):
+    """<fileinfo><streamdetails>：media_probe.probe 读出的流信息，没有时不输出。"""
+    if not streamdetails or not (streamdetails.get("video") or streamdetails.get("audio")):
+        return
+    nfo.open("fileinfo")
+    nfo.open("streamdetails")
+    duration = streamdetails.get("duration")
+    for video in streamdetails.get("video", []):
+        nfo.open("video")
+        nfo.add("codec", video.get("codec"))
+        if video.get("aspect"):
+            nfo.add("aspect", f"{video['aspect']:.3f}")
+        nfo.add("width", video.get("width"))
+        nfo.add("height", video.get("height"))
+        if duration:
+            nfo.add("durationinseconds", int(round(duration)))
+        nfo.close()
+    for audio in streamdetails.get("audio", []):
+        nfo.open("audio")
+        nfo.add("codec", audio.get("codec"))
+        nfo.add("language", audio.get("language"))
+        nfo.add("channels", audio.get("channels"))
+        nfo.close()
+    for subtitle in streamdetails.get("subtitle", []):
+        nfo.open("subtitle")
+        nfo.add("codec", subtitle.get("codec"))
+        nfo.add("language", subtitle.get("language"))
+        nfo.close()
+    nfo.close()
+    nfo.close()
+
+def render_movie_nfo(metadata, original_filename="", streamdetails=None):
+    """
+    构建电影 NFO 内容，返回 utf-8 编码的 XML 字节串（不写文件，可在子进程中执行）。
+    streamdetails 为 media_probe.probe 的结果（可为 None）。
+    """
+    nfo = _NfoWriter("movie")
+    nfo.add("originalfilename", original_filename)
+    nfo.add("title", metadata.get("title"))
+    nfo.add("originaltitle", metadata.get("original_title"))
+    nfo.add("sorttitle", metadata.get("title")) # 通常与标题相同
+    nfo.add("rating", metadata.get("vote_average"))
+    nfo.add("year", metadata.get("year"))
+    nfo.add("votes", metadata.get("vote_count"))
+    nfo.add("plot", metadata.get("overview"))
+    nfo.add("tagline", metadata.get("tagline"))
+    nfo.add("runtime", metadata.get("runtime"))
+    nfo.add("premiered", metadata.get("release_date"))
+    nfo.add("studio", metadata.get("studio"))
+    nfo.add("country", ", ".join(metadata.get("production_countries", []))) # TMDB API 可能不直接提供国家，需要解析 production_companies
+
+    for genre in metadata.get("genres", []):
+        nfo.add("genre", genre)
+
+    for lang in metadata.get("spoken_languages", []):
+         nfo.add("language", lang) # 添加语言信息
+
+    # 唯一 ID
+    if metadata.get("tmdbid"):
+        nfo.add("uniqueid", str(metadata["tmdbid"]), {"type": "tmdb", "default": "true"})
+    if metadata.get("imdb_id"):
+        nfo.add("uniqueid", metadata["imdb_id"], {"type": "imdb"})
+
+    # 演职员信息
+    for director in metadata.get("directors", []):
+        nfo.add("director", director.get("name"))
+    for writer in metadata.get("writers", []):
+        nfo.add("credits", writer.get("name")) # NFO 通常用 <credits> 表示编剧
+
+    for actor in metadata.get("cast", []):
+        nfo.open("actor")
+        nfo.add("name", actor.get("name"))
+        nfo.add("role", actor.get("character"))
+        # 可以选择性添加演员头像路径（如果需要）
+        nfo.add("tmdbid", actor.get("tmdb_id"))
+        nfo.add("profile_url", actor.get("profile_url"))
+        nfo.add("thumb", actor.get("thumb"))
+        nfo.close()
+
+    # 电影集信息
+    if metadata.get("collection"):
+        nfo.open("set")
+        nfo.add("name", metadata["collection"].get("name"))
+        nfo.add("tmdbcolid", metadata["collection"].get("id")) # 添加 TMDB 集合 ID
+        nfo.close()
+
+    _add_streamdetails(nfo, streamdetails)
+    return nfo.getvalue()
+
+def generate_nfo(metadata, nfo_path, original_filename="", cpu_pool=None, write_stats=None, streamdetails=None):
     """
     为电影生成 NFO 文件。
+    传入 cpu_pool 时在进程池中渲染 XML，当前线程只负责写文件。
     """
     try:
-        root = ET.Element("movie")
-        _add_sub_element(root, "originalfilename", original_filename)
-        _add_sub_element(root, "title", metadata.get("title"))
-        _add_sub_element(root, "originaltitle", metadata.get("original_title"))
-        _add_sub_element(root, "sorttitle", metadata.get("title")) # 通常与标题相同
-        _add_sub_element(root, "rating", metadata.get("vote_average"))
-        _add_sub_element(root, "year", metadata.get("year"))
-        _add_sub_element(root, "votes", metadata.get("vote_count"))
-        _add_sub_element(root, "plot", metadata.get("overview"))
-        _add_sub_element(root, "tagline", metadata.get("tagline"))
-        _add_sub_element(root, "runtime", metadata.get("runtime"))
-        _add_sub_element(root, "premiered", metadata.get("release_date"))
-        _add_sub_element(root, "studio", metadata.get("studio"))
-        _add_sub_element(root, "country", ", ".join(metadata.get("production_countries", []))) # TMDB API 可能不直接提供国家，需要解析 production_companies
-
-        for genre in metadata.get("genres", []):
-            _add_sub_element(root, "genre", genre)
-
-        for lang in metadata.get("spoken_languages", []):
-             _add_sub_element(root, "language", lang) # 添加语言信息
-
-        # 唯一 ID
-        if metadata.get("tmdbid"):
-            uniqueid_tmdb = ET.SubElement(root, "uniqueid", {"type": "tmdb", "default": "true"})
-            uniqueid_tmdb.text = str(metadata["tmdbid"])
-        if metadata.get("imdb_id"):
-            uniqueid_imdb = ET.SubElement(root, "uniqueid", {"type": "imdb"})
-            uniqueid_imdb.text = metadata["imdb_id"]
-
-        # 演职员信息
-        for director in metadata.get("directors", []):
-            _add_sub_element(root, "director", director.get("name"))
-        for writer in metadata.get("writers", []):
-            _add_sub_element(root, "credits", writer.get("name")) # NFO 通常用 <credits> 表示编剧
-
-        for actor in metadata.get("cast", []):
-            actor_elem = ET.SubElement(root, "actor")
-            _add_sub_element(actor_elem, "name", actor.get("name"))
-            _add_sub_element(actor_elem, "role", actor.get("character"))
-            # 可以选择性添加演员头像路径（如果需要）
-            _add_sub_element(actor_elem, "tmdbid", actor.get("tmdb_id"))
-            _add_sub_element(actor_elem, "profile_url", actor.get("profile_url"))
-            _add_sub_element(actor_elem, "thumb", actor.get("thumb"))
-
-        # 电影集信息
-        if metadata.get("collection"):
-            set_elem = ET.SubElement(root, "set")
-            _add_sub_element(set_elem, "name", metadata["collection"].get("name"))
-            _add_sub_element(set_elem, "tmdbcolid", metadata["collection"].get("id")) # 添加 TMDB 集合 ID
-
-        # 写入文件
-        xml_str = _pretty_print_xml(root)
-        with open(nfo_path, "wb") as f: # 以二进制写入 utf-8
-            f.write(xml_str)
-        logger.info(f"成功生成电影 NFO 文件：{nfo_path}")
+        if cpu_pool:
+            xml_str = cpu_pool.render("movie", metadata, original_filename, streamdetails)
+        else:
+            xml_str = render_movie_nfo(metadata, original_filename, streamdetails)
+        # 内容未变化时不覆盖，避免 mtime 变化触发 Jellyfin 重新读取
+        if write_if_changed(nfo_path, xml_str, write_stats):
+            logger.info(f"成功生成电影 NFO 文件：{nfo_path}")
+        else:
+            logger.info(f"电影 NFO 内容未变化，跳过写入：{nfo_path}")
         return True
 
     except Exception as e:
         logger.error(f"生成电影 NFO 文件失败 ({nfo_path}): {e}")
         return False
 
-def generate_tv_nfo(metadata, nfo_path, original_filename=""):
+def render_tv_nfo(metadata, original_filename="", thumb_filename=None, streamdetails=None):
+    """构建单集 NFO 内容，返回 utf-8 编码的 XML 字节串。thumb_filename 由调用方检查文件是否存在后传入。"""
+    nfo = _NfoWriter("episodedetails")
+    nfo.add("originalfilename", original_filename)
+    # --- 使用剧集信息填充 ---
+    nfo.add("showtitle", metadata.get("title")) # 剧集标题
+    # season 和 episode 现在是字符串
+    season_str = metadata.get("season", "00")
+    episode_str = metadata.get("episode", "00")
+    nfo.add("season", season_str)   # 季号 (字符串)
+    nfo.add("episode", episode_str) # 集号 (字符串)
+
+    # TODO: 获取单集标题。目前使用剧集标题 + SxxExx 作为替代
+    # 调整格式化，直接使用字符串
+    episode_title = f"{metadata.get('title', 'Unknown Episode')} S{season_str}E{episode_str}"
+    nfo.add("title", episode_title)
+
+    # TODO: 获取单集剧情。目前使用剧集简介作为替代
+    nfo.add("plot", metadata.get("overview"))
+
+    nfo.add("runtime", metadata.get("runtime")) # 通常是剧集的平均单集时长
+    nfo.add("premiered", metadata.get("release_date")) # 剧集首播日期
+    # TODO: 获取单集播出日期。目前使用剧集首播日期
+    nfo.add("aired", metadata.get("release_date"))
+
+    nfo.add("studio", metadata.get("studio")) # 制片公司/电视台
+    nfo.add("year", metadata.get("year")) # 剧集首播年份
+
+    for genre in metadata.get("genres", []):
+        nfo.add("genre", genre)
+
+    # 评分和票数 (剧集的)
+    nfo.add("rating", metadata.get("vote_average"))
+    nfo.add("votes", metadata.get("vote_count"))
+
+    # 唯一 ID (剧集的)
+    if metadata.get("tmdbid"):
+        nfo.add("uniqueid", str(metadata["tmdbid"]), {"type": "tmdb", "default": "true"})
+    if metadata.get("imdb_id"):
+        nfo.add("uniqueid", metadata["imdb_id"], {"type": "imdb"})
+    # TODO: 获取 TVDB ID (如果 TMDB API 返回了)
+    # if metadata.get("tvdb_id"):
+    #     nfo.add("uniqueid", metadata["tvdb_id"], {"type": "tvdb"})
+
+    # 演职员信息 (剧集的)
+    for director in metadata.get("directors", []):
+        nfo.add("director", director.get("name"))
+    for writer in metadata.get("writers", []):
+        nfo.add("credits", writer.get("name")) # NFO 通常用 <credits> 表示编剧
+
+    for actor in metadata.get("cast", []):
+        nfo.open("actor")
+        nfo.add("name", actor.get("name"))
+        nfo.add("role", actor.get("character"))
+        nfo.add("tmdbid", actor.get("tmdb_id"))
+        nfo.add("profile_url", actor.get("profile_url"))
+        nfo.add("thumb", actor.get("thumb"))
+        nfo.close()
+
+    if thumb_filename:
+        nfo.add("thumb", thumb_filename)
+
+    _add_streamdetails(nfo, streamdetails)
+    return nfo.getvalue()
+
+def generate_tv_nfo(metadata, nfo_path, original_filename="", cpu_pool=None, write_stats=None, streamdetails=None):
     """
     为电视剧集生成 NFO 文件。
     """
     try:
-        root = ET.Element("episodedetails")
-        _add_sub_element(root, "originalfilename", original_filename)
-        # --- 使用剧集信息填充 ---
-        _add_sub_element(root, "showtitle", metadata.get("title")) # 剧集标题
-        # season 和 episode 现在是字符串
-        season_str = metadata.get("season", "00")
-        episode_str = metadata.get("episode", "00")
-        _add_sub_element(root, "season", season_str)   # 季号 (字符串)
-        _add_sub_element(root, "episode", episode_str) # 集号 (字符串)
-
-        # TODO: 获取单集标题。目前使用剧集标题 + SxxExx 作为替代
-        # 调整格式化，直接使用字符串
-        episode_title = f"{metadata.get('title', 'Unknown Episode')} S{season_str}E{episode_str}"
-        _add_sub_element(root, "title", episode_title)
-
-        # TODO: 获取单集剧情。目前使用剧集简介作为替代
-        _add_sub_element(root, "plot", metadata.get("overview"))
-
-        _add_sub_element(root, "runtime", metadata.get("runtime")) # 通常是剧集的平均单集时长
-        _add_sub_element(root, "premiered", metadata.get("release_date")) # 剧集首播日期
-        # TODO: 获取单集播出日期。目前使用剧集首播日期
-        _add_sub_element(root, "aired", metadata.get("release_date"))
-
-        _add_sub_element(root, "studio", metadata.get("studio")) # 制片公司/电视台
-        _add_sub_element(root, "year", metadata.get("year")) # 剧集首播年份
-
-        for genre in metadata.get("genres", []):
-            _add_sub_element(root, "genre", genre)
-
-        # 评分和票数 (剧集的)
-        _add_sub_element(root, "rating", metadata.get("vote_average"))
-        _add_sub_element(root, "votes", metadata.get("vote_count"))
-
-        # 唯一 ID (剧集的)
-        if metadata.get("tmdbid"):
-            uniqueid_tmdb = ET.SubElement(root, "uniqueid", {"type": "tmdb", "default": "true"})
-            uniqueid_tmdb.text = str(metadata["tmdbid"])
-        if metadata.get("imdb_id"):
-            uniqueid_imdb = ET.SubElement(root, "uniqueid", {"type": "imdb"})
-            uniqueid_imdb.text = metadata["imdb_id"]
-        # TODO: 获取 TVDB ID (如果 TMDB API 返回了)
-        # if metadata.get("tvdb_id"):
-        #     uniqueid_tvdb = ET.SubElement(root, "uniqueid", {"type": "tvdb"})
-        #     uniqueid_tvdb.text = metadata["tvdb_id"]
-
-        # 演职员信息 (剧集的)
-        for director in metadata.get("directors", []):
-            _add_sub_element(root, "director", director.get("name"))
-        for writer in metadata.get("writers", []):
-            _add_sub_element(root, "credits", writer.get("name")) # NFO 通常用 <credits> 表示编剧
-
-        for actor in metadata.get("cast", []):
-            actor_elem = ET.SubElement(root, "actor")
-            _add_sub_element(actor_elem, "name", actor.get("name"))
-            _add_sub_element(actor_elem, "role", actor.get("character"))
-            _add_sub_element(actor_elem, "tmdbid", actor.get("tmdb_id"))
-            _add_sub_element(actor_elem, "profile_url", actor.get("profile_url"))
-            _add_sub_element(actor_elem, "thumb", actor.get("thumb"))
-
         base_name_no_ext = os.path.splitext(os.path.basename(nfo_path))[0]
         thumb_filename = base_name_no_ext + "-thumb.jpg"
-        if os.path.exists(os.path.join(os.path.dirname(nfo_path), thumb_filename)):
-            _add_sub_element(root, "thumb", thumb_filename)
-
-        # 写入文件
-        xml_str = _pretty_print_xml(root)
-        with open(nfo_path, "wb") as f: # 以二进制写入 utf-8
-            f.write(xml_str)
-        logger.info(f"成功生成电视剧 NFO 文件：{nfo_path}")
+        if not os.path.exists(os.path.join(os.path.dirname(nfo_path), thumb_filename)):
+            thumb_filename = None
+
+        if cpu_pool:
+            xml_str = cpu_pool.render("episode", metadata, original_filename, thumb_filename, streamdetails)
+        else:
+            xml_str = render_tv_nfo(metadata, original_filename, thumb_filename, streamdetails)
+        # 内容未变化时不覆盖，避免 mtime 变化触发 Jellyfin 重新读取
+        if write_if_changed(nfo_path, xml_str, write_stats):
+            logger.info(f"成功生成电视剧 NFO 文件：{nfo_path}")
+        else:
+            logger.info(f"电视剧 NFO 内容未变化，跳过写入：{nfo_path}")
         return True
 
     except Exception as e:
         logger.error(f"生成电视剧 NFO 文件失败 ({nfo_path}): {e}")
         return False
 
-def generate_tvshow_nfo(metadata, nfo_path):
+def render_tvshow_nfo(metadata):
+    """构建 tvshow.nfo 内容，返回 utf-8 编码的 XML 字节串。"""
+    nfo = _NfoWriter("tvshow")
+    nfo.add("title", metadata.get("title"))
+    nfo.add("originaltitle", metadata.get("original_title"))
+    nfo.add("sorttitle", metadata.get("title"))
+    nfo.add("plot", metadata.get("overview"))
+    nfo.add("studio", metadata.get("studio"))
+    nfo.add("status", metadata.get("status"))
+    nfo.add("year", metadata.get("year"))
+    nfo.add("premiered", metadata.get("release_date"))
+
+    for genre in metadata.get("genres", []):
+        nfo.add("genre", genre)
+
+    for lang in metadata.get("spoken_languages", []):
+        nfo.add("language", lang)
+
+    nfo.add("rating", metadata.get("vote_average"))
+    nfo.add("votes", metadata.get("vote_count"))
+
+    if metadata.get("tmdbid"):
+        nfo.add("uniqueid", str(metadata["tmdbid"]), {"type": "tmdb", "default": "true"})
+    if metadata.get("imdb_id"):
+        nfo.add("uniqueid", metadata["imdb_id"], {"type": "imdb"})
+
+    for director in metadata.get("directors", []):
+        nfo.add("director", director.get("name"))
+
+    for actor in metadata.get("cast", [])[:20]:
+        nfo.open("actor")
+        nfo.add("name", actor.get("name"))
+        nfo.add("role", actor.get("character"))
+        nfo.add("tmdbid", actor.get("tmdb_id"))
+        nfo.add("profile_url", actor.get("profile_url"))
+        nfo.add("thumb", actor.get("thumb"))
+        nfo.close()
+
+    return nfo.getvalue()
+
+def generate_tvshow_nfo(metadata, nfo_path, cpu_pool=None, write_stats=None):
     """
     为整部剧集生成 tvshow.nfo 文件，包含剧名、简介、导演、演员等。
     """
     try:
-        root = ET.Element("tvshow")
-        _add_sub_element(root, "title", metadata.get("title"))
-        _add_sub_element(root, "originaltitle", metadata.get("original_title"))
-        _add_sub_element(root, "sorttitle", metadata.get("title"))
-        _add_sub_element(root, "plot", metadata.get("overview"))
-        _add_sub_element(root, "studio", metadata.get("studio"))
-        _add_sub_element(root, "status", metadata.get("status"))
-        _add_sub_element(root, "year", metadata.get("year"))
-        _add_sub_element(root, "premiered", metadata.get("release_date"))
-
-        for genre in metadata.get("genres", []):
-            _add_sub_element(root, "genre", genre)
-
-        for lang in metadata.get("spoken_languages", []):
-            _add_sub_element(root, "language", lang)
-
-        _add_sub_element(root, "rating", metadata.get("vote_average"))
-        _add_sub_element(root, "votes", metadata.get("vote_count"))
-
-        if metadata.get("tmdbid"):
-            uniqueid_tmdb = ET.SubElement(root, "uniqueid", {"type": "tmdb", "default": "true"})
-            uniqueid_tmdb.text = str(metadata["tmdbid"])
-        if metadata.get("imdb_id"):
-            uniqueid_imdb = ET.SubElement(root, "uniqueid", {"type": "imdb"})
-            uniqueid_imdb.text = metadata["imdb_id"]
-
-        for director in metadata.get("directors", []):
-            _add_sub_element(root, "director", director.get("name"))
-
-        for actor in metadata.get("cast", [])[:20]:
-            actor_elem = ET.SubElement(root, "actor")
-            _add_sub_element(actor_elem, "name", actor.get("name"))
-            _add_sub_element(actor_elem, "role", actor.get("character"))
-            _add_sub_element(actor_elem, "tmdbid", actor.get("tmdb_id"))
-            _add_sub_element(actor_elem, "profile_url", actor.get("profile_url"))
-            _add_sub_element(actor_elem, "thumb", actor.get("thumb"))
-
-        # 写入文件
-        xml_str = _pretty_print_xml(root)
-        with open(nfo_path, "wb") as f:
-            f.write(xml_str)
-        logger.info(f"成功生成 tvshow.nfo 文件：{nfo_path}")
+        if cpu_pool:
+            xml_str = cpu_pool.render("tvshow", metadata)
+        else:
+            xml_str = render_tvshow_nfo(metadata)
+        # 内容未变化时不覆盖，避免 mtime 变化触发 Jellyfin 重新读取
+        if write_if_changed(nfo_path, xml_str, write_stats):
+            logger.info(f"成功生成 tvshow.nfo 文件：{nfo_path}")
+        else:
+            logger.info(f"tvshow.nfo 内容未变化，跳过写入：{nfo_path}")
         return True
 
     except Exception as e:
@@ -0,0 +1,191 @@
+"""
+离线批量重建 NFO：遍历配置的目标库，把每个媒体文件映射回本地缓存的 TMDB 元数据，
+重新渲染 NFO（内容未变化的不会覆盖），全程不访问网络。
+
+    python refresh_nfo.py                               # 所有启用的配置
+    python refresh_nfo.py --config 电影 --threads 16 --processes 4
+"""
+from common_imports import *
+import argparse
+import html
+import sys
+import threading
+import time
+
+from config_store import load_config, media_suffixes
+from cpu_pool import CpuPool
+from media_probe import probe as probe_media
+from metadata_fetcher import merge_episode_metadata
+from metadata_record import MetadataRecord
+from metadata_store import get_store
+from nfo_generator import generate_nfo, generate_tv_nfo, generate_tvshow_nfo
+from write_guard import WriteStats
+
+logger = logging.getLogger(__name__)
+
+_ROOT_KINDS = {"movie": "movie", "episodedetails": "episode", "tvshow": "tvshow"}
+_ROOT_RE = re.compile(r"<(movie|episodedetails|tvshow)[\s>/]")
+_TMDB_ID_RE = re.compile(r'<uniqueid type="tmdb"[^>]*>\s*(\d+)\s*</uniqueid>')
+_TAG_RE = {tag: re.compile(rf"<{tag}>([^<]*)</{tag}>") for tag in ("season", "episode", "originalfilename")}
+
+
+def _read_nfo_keys(nfo_path):
+    """
+    数据库里没有映射记录时（例如旧版本生成的 NFO），从现有 NFO 中读出类型、TMDB ID、季/集号。
+    """
+    try:
+        with open(nfo_path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return None
+    root = _ROOT_RE.search(text)
+    tmdb_id = _TMDB_ID_RE.search(text)
+    if not root or not tmdb_id:
+        return None
+    kind = _ROOT_KINDS[root.group(1)]
+    row = {
+        "kind": kind,
+        "media_type": "movie" if kind == "movie" else "tv_show",
+        "tmdbid": int(tmdb_id.group(1)),
+    }
+    for tag, pattern in _TAG_RE.items():
+        m = pattern.search(text)
+        row["original_filename" if tag == "originalfilename" else tag] = html.unescape(m.group(1)) if m else None
+    return row
+
+
+def collect_targets(configs, store):
+    """
+    遍历各配置的目标路径，返回 [(nfo_path, row 或 None, 媒体文件路径或 None)]。
+    row 优先取自 library 表（按目标路径一次性批量读取），其次解析已有 NFO。
+    媒体文件路径只用于读取流信息，配置关闭 probe_streams 时为 None（与处理时一样不写 streamdetails）。
+    """
+    targets = []
+    for cfg in configs:
+        suffixes = media_suffixes(cfg)
+        probe_streams = cfg.get("probe_streams", True)
+        for mapping in cfg.get("paths", []):
+            target = mapping.get("target")
+            if not target or not os.path.isdir(target):
+                continue
+            known = store.library_under(target)
+            for root, _, files in os.walk(target):
+                nfo_paths = [(os.path.join(root, os.path.splitext(f)[0] + ".nfo"), os.path.join(root, f))
+                             for f in files if os.path.splitext(f)[1].lower() in suffixes]
+                if "tvshow.nfo" in files:
+                    nfo_paths.append((os.path.join(root, "tvshow.nfo"), None))
+                for nfo_path, media_path in nfo_paths:
+                    nfo_path = os.path.abspath(nfo_path)
+                    row = known.get(nfo_path)
+                    if row is None and os.path.exists(nfo_path):
+                        row = _read_nfo_keys(nfo_path)
+                    targets.append((nfo_path, row, media_path if probe_streams else None))
+    return targets
+
+
+class _MetadataCache:
+    """本次重建中按 (media_type, tmdbid) 复用已解码的元数据（只读记录），同一部剧的各集只读库一次。"""
+
+    def __init__(self, store):
+        self._store = store
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, media_type, tmdbid):
+        key = (media_type, tmdbid)
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+        metadata = self._store.load_metadata(media_type, tmdbid)
+        if metadata:
+            metadata = MetadataRecord.from_dict(metadata).show
+        with self._lock:
+            self._items[key] = metadata
+        return metadata
+
+
+def refresh_one(nfo_path, row, cache, store, cpu_pool=None, write_stats=None, media_path=None):
+    """重建单个 NFO，返回 "ok" / "uncached" / "failed"。media_path 不为空时重新读取流信息。"""
+    metadata = cache.get(row["media_type"], row["tmdbid"])
+    if not metadata:
+        return "uncached"
+    kind = row["kind"]
+    streamdetails = probe_media(media_path) if media_path else None
+    if kind == "movie":
+        ok = generate_nfo(metadata, nfo_path, original_filename=row.get("original_filename") or "",
+                          cpu_pool=cpu_pool, write_stats=write_stats, streamdetails=streamdetails)
+    elif kind == "episode":
+        metadata = metadata.with_episode(row.get("season"), row.get("episode"))
+        episode_info = store.load_episode(row["tmdbid"], row.get("season"), row.get("episode"))
+        if episode_info:
+            metadata = merge_episode_metadata(metadata, episode_info)
+        ok = generate_tv_nfo(metadata, nfo_path, original_filename=row.get("original_filename") or "",
+                             cpu_pool=cpu_pool, write_stats=write_stats, streamdetails=streamdetails)
+    else:
+        ok = generate_tvshow_nfo(metadata, nfo_path, cpu_pool=cpu_pool, write_stats=write_stats)
+    return "ok" if ok else "failed"
+
+
+def refresh_library(configs, threads=8, processes=0):
+    """
+    重建给定配置目标库中的所有 NFO，返回统计信息字典。
+    processes > 0 时 NFO 渲染放到进程池中执行。
+    """
+    start = time.time()
+    store = get_store()
+    targets = collect_targets(configs, store)
+    cache = _MetadataCache(store)
+    write_stats = WriteStats()
+    counts = {"ok": 0, "uncached": 0, "failed": 0, "unmapped": 0}
+
+    cpu_pool = CpuPool(processes) if processes > 0 else None
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as exe:
+            futures = []
+            for nfo_path, row, media_path in targets:
+                if row is None:
+                    counts["unmapped"] += 1
+                    continue
+                futures.append(exe.submit(refresh_one, nfo_path, row, cache, store, cpu_pool, write_stats,
+                                          media_path))
+            for fut in as_completed(futures):
+                try:
+                    counts[fut.result()] += 1
+                except Exception as e:
+                    logger.error(f"重建 NFO 出错：{e}")
+                    counts["failed"] += 1
+    finally:
+        if cpu_pool:
+            cpu_pool.shutdown()
+
+    summary = dict(counts, total=len(targets), elapsed=round(time.time() - start, 2), **write_stats.as_dict())
+    logger.info(f"NFO 离线重建完成：{summary}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", help="只处理指定名称的配置，可重复；默认所有启用的配置")
+    parser.add_argument("--threads", type=int, default=8, help="并发线程数")
+    parser.add_argument("--processes", type=int, default=0, help="NFO 渲染进程数，0 表示在线程内渲染")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每个文件的日志")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    configs = load_config()
+    if args.config:
+        configs = [c for c in configs if c.get("name") in args.config]
+    else:
+        configs = [c for c in configs if c.get("enabled", True)]
+    if not configs:
+        print("没有匹配的配置")
+        return 1
+
+    summary = refresh_library(configs, threads=args.threads, processes=args.processes)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+from common_imports import *
+import copy
+
+logger = logging.getLogger(__name__)
+
+# 全局设置（与 config.json 中按媒体库划分的配置不同），缺省项取 DEFAULTS
+SETTINGS_FILE = os.path.join("configs", "settings.json")
+
+DEFAULTS = {
+    "logging": {
+        "level": "INFO", # 根日志级别，可用环境变量 LOG_LEVEL 覆盖
+        "levels": { # 按模块（logger 名称）单独设置级别
+            "apscheduler": "INFO",
+            "urllib3": "WARNING",
+        },
+        "rotation": "size", # size：按大小轮转；time：按时间轮转
+        "max_bytes": 10 * 1024 * 1024,
+        "when": "midnight", # rotation=time 时的轮转时间点，取值同 TimedRotatingFileHandler
+        "backup_count": 7,
+        # 批量处理时逐文件日志（INFO 及以下）的限流方式：all 全部输出 / rate 每秒最多 per_file_rate 条 / sample 每 sample_every 条输出 1 条
+        "per_file_mode": "rate",
+        "per_file_rate": 20,
+        "sample_every": 10,
+        "per_file_loggers": ["movie_processor", "metadata_fetcher", "nfo_generator", "write_guard", "stats_index"],
+    },
+    "cache": {
+        "metadata_max_bytes": 64 * 1024 * 1024, # 内存中 TMDB 元数据缓存的近似容量上限（字节）
+        "metadata_ttl_days": 30, # configs/metadata.db 中的元数据多少天内直接复用，不再请求 TMDB
+        "image_cache": True, # 下载过的图片保存到 configs/image_cache，其他文件 / 实例可直接复用
+        "image_max_bytes": 2 * 1024 * 1024 * 1024, # 图片缓存容量上限（字节），超出后删除最久未用的
+        "shared_url": "", # 共享缓存服务地址（另一个实例的地址，如 http://nas1:5001），留空则不使用
+        "shared_token": "", # 共享缓存的访问令牌：作为服务端时要求请求携带，作为客户端时随请求发送
+        "shared_timeout": 2, # 访问共享缓存的超时（秒），失败后暂停使用一段时间，直接请求 TMDB
+    },
+    "cluster": {
+        # 多节点处理同一媒体库：各节点把 store 指向共享挂载上的同一个文件（如 /mnt/media/.mediatool/cluster.db），
+        # 留空则为单机模式
+        "store": "",
+        "node_id": "", # 节点名称，缺省为主机名
+        "lease_seconds": 120, # 文件租约时长，节点崩溃后超过该时间其未完成的文件由其他节点接手
+        "heartbeat_seconds": 15, # 节点心跳与续租间隔
+        "vnodes": 64, # 一致性哈希中每个节点的虚拟节点数
+    },
+    "concurrency": {
+        # 配置启用 adaptive_threads 时的并发控制参数（见 concurrency.py）
+        "window_files": 16, # 每处理这么多个文件（或经过 window_seconds 秒）评估一次
+        "window_seconds": 30,
+        "tmdb_error_rate": 0.05, # 窗口内 TMDB 错误率超过该值时减小并发
+        "disk_latency": 0.5, # 磁盘操作平均耗时（秒）超过该值时减小并发
+        "latency_factor": 2.0, # 单文件耗时超过平滑值的倍数时减小并发
+        "decrease_factor": 0.7, # 减小时乘以该系数
+    },
+    "ingest": {
+        # POST /ingest（下载工具完成回调，立即处理指定路径）的访问令牌，请求头 X-Ingest-Token；留空则不启用该接口
+        "token": "",
+        "wait_seconds": 600, # 接口等待处理完成的最长时间，超时后返回任务 ID，可在 /jobs/<任务ID> 查看
+    },
+    "queue": {
+        # 执行进程内所有任务共用的文件处理队列（见 work_queue.py）
+        "workers": 16, # 工作线程总数；各配置同时处理的文件数另受其 max_threads 限制
+        "bulk_share": 0.25, # 有手动任务或新文件时，重新扫描已处理文件最多占用的线程比例
+    },
+    "artwork": {
+        # 同一文件的 poster / fanart / clearlogo 并发下载的线程数（进程内共享）；
+        # 下载哪些图片、取哪种尺寸、带宽上限按配置设置（见 artwork.py）
+        "download_workers": 8,
+    },
+}
+
+# 环境变量覆盖：变量名 -> (分组, 键)
+_ENV_OVERRIDES = {
+    "LOG_LEVEL": ("logging", "level"),
+    "LOG_ROTATION": ("logging", "rotation"),
+    "LOG_PER_FILE_MODE": ("logging", "per_file_mode"),
+    "METADATA_CACHE_MAX_BYTES": ("cache", "metadata_max_bytes"),
+    "SHARED_CACHE_URL": ("cache", "shared_url"),
+    "SHARED_CACHE_TOKEN": ("cache", "shared_token"),
+    "CLUSTER_STORE": ("cluster", "store"),
+    "CLUSTER_NODE_ID": ("cluster", "node_id"),
+    "QUEUE_WORKERS": ("queue", "workers"),
+    "INGEST_TOKEN": ("ingest", "token"),
+}
+
+
+def _merge(base, override):
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_settings(path=SETTINGS_FILE):
+    """读取全局设置：DEFAULTS <- settings.json <- 环境变量。文件不存在或格式错误时使用默认值。"""
+    settings = copy.deepcopy(DEFAULTS)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                _merge(settings, data)
+        except Exception as e:
+            logger.error(f"加载全局设置出错：{e}")
+    for env, (section, key) in _ENV_OVERRIDES.items():
+        if os.environ.get(env):
+            settings[section][key] = os.environ[env]
+    return settings
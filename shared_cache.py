@@ -0,0 +1,139 @@
+"""
+共享缓存：多个实例（如每台 NAS 一个）共用一份 TMDB 元数据和图片。
+
+任一实例都可以作为共享缓存服务（见 app.py 的 /cache/shared 接口，数据取自它自己的 configs/metadata.db
+和图片缓存）；其他实例在全局设置 cache.shared_url 中填写它的地址后：
+- 本地缓存未命中时先查询共享缓存，查到则保存到本地，不再请求 TMDB
+- 自己从 TMDB 取到的结果回写到共享缓存，供其他实例使用
+共享缓存不可用时（超时、连接失败）暂停使用 RETRY_AFTER 秒，期间直接请求 TMDB，不影响处理。
+"""
+from common_imports import *
+import threading
+import time
+from urllib.parse import quote
+
+from image_cache import cache_key
+from metadata_store import get_store
+from settings import load_settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Cache-Token"
+RETRY_AFTER = 60
+
+SHARED_REQUESTS = metrics.counter("mediatool_shared_cache_requests_total", "共享缓存请求数（按类型、结果）",
+                                  ("kind", "result"))
+
+
+class SharedCacheClient:
+    def __init__(self, base_url, token="", timeout=2):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = float(timeout)
+        self._session = requests.Session()
+        if token:
+            self._session.headers[TOKEN_HEADER] = token
+        self._down_until = 0
+        self._lock = threading.Lock()
+
+    def _available(self):
+        return time.time() >= self._down_until
+
+    def _failed(self, kind, error):
+        with self._lock:
+            if self._available():
+                logger.warning(f"共享缓存不可用（{error}），{RETRY_AFTER} 秒内直接请求 TMDB")
+            self._down_until = time.time() + RETRY_AFTER
+        SHARED_REQUESTS.inc(kind=kind, result="error")
+
+    def _get(self, kind, path, **params):
+        """GET 请求，返回响应（命中）或 None（未命中 / 不可用）。"""
+        if not self._available():
+            return None
+        try:
+            resp = self._session.get(self.base_url + path, params=params, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self._failed(kind, e)
+            return None
+        if resp.status_code == 404:
+            SHARED_REQUESTS.inc(kind=kind, result="miss")
+            return None
+        if resp.status_code != 200:
+            self._failed(kind, f"HTTP {resp.status_code}")
+            return None
+        SHARED_REQUESTS.inc(kind=kind, result="hit")
+        return resp
+
+    def find_metadata(self, media_type, title, year):
+        resp = self._get("metadata", "/cache/shared/search", media_type=media_type, title=title, year=year or "")
+        return resp.json() if resp is not None else None
+
+    def load_episode(self, tmdbid, season, episode):
+        resp = self._get("episode", f"/cache/shared/episode/{int(tmdbid)}/{quote(str(season))}/{quote(str(episode))}")
+        return resp.json() if resp is not None else None
+
+    def image(self, url):
+        """共享缓存中的图片内容（bytes），没有时返回 None。"""
+        key = cache_key(url)
+        if not key:
+            return None
+        resp = self._get("image", f"/cache/shared/image/{quote(key)}")
+        return resp.content if resp is not None else None
+
+    def publish(self, kind, **data):
+        """把从 TMDB 取到的结果回写到共享缓存（失败忽略）。"""
+        if not self._available():
+            return
+        try:
+            resp = self._session.post(self.base_url + "/cache/shared", json=dict(data, kind=kind), timeout=self.timeout)
+            SHARED_REQUESTS.inc(kind=f"publish_{kind}", result="ok" if resp.ok else str(resp.status_code))
+        except requests.exceptions.RequestException as e:
+            self._failed(f"publish_{kind}", e)
+
+
+_client = None
+_client_loaded = False
+_client_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """按全局设置 cache.shared_url 创建的客户端；未配置时返回 None。"""
+    global _client, _client_loaded
+    if not _client_loaded:
+        with _client_lock:
+            if not _client_loaded:
+                cfg = load_settings()["cache"]
+                if cfg.get("shared_url"):
+                    _client = SharedCacheClient(cfg["shared_url"], cfg.get("shared_token", ""),
+                                                cfg.get("shared_timeout", 2))
+                    logger.info(f"使用共享缓存：{cfg['shared_url']}")
+                _client_loaded = True
+    return _client
+
+
+# --- 服务端（app.py 的 /cache/shared 接口调用） ---
+def serve_metadata(media_type, title, year):
+    return get_store().find_metadata(media_type, title, year)
+
+
+def serve_episode(tmdbid, season, episode):
+    return get_store().load_episode(tmdbid, season, episode)
+
+
+def accept_publish(data):
+    """保存其他实例回写的结果，格式错误时抛出 ValueError。"""
+    store = get_store()
+    kind = data.get("kind")
+    if kind == "metadata":
+        metadata = data.get("metadata")
+        if not isinstance(metadata, dict) or not metadata.get("tmdbid"):
+            raise ValueError("缺少 metadata.tmdbid")
+        store.save_metadata(metadata)
+        store.save_search(data.get("media_type") or metadata.get("media_type", "movie"),
+                          data.get("title"), data.get("year"), metadata["tmdbid"])
+    elif kind == "episode":
+        if not data.get("tmdbid") or not isinstance(data.get("info"), dict):
+            raise ValueError("缺少 tmdbid 或 info")
+        store.save_episode(data["tmdbid"], data.get("season"), data.get("episode"), data["info"])
+    else:
+        raise ValueError(f"未知的类型：{kind}")
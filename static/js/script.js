@@ -99,9 +99,22 @@ function editConfig(name){
       $('#cfg-suffixes').val(cfg.file_suffixes);
       $('#cfg-rename').val(cfg.rename_rule);
       $('#cfg-interval').val(cfg.schedule_interval || 0);
+      $('#cfg-cron').val(cfg.schedule_cron || '');
+      $('#cfg-jitter').val(cfg.schedule_jitter ?? 60);
+      $('#cfg-cpu-workers').val(cfg.cpu_workers || 0);
+      $('#cfg-adaptive-threads').prop('checked', !!cfg.adaptive_threads);
+      $('#cfg-min-threads').val(cfg.min_threads || 1);
+      $('#cfg-adaptive-max-threads').val(cfg.adaptive_max_threads || 16);
+      $('#cfg-link-mode').val(cfg.link_mode || 'hardlink');
+      $('#cfg-duplicates').val(cfg.duplicates || 'skip');
+      const artworkTypes = cfg.artwork_types || ['poster', 'fanart', 'clearlogo', 'thumb'];
+      $('.cfg-artwork-type').each(function(){ $(this).prop('checked', artworkTypes.includes(this.value)); });
+      $('#cfg-artwork-size').val(cfg.artwork_size || 'default');
+      $('#cfg-artwork-bandwidth').val(cfg.artwork_bandwidth || 0);
       $('#path-mappings').empty();
       $('#cfg-enable-scrape').prop('checked', cfg.scrape_metadata !== false);
       $('#cfg-enable-rename').prop('checked', cfg.rename_file !== false);
+      $('#cfg-probe-streams').prop('checked', cfg.probe_streams !== false);
       cfg.paths.forEach(p=> addPath(p.source,p.target));
       $('#cfg-enable-scrape').trigger('change'); // 联动同步状态
     });
@@ -116,8 +129,20 @@ function saveConfig(e){
   const suffixes = $('#cfg-suffixes').val().trim();
   const rename_rule = $('#cfg-rename').val().trim();
   const schedule_interval = parseInt($('#cfg-interval').val(),10) || 0;
+  const schedule_cron = $('#cfg-cron').val().trim();
+  const schedule_jitter = parseInt($('#cfg-jitter').val(),10) || 0;
+  const cpu_workers = parseInt($('#cfg-cpu-workers').val(),10) || 0;
+  const adaptive_threads = $('#cfg-adaptive-threads').prop('checked');
+  const min_threads = parseInt($('#cfg-min-threads').val(),10) || 1;
+  const adaptive_max_threads = parseInt($('#cfg-adaptive-max-threads').val(),10) || 16;
+  const link_mode = $('#cfg-link-mode').val();
+  const duplicates = $('#cfg-duplicates').val();
+  const artwork_types = $('.cfg-artwork-type:checked').map(function(){ return this.value; }).get();
+  const artwork_size = $('#cfg-artwork-size').val();
+  const artwork_bandwidth = parseInt($('#cfg-artwork-bandwidth').val(),10) || 0;
   const scrape_metadata =  $('#cfg-enable-scrape').prop('checked');
   const rename_file = $('#cfg-enable-rename').prop('checked');
+  const probe_streams = $('#cfg-probe-streams').prop('checked');
   const paths = [];
   $('#path-mappings .form-row').each(function(){
     const src = $(this).find('input').eq(0).val().trim();
@@ -129,15 +154,16 @@ function saveConfig(e){
     // 在发送的数据中包含 file_type
     body: JSON.stringify({
       name, file_type, tmdb_api_key: tmdb_api_key, file_suffixes: suffixes, 
-      paths, rename_rule, schedule_interval,
-      scrape_metadata,rename_file})
+      paths, rename_rule, schedule_interval, schedule_cron, schedule_jitter, cpu_workers, link_mode, duplicates,
+      adaptive_threads, min_threads, adaptive_max_threads, artwork_types, artwork_size, artwork_bandwidth,
+      scrape_metadata,rename_file,probe_streams})
   })
-  .then(r=>r.json())
-  .then(j=>{
+  .then(r=>r.json().then(j=>{
     alert(j.message);
+    if (!r.ok) return; // 定时设置无效等校验失败时保留编辑面板
     closeEditor();
     location.reload();
-  });
+  }));
 }
 
 function runSingleConfig(name) {
@@ -149,6 +175,7 @@ function runSingleConfig(name) {
   $('#success-count').text('0');
   $('#failed-count').text('0');
   $('#error-details').empty();
+  $('#error-categories').text('');
   $('#error-list').hide();
   $('#complete-message').hide().removeClass('alert-danger alert-success alert-warning');
 
@@ -158,10 +185,9 @@ function runSingleConfig(name) {
       if (!response.ok) return response.json().then(e => { throw new Error(e.message || '执行失败'); });
       return response.json();
     })
-    .then(() => {
+    .then(j => {
       $('#progress-text').text('任务已启动，正在获取进度...');
-      // 开始轮询进度（可复用你已有的轮询逻辑）
-      startProgressPolling();
+      startProgressStream(j.job_id);
     })
     .catch(error => {
       const msgDiv = $('#complete-message');
@@ -177,12 +203,12 @@ function runSingleConfig(name) {
 // 启动任务并监控进度
 $('#btn-run').click(()=>{
   // 重置进度显示
-  let startTime = Date.now();
   $('#progress-bar').css('width','0%').text('0%');
   $('#progress-text').text('等待开始，正在检查TMDB连通性...'); // 初始状态
   $('#success-count').text('0');
   $('#failed-count').text('0');
   $('#error-details').empty();
+  $('#error-categories').text('');
   $('#error-list').hide();
   $('#complete-message').hide().removeClass('alert-danger alert-success alert-warning'); // 清除旧样式
 
@@ -195,78 +221,12 @@ $('#btn-run').click(()=>{
         return response.json().then(err => { throw new Error(err.message || `任务启动失败，状态码: ${response.status}`); });
       }
       // 如果状态码是 202，表示任务已接受并开始在后台运行
-      return response.json(); // 继续处理正常的启动消息（虽然我们这里不直接用它）
+      return response.json(); // 启动消息中包含任务 ID
     })
-    .then(()=>{ // <--- 只有在 fetch 成功 (状态码 202) 时才执行
-      // 任务已成功启动，开始轮询进度
+    .then(j=>{ // <--- 只有在 fetch 成功 (状态码 202) 时才执行
+      // 任务已成功启动，开始接收该任务的进度
       $('#progress-text').text('任务已启动，正在获取进度...'); // 更新状态
-      let lastProcessed = -1; // 初始化为 -1 确保第一次更新能显示
-      // 每秒刷新一次进度
-      const timer = setInterval(()=>{
-        fetch('/progress').then(r=>r.json()).then(p=>{
-          if(p.processed >= lastProcessed) {
-            const pct = p.total>0 ? Math.floor(p.processed*100/p.total) : 0;
-            $('#progress-bar').css('width',pct+'%').text(pct+'%');
-            $('#progress-text').text(`${p.processed} / ${p.total}`);
-            const elapsedMs = Date.now() - startTime;
-            const elapsedSec = Math.floor(elapsedMs / 1000);
-            const hours = String(Math.floor(elapsedSec / 3600)).padStart(2, '0');
-            const minutes = String(Math.floor((elapsedSec % 3600) / 60)).padStart(2, '0');
-            const seconds = String(elapsedSec % 60).padStart(2, '0');
-            $('#elapsed-time').text(`耗时：${hours}:${minutes}:${seconds}`);
-            $('#success-count').text(p.success || 0);
-            $('#failed-count').text(p.failed || 0);
-
-            // 显示错误详情
-            if(p.errors && p.errors.length > 0) {
-              const errorList = $('#error-details');
-              // 优化：只添加新的错误，避免重复渲染 (如果需要)
-              // 这里简单起见，每次都清空重填
-              errorList.empty();
-              p.errors.forEach(error => {
-                const configName = error.config_name ? `[${error.config_name}] ` : '';
-                errorList.append(`
-                  <li class="mb-2">
-                    <strong>${configName}${error.file}</strong><br>
-                    <code>${error.message}</code>
-                  </li>
-                `);
-              });
-              
-              $('#error-list').show();
-            } else {
-              $('#error-list').hide(); // 没有错误时隐藏列表
-            }
-
-            lastProcessed = p.processed;
-          }
-
-          if(p.completed || (p.processed >= p.total && p.total > 0 && p.total !== 0)){ // 确保 total 不为 0
-            clearInterval(timer);
-            // 显示完成消息
-            const failed = p.failed || 0;
-            const msgDiv = $('#complete-message');
-            const logPath = p.log_path || '/logs/media_manager.log'; // 使用后端提供的日志路径
-
-            if(failed === 0 && (!p.errors || p.errors.length === 0)){ // 确保没有错误记录
-              msgDiv.removeClass('alert-warning alert-danger').addClass('alert-success')
-                   .html('✅ 任务完成！所有文件处理成功。');
-            } else {
-              msgDiv.removeClass('alert-success alert-danger').addClass('alert-warning')
-                   .html(`⚠️ 任务完成！${failed}个文件处理失败。<br>
-                         详细错误信息已保存至日志。<br>日志路径: <code class="bg-light p-1">${logPath}</code>`);
-            }
-            msgDiv.show();
-          }
-        }).catch(progressError => { // <--- 处理 /progress 请求本身的错误
-            console.error("获取进度失败:", progressError);
-            clearInterval(timer); // 停止轮询
-            const msgDiv = $('#complete-message');
-            msgDiv.removeClass('alert-success alert-warning').addClass('alert-danger')
-                 .html(`❌ 获取任务进度时出错: ${progressError.message}`)
-                 .show();
-        });
-      }, 1000);
+      startProgressStream(j.job_id);
     })
     .catch(error => { // <--- 捕获 /run_task 的错误 (包括我们抛出的 Error)
       console.error("启动任务失败:", error);
@@ -312,72 +272,152 @@ $(document).ready(function () {
   loadStats(); // 页面加载时自动加载
 });
 
-function startProgressPolling() {
-  let startTime = Date.now();
-  let lastProcessed = -1;
+// ---- 进度展示（SSE 与轮询共用） ----
+function formatElapsed(startTime) {
+  return formatSeconds(Math.floor((Date.now() - startTime) / 1000));
+}
+
+function formatSeconds(elapsedSec) {
+  const hours = String(Math.floor(elapsedSec / 3600)).padStart(2, '0');
+  const minutes = String(Math.floor((elapsedSec % 3600) / 60)).padStart(2, '0');
+  const seconds = String(elapsedSec % 60).padStart(2, '0');
+  return `${hours}:${minutes}:${seconds}`;
+}
+
+function renderProgress(p, startTime) {
+  const pct = p.total > 0 ? Math.floor(p.processed * 100 / p.total) : 0;
+  $('#progress-bar').css('width', pct + '%').text(pct + '%');
+  $('#progress-text').text(`${p.processed} / ${p.total}`);
+  $('#elapsed-time').text(`耗时：${formatElapsed(startTime)}`);
+  $('#success-count').text(p.success || 0);
+  $('#failed-count').text(p.failed || 0);
+  if (p.throughput) {
+    const eta = p.eta_seconds != null ? `，预计剩余：${formatSeconds(p.eta_seconds)}` : '';
+    $('#rate-text').text(`速度：${p.throughput} 个/秒${eta}`);
+  }
+  renderErrorCategories(p);
+}
+
+// 错误分类（与 job_registry.ERROR_CATEGORIES 对应）；列表只保留最近 ERROR_LIST_LIMIT 条，完整明细见 /jobs/<id>/errors
+const ERROR_CATEGORY_LABELS = {
+  parse: '文件名解析', metadata: '元数据', tmdb: 'TMDB', filesystem: '文件系统', path: '路径', job: '任务', other: '其他'
+};
+const ERROR_LIST_LIMIT = 200;
+
+function renderErrorCategories(p) {
+  const categories = p.error_categories || {};
+  const parts = Object.keys(categories).sort((a, b) => categories[b] - categories[a])
+    .map(c => `${ERROR_CATEGORY_LABELS[c] || c} ${categories[c]}`);
+  if (parts.length === 0) return;
+  const shown = $('#error-details').children().length;
+  const more = p.error_count > shown ? `（共 ${p.error_count} 条，下面列出最近 ${shown} 条）` : '';
+  $('#error-categories').text(`按分类：${parts.join('，')}${more}`);
+  $('#error-list').show();
+}
+
+function appendErrors(errors) {
+  if (!errors || errors.length === 0) return;
+  const errorList = $('#error-details');
+  errors.forEach(error => {
+    const configName = error.config_name ? `[${error.config_name}] ` : '';
+    errorList.append(`
+      <li class="mb-2">
+        <strong>${configName}${error.file}</strong><br>
+        <code>${error.message}</code>
+      </li>
+    `);
+  });
+  const extra = errorList.children().length - ERROR_LIST_LIMIT;
+  if (extra > 0) errorList.children().slice(0, extra).remove();
+  $('#error-list').show();
+}
+
+function isProgressDone(p) {
+  return p.completed || (p.processed >= p.total && p.total > 0);
+}
+
+function showComplete(p) {
+  const failed = p.failed || 0;
+  const msgDiv = $('#complete-message');
+  const logPath = p.log_path || '/logs/media_manager.log'; // 使用后端提供的日志路径
+
+  if (failed === 0 && $('#error-details').children().length === 0) { // 确保没有错误记录
+    msgDiv.removeClass('alert-warning alert-danger').addClass('alert-success')
+         .html('✅ 任务完成！所有文件处理成功。');
+  } else {
+    msgDiv.removeClass('alert-success alert-danger').addClass('alert-warning')
+         .html(`⚠️ 任务完成！${failed}个文件处理失败。<br>
+               详细错误信息已保存至日志。<br>日志路径: <code class="bg-light p-1">${logPath}</code>`);
+  }
+  const ws = p.write_stats || {};
+  msgDiv.append(`<br><small>NFO/图片写入 ${ws.written || 0} 个，内容未变化跳过 ${ws.skipped || 0} 个</small>`);
+  if (ws.bytes_saved) {
+    msgDiv.append(`<br><small>图片尺寸策略少下载 ${(ws.bytes_saved / 1048576).toFixed(1)} MB</small>`);
+  }
+  msgDiv.show();
+}
+
+function showProgressError(err) {
+  console.error("获取进度失败:", err);
+  $('#complete-message').removeClass('alert-success alert-warning').addClass('alert-danger')
+    .html(`❌ 获取任务进度时出错: ${err.message}`)
+    .show();
+}
+
+// 优先使用 SSE（/progress/stream）接收指定任务的增量进度；浏览器不支持或连接建立失败时退回轮询
+function startProgressStream(jobId) {
+  $('#rate-text').text('');
+  if (!window.EventSource) {
+    startProgressPolling(jobId);
+    return;
+  }
+  const startTime = Date.now();
+  const state = {};
+  let received = false;
+  const source = new EventSource(`/progress/stream?job=${encodeURIComponent(jobId)}`);
+
+  source.addEventListener('progress', e => {
+    received = true;
+    Object.assign(state, JSON.parse(e.data));
+    renderProgress(state, startTime);
+    if (isProgressDone(state)) {
+      source.close();
+      showComplete(state);
+    }
+  });
+  source.addEventListener('errors', e => {
+    received = true;
+    appendErrors(JSON.parse(e.data));
+  });
+  source.onerror = () => {
+    // 从未收到过事件（例如被代理拦截）时改用轮询；否则交给 EventSource 自动重连
+    if (!received) {
+      source.close();
+      startProgressPolling(jobId);
+    }
+  };
+}
+
+function startProgressPolling(jobId) {
+  const startTime = Date.now();
 
   const timer = setInterval(() => {
-    fetch('/progress')
+    fetch(`/progress?job=${encodeURIComponent(jobId || '')}`)
       .then(r => r.json())
       .then(p => {
-        if (p.processed >= lastProcessed) {
-          const pct = p.total > 0 ? Math.floor(p.processed * 100 / p.total) : 0;
-          $('#progress-bar').css('width', pct + '%').text(pct + '%');
-          $('#progress-text').text(`${p.processed} / ${p.total}`);
-          const elapsedMs = Date.now() - startTime;
-          const elapsedSec = Math.floor(elapsedMs / 1000);
-          const hours = String(Math.floor(elapsedSec / 3600)).padStart(2, '0');
-          const minutes = String(Math.floor((elapsedSec % 3600) / 60)).padStart(2, '0');
-          const seconds = String(elapsedSec % 60).padStart(2, '0');
-          $('#elapsed-time').text(`耗时：${hours}:${minutes}:${seconds}`);
-          $('#success-count').text(p.success || 0);
-          $('#failed-count').text(p.failed || 0);
-
-          // 错误列表
-          if (p.errors && p.errors.length > 0) {
-            const errorList = $('#error-details');
-            errorList.empty();
-            p.errors.forEach(error => {
-              const configName = error.config_name ? `[${error.config_name}] ` : '';
-              errorList.append(`
-                <li class="mb-2">
-                  <strong>${configName}${error.file}</strong><br>
-                  <code>${error.message}</code>
-                </li>
-              `);
-            });
-            $('#error-list').show();
-          } else {
-            $('#error-list').hide();
-          }
-
-          lastProcessed = p.processed;
-        }
+        $('#error-details').empty();
+        $('#error-list').hide();
+        appendErrors(p.errors);
+        renderProgress(p, startTime);
 
-        if (p.completed || (p.processed >= p.total && p.total > 0)) {
+        if (isProgressDone(p)) {
           clearInterval(timer);
-          const failed = p.failed || 0;
-          const msgDiv = $('#complete-message');
-          const logPath = p.log_path || '/logs/media_manager.log';
-
-          if (failed === 0 && (!p.errors || p.errors.length === 0)) {
-            msgDiv.removeClass('alert-warning alert-danger').addClass('alert-success')
-              .html('任务完成，所有文件处理成功。');
-          } else {
-            msgDiv.removeClass('alert-success alert-danger').addClass('alert-warning')
-              .html(`任务完成，有 ${failed} 个失败。<br>日志路径: <code>${logPath}</code>`);
-          }
-          msgDiv.show();
+          showComplete(p);
         }
       })
       .catch(progressError => {
-        console.error("进度获取失败:", progressError);
         clearInterval(timer);
-        const msgDiv = $('#complete-message');
-        msgDiv.removeClass('alert-success alert-warning').addClass('alert-danger')
-          .html(`获取任务进度失败：${progressError.message}`)
-          .show();
+        showProgressError(progressError);
       });
   }, 1000);
 }
-
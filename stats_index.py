@@ -0,0 +1,175 @@
+from common_imports import *
+import threading
+import time
+
+from config_store import media_suffixes
+from db_utils import open_db
+from filename_parser import parse_filename
+
+logger = logging.getLogger(__name__)
+
+STATS_DB = os.path.join("configs", "stats.db")
+MEDIA_TYPES = ("movie", "tv_show", "unknown")
+
+_SCHEMA = """
+-- 目标库中的每个媒体文件
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    config_name TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+-- 按配置、媒体类型汇总的数量与字节数，随 files 的增删同步维护
+CREATE TABLE IF NOT EXISTS totals (
+    config_name TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    PRIMARY KEY (config_name, media_type)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def classify(filename):
+    """按目标文件名判断媒体类型（与原 /stats 逐个解析文件名的结果一致）。"""
+    try:
+        media_type = parse_filename(filename).get("type", "unknown")
+    except Exception:
+        return "unknown"
+    return media_type if media_type in MEDIA_TYPES else "unknown"
+
+
+class StatsIndex:
+    """
+    媒体库统计索引（SQLite）。处理流程在链接 / 重命名文件时增量更新，
+    /stats 直接读取汇总表；reconcile 全量扫描目标路径，纠正处理流程之外的增删。
+    """
+
+    def __init__(self, path=STATS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+
+    def _adjust(self, config_name, media_type, count, size):
+        self._conn.execute(
+            "INSERT INTO totals (config_name, media_type, count, bytes) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (config_name, media_type) DO UPDATE SET count = count + excluded.count, "
+            "bytes = bytes + excluded.bytes", (config_name, media_type, count, size))
+
+    def _remove_locked(self, path):
+        row = self._conn.execute("SELECT config_name, media_type, size FROM files WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._adjust(row[0], row[1], -1, -row[2])
+
+    def add_file(self, path, config_name, media_type=None, size=None):
+        """登记（或更新）目标库中的一个文件，media_type / size 缺省时按文件名解析、读取文件大小。"""
+        path = os.path.abspath(path)
+        if media_type is None:
+            media_type = classify(os.path.basename(path))
+        if size is None:
+            size = os.path.getsize(path)
+        with self._lock:
+            self._remove_locked(path)
+            self._conn.execute(
+                "INSERT INTO files (path, config_name, media_type, size, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (path, config_name, media_type, size, time.time()))
+            self._adjust(config_name, media_type, 1, size)
+            self._conn.commit()
+
+    def move_file(self, old_path, new_path, config_name):
+        """文件被重命名：新文件名可能对应不同的媒体类型，按新文件名重新分类。"""
+        new_path = os.path.abspath(new_path)
+        media_type = classify(os.path.basename(new_path))
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM files WHERE path = ?", (os.path.abspath(old_path),)).fetchone()
+            self._remove_locked(os.path.abspath(old_path))
+            self._remove_locked(new_path)
+            size = row[0] if row else os.path.getsize(new_path)
+            self._conn.execute(
+                "INSERT INTO files (path, config_name, media_type, size, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (new_path, config_name, media_type, size, time.time()))
+            self._adjust(config_name, media_type, 1, size)
+            self._conn.commit()
+
+    def summary(self):
+        """
+        返回与原 /stats 相同结构的统计：{"movie": n, "tv_show": n, "unknown": n, "size": {...}}，
+        另附 by_config（按配置拆分）和 reconciled_at（上次全量校对时间，从未校对过为 None）。
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT config_name, media_type, count, bytes FROM totals").fetchall()
+            reconciled = self._conn.execute("SELECT value FROM meta WHERE key = 'reconciled_at'").fetchone()
+        stats = {t: 0 for t in MEDIA_TYPES}
+        stats["size"] = {t: 0 for t in MEDIA_TYPES}
+        by_config = {}
+        for config_name, media_type, count, size in rows:
+            if count <= 0:
+                continue
+            stats[media_type] = stats.get(media_type, 0) + count
+            stats["size"][media_type] = stats["size"].get(media_type, 0) + size
+            by_config.setdefault(config_name, {})[media_type] = {"count": count, "size": size}
+        stats["by_config"] = by_config
+        stats["reconciled_at"] = float(reconciled[0]) if reconciled else None
+        return stats
+
+    def reconcile(self, configs):
+        """
+        全量扫描所有配置的目标路径，用扫描结果整体替换索引。返回扫描到的文件数。
+        多个配置共用同一目标路径时，文件只计入第一个配置。
+        """
+        start = time.time()
+        files = {}
+        for cfg in configs:
+            config_name = cfg.get("name", "未命名配置")
+            suffixes = media_suffixes(cfg)
+            for mapping in cfg.get("paths", []):
+                target = mapping.get("target")
+                if not target or not os.path.exists(target):
+                    continue
+                for root, _, names in os.walk(target):
+                    for name in names:
+                        if os.path.splitext(name)[1].lower() not in suffixes:
+                            continue
+                        path = os.path.abspath(os.path.join(root, name))
+                        if path in files:
+                            continue
+                        try:
+                            files[path] = (config_name, classify(name), os.path.getsize(path))
+                        except OSError as e:
+                            logger.warning(f"统计目标路径时读取文件 {path} 出错：{e}")
+
+        now = time.time()
+        with self._lock:
+            # 扫描期间处理流程新登记的文件（updated_at >= start）以处理流程的记录为准
+            self._conn.execute("DELETE FROM files WHERE updated_at < ?", (start,))
+            self._conn.execute("DELETE FROM totals")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO files (path, config_name, media_type, size, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(path, c, t, s, now) for path, (c, t, s) in files.items()])
+            self._conn.execute(
+                "INSERT INTO totals (config_name, media_type, count, bytes) "
+                "SELECT config_name, media_type, COUNT(*), SUM(size) FROM files GROUP BY config_name, media_type")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconciled_at', ?)", (str(now),))
+            self._conn.commit()
+        logger.info(f"统计索引校对完成：{len(files)} 个文件，耗时 {time.time() - start:.1f} 秒")
+        return len(files)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_stats_index():
+    """进程内共享的 StatsIndex 实例（首次使用时创建）。"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = StatsIndex()
+    return _index
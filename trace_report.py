@@ -0,0 +1,120 @@
+"""
+汇总 tracing 写出的追踪记录（JSONL）和性能采样（pstats）：各阶段耗时分布、最慢的文件、最耗时的函数。
+
+    python trace_report.py logs/traces/<任务ID>.jsonl
+    python trace_report.py logs/traces/<任务ID>.jsonl --top 30 --profile logs/profiles/<任务ID>.pstats
+"""
+from common_imports import *
+import argparse
+import pstats
+import sys
+
+
+def load_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    return spans
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(spans, top=20):
+    """返回 {"stages": [...], "slowest_files": [...], "files": 文件数, "errors": 出错 span 数}。"""
+    by_stage = {}
+    files = []
+    errors = 0
+    for s in spans:
+        if s.get("error"):
+            errors += 1
+        if s["stage"] == "file":
+            files.append(s)
+            continue
+        by_stage.setdefault(s["stage"], []).append(s)
+
+    wall_total = sum(f["duration"] for f in files) or 1
+    stages = []
+    for stage, items in by_stage.items():
+        durations = sorted(i["duration"] for i in items)
+        total = sum(durations)
+        stages.append({
+            "stage": stage,
+            "count": len(items),
+            "total": round(total, 3),
+            "share": round(total / wall_total * 100, 1), # 占所有文件总耗时的百分比
+            "mean": round(total / len(items), 4),
+            "p50": round(_percentile(durations, 0.5), 4),
+            "p95": round(_percentile(durations, 0.95), 4),
+            "max": round(durations[-1], 4),
+            "bytes": sum(i.get("bytes", 0) for i in items),
+            "http_calls": sum(i.get("http_calls", 0) for i in items),
+        })
+    stages.sort(key=lambda x: x["total"], reverse=True)
+
+    # 每个文件耗时最多的阶段，便于一眼看出慢在哪里
+    worst_stage = {}
+    for stage, items in by_stage.items():
+        for i in items:
+            current = worst_stage.get(i["file"])
+            if current is None or i["duration"] > current[1]:
+                worst_stage[i["file"]] = (stage, i["duration"])
+    slowest = sorted(files, key=lambda f: f["duration"], reverse=True)[:top]
+    slowest_files = [{
+        "file": f["file"],
+        "duration": round(f["duration"], 3),
+        "slowest_stage": worst_stage.get(f["file"], ("", 0))[0],
+        "http_calls": f.get("http_calls", 0),
+        "bytes": f.get("bytes", 0),
+        "error": f.get("error"),
+    } for f in slowest]
+    return {"files": len(files), "errors": errors, "stages": stages, "slowest_files": slowest_files}
+
+
+def print_summary(summary):
+    print(f"文件数：{summary['files']}，出错的阶段 / 文件：{summary['errors']}")
+    print()
+    print(f"{'阶段':<10}{'次数':>8}{'总耗时(s)':>12}{'占比%':>8}{'平均':>10}{'p50':>10}{'p95':>10}{'最大':>10}{'HTTP':>8}{'字节':>14}")
+    for s in summary["stages"]:
+        print(f"{s['stage']:<10}{s['count']:>8}{s['total']:>12}{s['share']:>8}{s['mean']:>10}{s['p50']:>10}"
+              f"{s['p95']:>10}{s['max']:>10}{s['http_calls']:>8}{s['bytes']:>14}")
+    print()
+    print("最慢的文件：")
+    for f in summary["slowest_files"]:
+        note = f"  出错：{f['error']}" if f["error"] else ""
+        print(f"  {f['duration']:>9.3f}s  [{f['slowest_stage'] or '-'}]  HTTP {f['http_calls']}  {f['file']}{note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces", nargs="*", help="追踪记录文件（JSONL），可多个")
+    parser.add_argument("--top", type=int, default=20, help="列出最慢的文件 / 函数数量")
+    parser.add_argument("--profile", help="性能采样文件（pstats），按累计耗时列出最耗时的函数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出追踪汇总")
+    args = parser.parse_args(argv)
+    if not args.traces and not args.profile:
+        parser.error("至少需要一个追踪记录文件或 --profile")
+
+    if args.traces:
+        summary = summarize(load_spans(args.traces), top=args.top)
+        if args.json:
+            print(json.dumps(summary, ensure_ascii=False, indent=2))
+        else:
+            print_summary(summary)
+
+    if args.profile:
+        print()
+        pstats.Stats(args.profile, stream=sys.stdout).sort_stats("cumulative").print_stats(args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+按文件的阶段追踪（JSONL）与整次运行的 cProfile 采样，用于排查慢运行。
+
+- Tracer：process_single_file 的每个阶段写一行
+  {"run", "file", "stage", "start", "duration", "bytes", "http_calls", "error"}，
+  每个文件结束时再写一行 stage="file" 的汇总
+- RunProfiler：主线程和线程池各工作线程分别采样，结束时合并成一个 pstats 文件
+
+两者都是按任务开启的（见 /run_task、/run_config 的 trace / profile 参数），未开启时 span() 几乎没有开销。
+汇总报告见 trace_report.py。
+"""
+from common_imports import *
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR = os.path.join("logs", "traces")
+PROFILE_DIR = os.path.join("logs", "profiles")
+
+_local = threading.local()
+
+
+def trace_path(run_id):
+    return os.path.join(TRACE_DIR, f"{run_id}.jsonl")
+
+
+def profile_path(run_id):
+    return os.path.join(PROFILE_DIR, f"{run_id}.pstats")
+
+
+class Tracer:
+    """把 span 追加写入 JSONL 文件（多个工作线程共用，写入加锁）。"""
+
+    def __init__(self, path, run=""):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.run = run
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        line = json.dumps(dict(record, run=self.run), ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        logger.info(f"追踪记录已写入：{self.path}")
+
+
+@contextmanager
+def trace_file(tracer, file_path):
+    """在当前线程开始追踪一个文件，期间的 span() 都归属于该文件。tracer 为 None 时不做任何事。"""
+    if tracer is None:
+        yield
+        return
+    ctx = {"tracer": tracer, "file": file_path, "bytes": 0, "http_calls": 0}
+    _local.ctx = ctx
+    start, t0 = time.time(), time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        _local.ctx = None
+        tracer.write({"file": file_path, "stage": "file", "start": round(start, 6),
+                      "duration": round(time.perf_counter() - t0, 6),
+                      "bytes": ctx["bytes"], "http_calls": ctx["http_calls"], "error": error})
+
+
+@contextmanager
+def span(stage):
+    """记录当前文件的一个阶段；当前线程没有在追踪文件时直接执行。"""
+    ctx = getattr(_local, "ctx", None)
+    if ctx is None:
+        yield
+        return
+    bytes_before, http_before = ctx["bytes"], ctx["http_calls"]
+    start, t0 = time.time(), time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        ctx["tracer"].write({"file": ctx["file"], "stage": stage, "start": round(start, 6),
+                             "duration": round(time.perf_counter() - t0, 6),
+                             "bytes": ctx["bytes"] - bytes_before,
+                             "http_calls": ctx["http_calls"] - http_before, "error": error})
+
+
+def bind(fn):
+    """返回在其他线程（如图片下载线程池）中执行时仍归属于当前追踪文件的 fn。"""
+    ctx = getattr(_local, "ctx", None)
+    if ctx is None:
+        return fn
+
+    def run(*args, **kwargs):
+        _local.ctx = ctx
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.ctx = None
+    return run
+
+
+def add_bytes(size):
+    """把写入 / 下载的字节数计入当前文件（未追踪时忽略）。"""
+    ctx = getattr(_local, "ctx", None)
+    if ctx is not None:
+        ctx["bytes"] += size
+
+
+def add_http_call():
+    ctx = getattr(_local, "ctx", None)
+    if ctx is not None:
+        ctx["http_calls"] += 1
+
+
+class RunProfiler:
+    """
+    整次运行的 cProfile 采样。cProfile 只采样调用 enable() 的线程，
+    所以线程池中的任务通过 wrap() 在各自线程里启用一个 Profile，结束时合并。
+    """
+
+    def __init__(self):
+        import cProfile # 只在开启采样时导入
+        self._new_profile = cProfile.Profile
+        self._main = cProfile.Profile()
+        self._profiles = [self._main]
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._main.enable()
+
+    def _thread_profile(self):
+        prof = getattr(_local, "profile", None)
+        if prof is None or prof[0] is not self:
+            profile = self._new_profile()
+            with self._lock:
+                self._profiles.append(profile)
+            _local.profile = prof = (self, profile)
+        return prof[1]
+
+    def wrap(self, func):
+        """返回在当前工作线程中带采样执行 func 的包装函数。"""
+        def wrapper(*args, **kwargs):
+            profile = self._thread_profile()
+            try:
+                profile.enable()
+            except ValueError: # Python 3.12+ 的 cProfile 对所有线程生效，主线程已在采样
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        return wrapper
+
+    def stop(self, path):
+        """停止采样并把所有线程的结果合并写入 path（pstats 格式）。"""
+        import pstats
+        self._main.disable()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        stats = None
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError: # 从未启用过的 Profile 没有数据
+                continue
+        if stats is not None:
+            stats.dump_stats(path)
+            logger.info(f"性能采样已写入：{path}")
+        return path
@@ -0,0 +1,207 @@
+"""
+执行进程内所有任务共用的文件处理队列：各配置的 process_movies 把文件提交到同一组工作线程，
+按优先级而不是提交顺序处理，同一优先级内先提交先处理：
+    interactive  手动触发的任务（网页上的「执行」、cli.py）中的文件
+    new          定时任务中新发现的文件（不在 processed.txt 中，如刚下载完成的剧集）
+    bulk         定时任务重新扫描到的已处理文件
+有更高优先级的文件在排队或处理时，bulk 最多占用 bulk_share 比例的线程，其余让给前两者。
+每个配置同时处理的文件数仍不超过其 max_threads（启用 adaptive_threads 时为自适应并发的当前值）。
+
+手动任务要等同一配置正在运行的定时任务结束时，该定时任务剩余的文件提升为 interactive，尽快让出配置。
+各优先级从提交到开始处理的等待时间见指标 mediatool_queue_wait_seconds，每次运行结束时也会写日志。
+"""
+from common_imports import *
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from settings import load_settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "new", "bulk")
+INTERACTIVE, NEW, BULK = range(len(PRIORITIES))
+
+QUEUE_DEPTH = metrics.gauge("mediatool_queue_depth", "共享处理队列中排队的文件数（按优先级）", ("priority",))
+QUEUE_ACTIVE = metrics.gauge("mediatool_queue_active", "共享处理队列中正在处理的文件数（按优先级）", ("priority",))
+QUEUE_WAIT = metrics.histogram("mediatool_queue_wait_seconds", "文件从提交到开始处理的等待时间（秒，按优先级）",
+                               ("priority",), buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600))
+
+
+def file_priority(scheduled, processed):
+    """手动任务中的文件为 interactive；定时任务中未处理过的为 new，已处理过的为 bulk。"""
+    if not scheduled:
+        return INTERACTIVE
+    return BULK if processed else NEW
+
+
+class Lane:
+    """一次 process_movies 运行在队列中的通道，由 WorkQueue.lane() 创建。"""
+
+    def __init__(self, queue, name, capacity):
+        self.queue = queue
+        self.name = name
+        self.capacity = capacity # 同时处理的文件数上限：整数，或返回整数的函数（自适应并发）
+        self.floor = None # boost 之后的优先级，之后提交的文件也不低于它
+        self.active = 0
+        self.outstanding = 0 # 已提交、尚未处理完的文件数
+        self.waits = {} # 优先级 -> [文件数, 总等待秒数, 最长等待秒数]
+        self._heap = []
+
+    def limit(self):
+        return max(1, int(self.capacity() if callable(self.capacity) else self.capacity))
+
+    def submit(self, priority, fn, *args):
+        """提交一个文件的处理函数，返回 concurrent.futures.Future。"""
+        return self.queue._submit(self, priority, fn, args)
+
+    def wait_summary(self):
+        """本次运行各优先级的排队等待时间，如「new 12 个，平均 0.3s，最长 2.1s」。"""
+        parts = []
+        for priority in sorted(self.waits):
+            count, total, longest = self.waits[priority]
+            parts.append(f"{PRIORITIES[priority]} {count} 个，平均 {total / count:.1f}s，最长 {longest:.1f}s")
+        return "；".join(parts)
+
+
+class WorkQueue:
+    """
+    优先级队列 + 固定数量的工作线程。每个通道一个堆，工作线程每次从未达到上限的通道中
+    取 (优先级, 提交序号) 最小的文件；通道数量即同时运行的任务数，很少，逐个比较即可。
+    """
+
+    def __init__(self, workers=16, bulk_share=0.25):
+        self.workers = max(1, int(workers))
+        self.bulk_slots = max(1, int(self.workers * float(bulk_share)))
+        self._cond = threading.Condition()
+        self._lanes = []
+        self._seq = itertools.count()
+        self._depth = [0] * len(PRIORITIES)
+        self._active = [0] * len(PRIORITIES)
+        self._started = False
+
+    @contextmanager
+    def lane(self, name, capacity):
+        """with queue.lane(配置名, 并发上限) as lane: lane.submit(...)；退出时等待提交的文件全部处理完。"""
+        lane = Lane(self, name, capacity)
+        with self._cond:
+            self._lanes.append(lane)
+        try:
+            yield lane
+        finally:
+            with self._cond:
+                while lane.outstanding:
+                    self._cond.wait()
+                self._lanes.remove(lane)
+
+    def boost(self, name, priority=INTERACTIVE):
+        """把配置 name 正在运行的通道中排队的文件提升到 priority，返回提升的文件数。"""
+        boosted = 0
+        with self._cond:
+            for lane in self._lanes:
+                if lane.name != name:
+                    continue
+                lane.floor = priority if lane.floor is None else min(lane.floor, priority)
+                for task in lane._heap:
+                    if task[0] > priority:
+                        self._set_depth(task[0], -1)
+                        self._set_depth(priority, 1)
+                        task[0] = priority
+                        boosted += 1
+                heapq.heapify(lane._heap)
+            if boosted:
+                self._cond.notify_all()
+        if boosted:
+            logger.info(f"[配置:{name}] 排队中的 {boosted} 个文件提升为 {PRIORITIES[priority]}")
+        return boosted
+
+    def _set_depth(self, priority, delta):
+        self._depth[priority] += delta
+        QUEUE_DEPTH.set(self._depth[priority], priority=PRIORITIES[priority])
+
+    def _set_active(self, priority, delta):
+        self._active[priority] += delta
+        QUEUE_ACTIVE.set(self._active[priority], priority=PRIORITIES[priority])
+
+    def _submit(self, lane, priority, fn, args):
+        future = Future()
+        with self._cond:
+            if not self._started:
+                self._start_workers()
+            if lane.floor is not None:
+                priority = min(priority, lane.floor)
+            # 列表而不是元组：boost 需要原地修改优先级；序号唯一，比较不会落到后面的元素
+            heapq.heappush(lane._heap, [priority, next(self._seq), time.monotonic(), fn, args, future])
+            lane.outstanding += 1
+            self._set_depth(priority, 1)
+            self._cond.notify()
+        return future
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"work-queue-{i}", daemon=True).start()
+        self._started = True
+
+    def _next(self):
+        """在锁内调用：取出下一个可以处理的文件，没有时返回 None。"""
+        best = None
+        for lane in self._lanes:
+            if lane._heap and lane.active < lane.limit() and (best is None or lane._heap[0][:2] < best._heap[0][:2]):
+                best = lane
+        if best is None:
+            return None
+        priority = best._heap[0][0]
+        if (priority == BULK and self._active[BULK] >= self.bulk_slots
+                and any(self._depth[p] or self._active[p] for p in range(BULK))):
+            return None # 有更高优先级的文件时 bulk 退让
+        task = heapq.heappop(best._heap)
+        best.active += 1
+        self._set_depth(priority, -1)
+        self._set_active(priority, 1)
+        return best, task
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                picked = self._next()
+                while picked is None:
+                    self._cond.wait()
+                    picked = self._next()
+            lane, (priority, _, queued_at, fn, args, future) = picked
+            waited = time.monotonic() - queued_at
+            QUEUE_WAIT.observe(waited, priority=PRIORITIES[priority])
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            with self._cond:
+                stats = lane.waits.setdefault(priority, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += waited
+                stats[2] = max(stats[2], waited)
+                lane.active -= 1
+                lane.outstanding -= 1
+                self._set_active(priority, -1)
+                self._cond.notify_all()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_work_queue():
+    """进程内共享的 WorkQueue 实例（首次使用时按全局设置 queue 分组创建）。"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                settings = load_settings()["queue"]
+                _queue = WorkQueue(settings.get("workers", 16), settings.get("bulk_share", 0.25))
+    return _queue
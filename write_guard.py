@@ -0,0 +1,79 @@
+from common_imports import *
+import threading
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class WriteStats:
+    """
+    统计一次运行中实际写入 / 因内容未变化而跳过的文件数（线程安全）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+        self.bytes_written = 0
+
+    def record(self, written, size=0):
+        with self._lock:
+            if written:
+                self.written += 1
+                self.bytes_written += size
+            else:
+                self.skipped += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {"written": self.written, "skipped": self.skipped, "bytes_written": self.bytes_written}
+
+
+def _temp_path(path):
+    return f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+
+
+def atomic_write_chunks(path, chunks):
+    """
+    把 chunks 写到同目录临时文件，完成后 os.replace 覆盖目标。
+    中途失败不会留下半截文件，Jellyfin 也不会读到写了一半的内容。返回写入字节数。
+    """
+    tmp_path = _temp_path(path)
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def write_if_changed(path, data, write_stats=None):
+    """
+    内容与已有文件完全相同时跳过写入（保留 mtime，避免 Jellyfin 重新扫描），
+    否则原子写入。返回是否实际写入。
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    if write_stats:
+                        write_stats.record(False)
+                    return False
+    except FileNotFoundError:
+        pass
+
+    atomic_write_chunks(path, (data,))
+    tracing.add_bytes(len(data))
+    if write_stats:
+        write_stats.record(True, len(data))
+    return True